@@ -1,12 +1,106 @@
-from django.contrib import admin
+from functools import partial
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.db import transaction
 
 from bank import models
+from bank.caching import invalidate_account_lists_of_viewers
+from bank.pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # no COUNT(*) over the whole table on every page, and no second one for "x results (y total)"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(models.Account)
+class AccountAdmin(LargeTableAdmin):
+    list_display = ('name', 'iban', 'holder_name', 'holder_type', 'balance', 'is_default_for_currency',
+                    'is_frozen', 'is_reserve', 'created_on')
+    list_filter = ('currency', 'is_reserve', 'is_frozen', 'holder_type')
+    search_fields = ('=iban', 'name', '^holder_name')
+    autocomplete_fields = ('individual_holder', 'corporate_holder')
+    readonly_fields = ('holder_name', 'holder_type')
+    ordering = ('-created_on',)
+    actions = ('freeze_accounts', 'unfreeze_accounts')
+
+    def set_frozen(self, request, queryset, frozen: bool):
+        with transaction.atomic():
+            ibans = list(queryset.exclude(is_frozen=frozen).values_list('pk', flat=True))
+            models.Account.objects.filter(pk__in=ibans).update(is_frozen=frozen)
+            transaction.on_commit(partial(invalidate_account_lists_of_viewers, ibans))
+
+        self.message_user(request, f"{'Froze' if frozen else 'Unfroze'} {len(ibans)} bank account(s).",
+                          messages.SUCCESS)
+
+    @admin.action(description="Freeze selected bank accounts")
+    def freeze_accounts(self, request, queryset):
+        self.set_frozen(request, queryset, True)
+
+    @admin.action(description="Unfreeze selected bank accounts")
+    def unfreeze_accounts(self, request, queryset):
+        self.set_frozen(request, queryset, False)
+
+
+@admin.register(models.Transaction)
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'created_on', 'from_account', 'to_account', 'amount', 'state', 'authorized_by')
+    list_select_related = ('from_account', 'to_account', 'authorized_by')
+    # both are covered by bank_transaction_currency_idx, and created_on lets PostgreSQL skip partitions
+    list_filter = ('state', 'amount_currency', 'created_on')
+    search_fields = ('=id',)
+    # saving a transaction applies it to the balances again, they only change through the revoke action
+    readonly_fields = ('id', 'from_account', 'to_account', 'amount', 'purpose', 'state', 'authorized_by',
+                       'created_on', 'updated_on')
+    ordering = ('-created_on',)
+    actions = ('revoke',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Revoke selected transactions and refund them")
+    def revoke(self, request, queryset):
+        ibans = models.revoke_transactions(queryset)
+        transaction.on_commit(partial(invalidate_account_lists_of_viewers, ibans))
+        self.message_user(request, f"Revoked the selected transactions, {len(ibans)} bank account(s) were "
+                                   f"refunded or charged.", messages.SUCCESS)
+
+
+@admin.register(models.Corporation)
+class CorporationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'abbreviation', 'owner', 'nation', 'is_public_viewable', 'created_on')
+    list_select_related = ('owner',)
+    list_filter = ('nation', 'is_public_viewable')
+    search_fields = ('name', 'abbreviation')
+    autocomplete_fields = ('owner',)
+
+
+@admin.register(models.Employee)
+class EmployeeAdmin(admin.ModelAdmin):
+    list_display = ('person', 'corporation', 'employed_since')
+    list_select_related = ('person', 'corporation')
+    search_fields = ('person__username', 'corporation__name')
+    autocomplete_fields = ('person', 'corporation')
+
+
+@admin.register(models.EmployeeInvitation)
+class EmployeeInvitationAdmin(admin.ModelAdmin):
+    list_display = ('potential_employee', 'corporation')
+    list_select_related = ('potential_employee', 'corporation')
+    autocomplete_fields = ('potential_employee', 'corporation')
+
+
+@admin.register(models.FeaturedCorporation)
+class FeaturedCorporationAdmin(admin.ModelAdmin):
+    list_display = ('corporation', 'featured_since')
+    list_select_related = ('corporation',)
+    autocomplete_fields = ('corporation',)
+
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Account)
-admin.site.register(models.Transaction)
-admin.site.register(models.Corporation)
-admin.site.register(models.Employee)
-admin.site.register(models.EmployeeInvitation)
-admin.site.register(models.FeaturedCorporation)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from bank.api.v1 import async_views
+
+urlpatterns = [
+    path('accounts/<int:discord_id>/', async_views.accounts_per_discord_user),
+    path('discord_user/<int:discord_id>/', async_views.user_account_from_discord_user),
+    path('send/', async_views.transaction_create),
+    path('default_account/', async_views.default_bank_account),
+    path('currencies/', async_views.currencies),
+]
@@ -0,0 +1,193 @@
+"""
+Async variants of the endpoints the Democraciv Discord Bot calls the most. They only run natively when served
+through the ASGI application in democraciv_web/asgi.py, under WSGI Django runs them in a one-off event loop.
+
+Database work happens in sync_to_async() threads, the transfer path keeps its transaction.atomic() block.
+"""
+
+import json
+import functools
+
+from asgiref.sync import sync_to_async
+from django import http
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+from guardian.shortcuts import get_objects_for_user
+from rest_framework import authentication, exceptions, status
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from bank import models
+from . import serializers
+from .views import get_currencies
+
+AUTHENTICATION_CLASSES = (authentication.TokenAuthentication, authentication.BasicAuthentication)
+
+
+def database_sync_to_async(func=None, *, thread_sensitive=False):
+    """Run `func` in a worker thread with a fresh database connection, like a WSGI request would.
+
+    Reads run in parallel worker threads, writes should pass `thread_sensitive=True`."""
+
+    if func is None:
+        return functools.partial(database_sync_to_async, thread_sensitive=thread_sensitive)
+
+    def inner(*args, **kwargs):
+        close_old_connections()
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(functools.wraps(func)(inner), thread_sensitive=thread_sensitive)
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return http.JsonResponse(data, status=status_code, encoder=JSONEncoder, safe=False)
+
+
+@database_sync_to_async
+def authenticate_admin(request):
+    drf_request = Request(request)
+
+    for authentication_class in AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(drf_request)
+        except exceptions.AuthenticationFailed:
+            return None
+
+        if result is not None:
+            user = result[0]
+            return user if user.is_active and user.is_staff else None
+
+    return None
+
+
+def admin_required(view):
+    @functools.wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if await authenticate_admin(request) is None:
+            return json_response({'detail': 'You do not have permission to perform this action.'},
+                                 status.HTTP_403_FORBIDDEN)
+
+        return await view(request, *args, **kwargs)
+
+    return wrapped
+
+
+@database_sync_to_async
+def serialize_accounts_per_discord_user(discord_id):
+    user = get_user_model().objects.filter(discord_id=discord_id).first()
+
+    if user is None:
+        return None
+
+    accounts = list(get_objects_for_user(user, 'bank.view_account'))
+    serializers.prefetch_nested(accounts=accounts)
+    return serializers.AccountSerializer(accounts, many=True).data
+
+
+@admin_required
+async def accounts_per_discord_user(request, discord_id):
+    data = await serialize_accounts_per_discord_user(discord_id)
+
+    if data is None:
+        return json_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+    return json_response(data)
+
+
+@database_sync_to_async
+def serialize_discord_user(discord_id):
+    user = get_user_model().objects.filter(discord_id=discord_id).first()
+    return serializers.UserSerializer(user).data if user else None
+
+
+@admin_required
+async def user_account_from_discord_user(request, discord_id):
+    data = await serialize_discord_user(discord_id)
+
+    if data is None:
+        return json_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+    return json_response(data)
+
+
+@database_sync_to_async
+def serialize_default_account(discord_id, corp_id, currency):
+    if discord_id:
+        holder = get_user_model().objects.filter(discord_id=discord_id).first()
+        lookup = {'individual_holder': holder}
+    else:
+        holder = models.Corporation.objects.filter(pk=corp_id, is_public_viewable=True).first()
+        lookup = {'corporate_holder': holder}
+
+    if holder is None:
+        return status.HTTP_404_NOT_FOUND, {'detail': 'Not found.'}
+
+    try:
+        account = models.Account.objects.get(is_default_for_currency=True, currency=currency, **lookup)
+    except models.Account.DoesNotExist:
+        return status.HTTP_400_BAD_REQUEST, {'error': 'No default account for currency'}
+
+    return status.HTTP_200_OK, serializers.AccountSerializer(account).data
+
+
+@admin_required
+async def default_bank_account(request):
+    try:
+        discord_id = int(request.GET.get('discord_id', 0))
+    except ValueError:
+        return json_response({}, status.HTTP_400_BAD_REQUEST)
+
+    corp_id = request.GET.get('corporation', "")
+
+    if not discord_id and not corp_id:
+        return json_response({}, status.HTTP_400_BAD_REQUEST)
+
+    status_code, data = await serialize_default_account(discord_id, corp_id, request.GET.get('currency'))
+    return json_response(data, status_code)
+
+
+async def currencies(request):
+    result = await database_sync_to_async(get_currencies)()
+    return json_response({"result": result})
+
+
+@database_sync_to_async(thread_sensitive=True)
+def create_transaction(data):
+    user = get_user_model().objects.filter(discord_id=data.get('discord_id')).first()
+
+    if user is None:
+        return status.HTTP_404_NOT_FOUND, {'detail': 'Not found.'}
+
+    serializer = serializers.WriteTransactionSerializer(data=data)
+
+    if not serializer.is_valid():
+        return status.HTTP_400_BAD_REQUEST, serializer.errors
+
+    serializer.save(authorized_by=user)
+    serializers.prefetch_nested(transactions=[serializer.instance])
+    return status.HTTP_201_CREATED, serializers.ReadTransactionSerializer(serializer.instance).data
+
+
+@admin_required
+async def transaction_create(request):
+    if request.method != "POST":
+        return http.HttpResponseNotAllowed(permitted_methods=["POST"])
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict):
+        return json_response({'detail': 'JSON parse error'}, status.HTTP_400_BAD_REQUEST)
+
+    status_code, data = await create_transaction(data)
+    return json_response(data, status_code)
+
+
+# like DRF's APIView, these are authenticated by token or basic auth and not by session
+transaction_create.csrf_exempt = True
@@ -1,6 +1,7 @@
 import decimal
 
 from django.contrib.auth import get_user_model
+from django.db.models import prefetch_related_objects
 from djmoney.money import Money
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -8,6 +9,31 @@ from rest_framework.exceptions import ValidationError
 from bank import models
 
 
+def prefetch_nested(transactions=(), featured=(), accounts=(), corporations=(), users=()):
+    """Prefetch the relations the nested serializers below list, with one query per relation for all the given
+    objects and the objects nested in them, instead of one query per object. Relations that were already fetched,
+    like those of select_related(), are left alone."""
+
+    transactions, featured = list(transactions), list(featured)
+    prefetch_related_objects(transactions, 'from_account', 'to_account', 'authorized_by')
+    prefetch_related_objects(featured, 'corporation')
+
+    accounts = list(accounts) + [account for transaction in transactions
+                                 for account in (transaction.from_account, transaction.to_account)]
+    prefetch_related_objects(accounts, 'individual_holder', 'corporate_holder', 'transactions_to',
+                             'transactions_from')
+
+    corporations = list(corporations) + [featured_corporation.corporation for featured_corporation in featured]
+    corporations += [account.corporate_holder for account in accounts if account.corporate_holder_id]
+    prefetch_related_objects(corporations, 'owner', 'account_set', 'employee_set')
+
+    users = list(users) + [transaction.authorized_by for transaction in transactions
+                           if transaction.authorized_by_id]
+    users += [account.individual_holder for account in accounts if account.individual_holder_id]
+    users += [corporation.owner for corporation in corporations]
+    prefetch_related_objects(users, 'account_set', 'employed_at', 'corporation_set')
+
+
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     personal_accounts = serializers.PrimaryKeyRelatedField(many=True, read_only=True, source="account_set")
     employed_at = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
@@ -15,7 +41,33 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = get_user_model()
-        fields = ['id', 'username', 'personal_accounts', 'employed_at', 'owns_organizations', 'discord_dms_enabled']
+        fields = ['id', 'username', 'personal_accounts', 'employed_at', 'owns_organizations', 'discord_dms_enabled',
+                  'notification_mode']
+
+
+class SearchUserSerializer(serializers.HyperlinkedModelSerializer):
+    """Only staff gets to see which Discord account belongs to whom."""
+
+    class Meta:
+        model = get_user_model()
+        fields = ['id', 'username', 'discord_id', 'discord_username']
+        staff_only_fields = ['discord_id', 'discord_username']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+
+        if request is None or not request.user.is_staff:
+            for name in self.Meta.staff_only_fields:
+                fields.pop(name)
+
+        return fields
+
+
+class SearchCorporationSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = models.Corporation
+        fields = ['name', 'abbreviation', 'is_public_viewable']
 
 
 class CorporationSerializer(serializers.HyperlinkedModelSerializer):
@@ -85,8 +137,11 @@ class SmallAccountSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class WriteTransactionSerializer(serializers.HyperlinkedModelSerializer):
-    from_account = serializers.PrimaryKeyRelatedField(queryset=models.Account.objects.all())
-    to_account = serializers.PrimaryKeyRelatedField(queryset=models.Account.objects.all())
+    # the holders are needed once the transaction was saved, by the signals and the response
+    from_account = serializers.PrimaryKeyRelatedField(
+        queryset=models.Account.objects.select_related('individual_holder', 'corporate_holder__owner'))
+    to_account = serializers.PrimaryKeyRelatedField(
+        queryset=models.Account.objects.select_related('individual_holder', 'corporate_holder__owner'))
 
     class Meta:
         model = models.Transaction
@@ -133,13 +188,31 @@ class WriteTransactionSerializer(serializers.HyperlinkedModelSerializer):
         return data
 
 
-class ReadTransactionSerializer(serializers.HyperlinkedModelSerializer):
+class TransactionFieldsSerializer(serializers.HyperlinkedModelSerializer):
+    """The transaction's own fields, they never change once it was sent."""
+
+    pretty_amount_currency = serializers.CharField(source="get_amount_currency_display")
+
+    class Meta:
+        model = models.Transaction
+        fields = ['id', 'amount', 'amount_currency', 'pretty_amount_currency', 'purpose', 'created_on']
+
+
+class TransactionPartiesSerializer(serializers.HyperlinkedModelSerializer):
+    """The accounts and the user of a transaction, with their balances and histories as they are now."""
+
     authorized_by = UserSerializer(read_only=True)
     from_account = AccountSerializer(read_only=True)
     to_account = AccountSerializer(read_only=True)
-    pretty_amount_currency = serializers.CharField(source="get_amount_currency_display")
     safe_to_account = serializers.CharField(source="to_account.pretty_holder")
 
+    class Meta:
+        model = models.Transaction
+        fields = ['from_account', 'to_account', 'authorized_by', 'safe_to_account']
+        depth = 2
+
+
+class ReadTransactionSerializer(TransactionFieldsSerializer, TransactionPartiesSerializer):
     class Meta:
         model = models.Transaction
         fields = ['id', 'from_account', 'to_account', 'amount', 'amount_currency', 'pretty_amount_currency', 'purpose',
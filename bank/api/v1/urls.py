@@ -2,6 +2,7 @@ from django.urls import include, path
 from rest_framework import routers
 from rest_framework.authtoken import views as auth_views
 
+from bank import budgets
 from bank.api.v1 import views
 
 router = routers.DefaultRouter()
@@ -11,6 +12,11 @@ router.register(r'featured_corporation', views.FeaturedCorporationViewSet, basen
 router.register(r'transaction', views.TransactionViewSet, basename='Transaction')
 router.register(r'user', views.UserViewSet)
 
+budgets.register('api-root', 4)
+budgets.register('rest_framework.authtoken.views.ObtainAuthToken', 6)
+budgets.register('rest_framework:login', 4)
+budgets.register('rest_framework:logout', 6)
+
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -18,10 +24,13 @@ urlpatterns = [
     path('discord_user/<int:discord_id>/', views.UserAccountFromDiscordUser.as_view()),
     path('send/', views.TransactionCreate.as_view()),
     path('statistics/', views.BankStatistics.as_view()),
+    path('metrics/', views.MetricsView.as_view()),
+    path('profiles/<uuid:profile_id>/', views.ProfileView.as_view(), name='profile'),
     path('default_account/', views.DefaultBankAccount.as_view()),
     path('ottoman/apply/', views.ApplyOttomanFormula.as_view()),
     path('ottoman/threshold/', views.OttomanThresholds.as_view()),
     path('currencies/', views.CurrenciesView.as_view()),
+    path('search/', views.SearchView.as_view()),
     path('token/', auth_views.obtain_auth_token),
     path('auth/', include('rest_framework.urls', namespace='rest_framework'))
 ]
@@ -1,10 +1,10 @@
 import decimal
-import math
 
 from moneyed.localization import _FORMATTER
 from decimal import Decimal
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db.models import Count, Sum
+from django.http import FileResponse, Http404, HttpResponse
 from django.urls import reverse
 from djmoney.money import Money
 from djmoney.settings import CURRENCY_CHOICES
@@ -12,33 +12,25 @@ from guardian.shortcuts import get_objects_for_user
 from rest_framework import viewsets, status
 from rest_framework import views
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework import permissions
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from datetime import timedelta
 
 from . import serializers
-from bank import models, util
+from bank import caching, cents, metrics, models, profiling, search, util
+from bank.budgets import query_budget
+from bank.pagination import EstimatedCountPagination
 from django.conf import settings
 from django.db import transaction
-from ...tasks import discord_dm_notification
+from ...notifications import queue_dm, outbox_statistics
+from ...taskrunner import queue_statistics
 
 
 def calculate_ottoman_tax(account_balance: Decimal, equilibrium_balance: Decimal) -> Decimal:
-    # Thanks Tiberius for providing this
-
-    tax = (account_balance - equilibrium_balance) / 2
-
-    pre_round_balance = account_balance - tax
-
-    if pre_round_balance > equilibrium_balance:
-        final_balance = 10 * math.floor(pre_round_balance / 10)
-    else:
-        final_balance = 10 * math.ceil(pre_round_balance / 10)
-
-    final_tax = account_balance - final_balance
-    return final_tax
+    # Thanks Tiberius for providing this, bank.cents.ottoman_tax does the math in cents
+    return cents.to_decimal(cents.ottoman_tax(cents.to_cents(account_balance), cents.to_cents(equilibrium_balance)))
 
 
 def get_ottoman_government_account(admin_account):
@@ -59,17 +51,49 @@ def get_ottoman_government_account(admin_account):
     return account
 
 
+def queue_ottoman_tax_dm(account, tax_as_money):
+    embed = util.make_embed(title="Tax by the Ottoman Government Applied",
+                            description=f"As your bank account's balance exceeded your personal equilibrium balance ({account.ottoman_threshold_variable}), the amount of Lira specified below was automatically deducted from your bank account and sent back to the Ottoman Government as a tax.",
+                            url=f"https://democracivbank.com{reverse('bank:account-detail', kwargs={'pk': str(account.pk)})}")
+    if account.corporate_holder_id:
+        bank_account_value = f"**{account.pretty_holder}** - {account.name}"
+    else:
+        bank_account_value = account.name
+
+    util.add_field(embed, name="Bank Account", value=bank_account_value)
+    util.add_field(embed, name="Amount", value=tax_as_money)
+    payload = {'targets': account.get_discord_ids(), 'message': '', 'embed': embed}
+    queue_dm(payload, priority=models.QueuedTask.Priorities.BULK)
+
+
+class PrefetchNestedMixin:
+    """Prefetches what the nested serializer lists for all rows of a page at once, see
+    serializers.prefetch_nested(). `prefetch_nested` is the keyword the rows are passed as."""
+
+    prefetch_nested = None
+
+    def get_serializer(self, *args, **kwargs):
+        if args and args[0] is not None:
+            rows = args[0] if kwargs.get('many') else [args[0]]
+            serializers.prefetch_nested(**{self.prefetch_nested: rows})
+
+        return super().get_serializer(*args, **kwargs)
+
+
+@query_budget(24)
 class AccountsPerDiscordUser(views.APIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = serializers.AccountSerializer
 
     def get(self, request, discord_id):
         user = get_object_or_404(get_user_model(), discord_id=discord_id)
-        accounts = get_objects_for_user(user, 'bank.view_account')
+        accounts = list(get_objects_for_user(user, 'bank.view_account'))
+        serializers.prefetch_nested(accounts=accounts)
         serializer = self.serializer_class(accounts, many=True)
         return Response(serializer.data)
 
 
+@query_budget(8)
 class UserAccountFromDiscordUser(views.APIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = serializers.UserSerializer
@@ -80,6 +104,7 @@ class UserAccountFromDiscordUser(views.APIView):
         return Response(serializer.data)
 
 
+@query_budget(8)
 class ApplyOttomanFormula(views.APIView):
     permission_classes = [permissions.IsAdminUser]
 
@@ -90,9 +115,9 @@ class ApplyOttomanFormula(views.APIView):
 
         with transaction.atomic():
             for account in ottoman_accounts:
-                old_balance = account.balance.amount
-                tax = calculate_ottoman_tax(old_balance, account.ottoman_threshold_variable)
-                tax_as_money = Money(abs(tax), currency="LRA")
+                old_balance = cents.to_cents(account.balance)
+                tax = cents.ottoman_tax(old_balance, cents.to_cents(account.ottoman_threshold_variable))
+                tax_as_money = cents.to_money(abs(tax), "LRA")
 
                 if not dry_run and tax != 0:
                     if tax < 0:
@@ -115,20 +140,10 @@ class ApplyOttomanFormula(views.APIView):
                             amount=tax_as_money,
                             authorized_by=self.request.user)
 
-                        embed = util.make_embed(title="Tax by the Ottoman Government Applied",
-                                                description=f"As your bank account's balance exceeded your personal equilibrium balance ({account.ottoman_threshold_variable}), the amount of Lira specified below was automatically deducted from your bank account and sent back to the Ottoman Government as a tax.",
-                                                url=f"https://democracivbank.com{reverse('bank:account-detail', kwargs={'pk': str(account.pk)})}")
-                        if account.corporate_holder:
-                            bank_account_value = f"**{account.pretty_holder}** - {account.name}"
-                        else:
-                            bank_account_value = account.name
+                        queue_ottoman_tax_dm(account, tax_as_money)
 
-                        util.add_field(embed, name="Bank Account", value=bank_account_value)
-                        util.add_field(embed, name="Amount", value=tax_as_money)
-                        payload = {'targets': account.get_discord_ids(), 'message': '', 'embed': embed}
-                        discord_dm_notification(payload)
-
-                result['results'].append({str(account.iban): {'old': old_balance, 'new': old_balance - tax,
+                result['results'].append({str(account.iban): {'old': cents.to_decimal(old_balance),
+                                                              'new': cents.to_decimal(old_balance - tax),
                                                               'ibal': account.ottoman_threshold_variable}})
         return result
 
@@ -141,6 +156,7 @@ class ApplyOttomanFormula(views.APIView):
         return Response(result)
 
 
+@query_budget(20)
 class DefaultBankAccount(views.APIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = serializers.AccountSerializer
@@ -170,30 +186,72 @@ class DefaultBankAccount(views.APIView):
         else:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
+        serializers.prefetch_nested(accounts=[default_account])
         serializer = self.serializer_class(default_account)
         return Response(serializer.data)
 
 
+def circulation() -> dict:
+    """The money outside of the central banks by currency, with one query for all currencies."""
+
+    accounts = models.Account.objects.filter(is_reserve=False).exclude(corporate_holder__abbreviation="BANK")
+    return dict(accounts.order_by().values_list('currency').annotate(Sum('balance')))
+
+
+def get_currencies():
+    result = []
+    totals = circulation()
+
+    for code, name in CURRENCY_CHOICES:
+        total_money = totals.get(code)
+        prefix, suffix = _FORMATTER.get_sign_definition(currency_code=code, locale="")
+
+        result.append({'code': code,
+                       'name': name,
+                       'sign': {"prefix": prefix, "suffix": suffix},
+                       'circulation': total_money})
+
+    return result
+
+
+@query_budget(6)
 class CurrenciesView(views.APIView):
 
     def get(self, request):
-        result = []
+        return Response({"result": get_currencies()})
 
-        for code, name in CURRENCY_CHOICES:
-            accounts = models.Account.objects.filter(currency=code, is_reserve=False).exclude(
-                corporate_holder__abbreviation="BANK")
-            total_money = accounts.aggregate(Sum('balance'))['balance__sum']
 
-            prefix, suffix = _FORMATTER.get_sign_definition(currency_code=code, locale="")
+@query_budget(8)
+class SearchView(views.APIView):
+    """
+    Autocomplete users and organizations by (part of) their name, with some tolerance for typos.
+    Only staff finds organizations that aren't listed on the marketplace, and sees users' Discord accounts.
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-            result.append({'code': code,
-                           'name': name,
-                           'sign': {"prefix": prefix, "suffix": suffix},
-                           'circulation': total_money})
+    def get(self, request):
+        query = request.query_params.get('q', '')
 
-        return Response({"result": result})
+        try:
+            limit = min(int(request.query_params.get('limit', settings.SEARCH_RESULT_LIMIT)),
+                        settings.SEARCH_RESULT_LIMIT)
+        except ValueError:
+            return Response({'limit': 'Must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        corporations = models.Corporation.objects.all()
 
+        if not request.user.is_staff:
+            corporations = corporations.filter(is_public_viewable=True)
+
+        return Response({
+            'users': serializers.SearchUserSerializer(search.search_users(query, limit=limit), many=True,
+                                                      context={'request': request}).data,
+            'corporations': serializers.SearchCorporationSerializer(
+                search.search_corporations(query, corporations, limit=limit), many=True).data,
+        })
+
+
+@query_budget(36)
 class TransactionCreate(views.APIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = serializers.WriteTransactionSerializer
@@ -206,32 +264,28 @@ class TransactionCreate(views.APIView):
 
         if serializer.is_valid():
             serializer.save(authorized_by=user)
+            serializers.prefetch_nested(transactions=[serializer.instance])
             complete_transaction = serializers.ReadTransactionSerializer(serializer.instance)
             return Response(complete_transaction.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-def calculate_velocity_of_money(currency_code: str) -> float:
-    accounts = models.Account.objects.filter(currency=currency_code, is_reserve=False).exclude(
-        corporate_holder__abbreviation="BANK")
-
-    total_money = accounts.aggregate(Sum('balance'))['balance__sum']
+def calculate_velocity_of_money(currencies) -> dict:
+    """The money sent in the last seven days relative to the money in circulation, by currency. The filter on
+    amount_currency and created_on is covered by bank_transaction_currency_idx, and lets PostgreSQL skip all
+    partitions but the last one or two."""
 
-    if not total_money:
-        return 0.0
+    totals = circulation()
+    sent = dict(models.Transaction.objects.filter(amount_currency__in=currencies,
+                                                  created_on__gte=timezone.now() - timedelta(days=7))
+                .order_by().values_list('amount_currency').annotate(Sum('amount')))
 
-    transactions_in_last_seven_days = models.Transaction.objects.filter(from_account__currency=currency_code,
-                                                                        created_on__gte=timezone.now() - timedelta(
-                                                                            days=7))
-
-    transaction_amounts = transactions_in_last_seven_days.aggregate(Sum('amount'))
-    sent_money = transaction_amounts['amount__sum'] or decimal.Decimal("0")
-
-    velocity = sent_money / total_money
-    return velocity
+    return {code: (sent.get(code) or decimal.Decimal("0")) / totals[code] if totals.get(code) else 0.0
+            for code in currencies}
 
 
+@query_budget(24)
 class BankStatistics(views.APIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = serializers.SmallAccountSerializer
@@ -242,19 +296,61 @@ class BankStatistics(views.APIView):
                    'currencies': {'amount': len(settings.CURRENCIES), 'detail': {}},
                    'organizations': {}}
 
+        # one grouped query per figure for all currencies, rather than one per currency
+        transactions = dict(models.Transaction.objects.order_by().values_list('amount_currency')
+                            .annotate(Count('pk')))
+        accounts = dict(models.Account.objects.order_by().values_list('currency').annotate(Count('pk')))
+        velocity = calculate_velocity_of_money(settings.CURRENCIES)
+
         for code in settings.CURRENCIES:
             payload['currencies']['detail'][code] = {
-                'transactions': models.Transaction.objects.filter(from_account__currency=code).count(),
-                'bank_accounts': models.Account.objects.filter(currency=code).count(),
-                'velocity': calculate_velocity_of_money(code)
+                'transactions': transactions.get(code, 0),
+                'bank_accounts': accounts.get(code, 0),
+                'velocity': velocity[code]
             }
 
+        organizations = dict(models.Corporation.objects.order_by().values_list('nation').annotate(Count('pk')))
+
         for nation in models.Corporation.Nations:
-            payload['organizations'][nation.label] = models.Corporation.objects.filter(nation=nation).count()
+            payload['organizations'][nation.label] = organizations.get(nation.value, 0)
+
+        payload['notifications'] = outbox_statistics()
+        payload['tasks'] = queue_statistics()
 
         return Response(payload)
 
 
+@query_budget(10)
+class MetricsView(views.APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        # the Prometheus text format, of this process only, see bank/metrics.py
+        return HttpResponse(metrics.render(queue=queue_statistics()), content_type=metrics.CONTENT_TYPE)
+
+
+@query_budget(6)
+class ProfileView(views.APIView):
+    """
+    A request profile, see bank/profiling.py: the request, its queries and its slowest functions,
+    or the cProfile stats with ?download.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, profile_id):
+        summary = profiling.load(profile_id)
+
+        if summary is None:
+            raise Http404
+
+        if 'download' in request.query_params:
+            return FileResponse(open(profiling.stats_path(profile_id), 'rb'), as_attachment=True,
+                                filename=f"{profile_id}.prof")
+
+        return Response(summary)
+
+
+@query_budget(8)
 class OttomanThresholds(views.APIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = serializers.SmallAccountSerializer
@@ -273,57 +369,89 @@ class OttomanThresholds(views.APIView):
         return Response(serializer.data)
 
 
-class AccountResultsSetPagination(PageNumberPagination):
+class AccountResultsSetPagination(EstimatedCountPagination):
     page_size = 4
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
 
-class AccountViewSet(viewsets.ModelViewSet):
+@query_budget(24)
+class AccountViewSet(PrefetchNestedMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     serializer_class = serializers.AccountSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = AccountResultsSetPagination
+    prefetch_nested = 'accounts'
 
     def get_queryset(self):
         return get_objects_for_user(self.request.user, 'bank.view_account').order_by('-created_on')
 
+    def list(self, request, *args, **kwargs):
+        accounts = caching.get_accounts_for_user(request.user, '-created_on')
+        page = self.paginate_queryset(accounts)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
-class CorporationViewSet(viewsets.ModelViewSet):
+
+@query_budget(20)
+class CorporationViewSet(PrefetchNestedMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     serializer_class = serializers.CorporationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    prefetch_nested = 'corporations'
 
     def get_queryset(self):
         return get_objects_for_user(self.request.user, 'bank.view_corporation').order_by('-created_on')
 
 
-class FeaturedCorporationViewSet(viewsets.ModelViewSet):
+@query_budget(16)
+class FeaturedCorporationViewSet(PrefetchNestedMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     queryset = models.FeaturedCorporation.objects.all().order_by('-featured_since')
     serializer_class = serializers.FeaturedCorporationSerializer
     permission_classes = [permissions.IsAdminUser]
+    prefetch_nested = 'featured'
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+@query_budget(20)
+class TransactionViewSet(PrefetchNestedMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
-    queryset = models.Transaction.objects.all().order_by('-created_on')
+    queryset = models.Transaction.objects.select_related('from_account', 'to_account', 'authorized_by') \
+        .order_by('-created_on')
     serializer_class = serializers.ReadTransactionSerializer
     permission_classes = [permissions.IsAdminUser]
-
-
-class UserViewSet(viewsets.ModelViewSet):
+    prefetch_nested = 'transactions'
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # only the transaction's own fields are cached, the nested accounts change with every transfer
+        fields = caching.get_or_set_transaction(
+            instance, caching.VIEWER_ADMIN, lambda: dict(serializers.TransactionFieldsSerializer(instance).data))
+        serializers.prefetch_nested(transactions=[instance])
+        data = {**fields, **serializers.TransactionPartiesSerializer(instance).data}
+        data = {name: data[name] for name in self.serializer_class.Meta.fields}
+
+        # the nested accounts have no version or modification time, so the ETag is one of the content
+        etag = caching.content_etag(data)
+        response = get_conditional_response(request, etag=etag) or Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+@query_budget(10)
+class UserViewSet(PrefetchNestedMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     queryset = get_user_model().objects.all().order_by('id')
     serializer_class = serializers.UserSerializer
     permission_classes = [permissions.IsAdminUser]
+    prefetch_nested = 'users'
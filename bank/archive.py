@@ -0,0 +1,365 @@
+"""
+Cold archive for old transactions. Transactions of months before a cutoff are exported to one gzipped NDJSON file
+per currency and month, verified against the database and then deleted from it. Account history and exports read
+archived transactions back through `AccountHistory`, which only opens the files of the months a page reaches into.
+
+    {TRANSACTION_ARCHIVE_ROOT}/manifest.json
+    {TRANSACTION_ARCHIVE_ROOT}/USD/2020-01.ndjson.gz
+    {TRANSACTION_ARCHIVE_ROOT}/USD/2020-01.accounts.json    the file's number of transactions per account
+"""
+
+import os
+import io
+import gzip
+import json
+import hashlib
+import mmap
+import uuid
+import datetime
+import tempfile
+
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from djmoney.money import Money
+
+from . import cents, models
+from .partitions import add_months, month_start
+
+FIELDS = ('id', 'from_account_id', 'to_account_id', 'amount', 'amount_currency', 'purpose', 'created_on',
+          'updated_on', 'authorized_by_id', 'state')
+
+
+class ArchiveVerificationError(Exception):
+    pass
+
+
+def get_root(root=None) -> str:
+    return root or settings.TRANSACTION_ARCHIVE_ROOT
+
+
+def month_key(currency: str, month: datetime.date) -> str:
+    return f"{currency}/{month:%Y-%m}"
+
+
+def load_manifest(root=None) -> dict:
+    try:
+        with open(os.path.join(get_root(root), 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'cutoff': None, 'files': {}}
+
+
+def save_manifest(manifest: dict, root=None):
+    path = os.path.join(get_root(root), 'manifest.json')
+
+    with tempfile.NamedTemporaryFile('w', dir=get_root(root), delete=False) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    os.replace(f.name, path)
+
+
+def file_path(key: str, root=None) -> str:
+    return os.path.join(get_root(root), f"{key}.ndjson.gz")
+
+
+def counts_path(path: str) -> str:
+    return path[:-len('.ndjson.gz')] + '.accounts.json'
+
+
+def count_transaction(counts: dict, from_account: str, to_account: str):
+    for iban in {from_account, to_account}:
+        counts[iban] = counts.get(iban, 0) + 1
+
+
+def save_account_counts(path: str, counts: dict):
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), delete=False) as f:
+        json.dump(counts, f, separators=(',', ':'))
+
+    os.replace(f.name, counts_path(path))
+
+
+def load_account_counts(path: str) -> dict:
+    """The number of transactions of every account, by IBAN, in the archive file at `path`. Files archived before
+    these counts were written get them on first use."""
+
+    try:
+        with open(counts_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        counts = {}
+
+        for row in read_rows(path):
+            count_transaction(counts, row['from_account'], row['to_account'])
+
+        save_account_counts(path, counts)
+        return counts
+
+
+def serialize(row: dict) -> str:
+    return json.dumps({
+        'id': str(row['id']),
+        'from_account': str(row['from_account_id']),
+        'to_account': str(row['to_account_id']),
+        'amount': str(row['amount']),
+        'currency': row['amount_currency'],
+        'purpose': row['purpose'],
+        'created_on': row['created_on'].isoformat(),
+        'updated_on': row['updated_on'].isoformat(),
+        'authorized_by': row['authorized_by_id'],
+        'state': row['state'],
+    }, separators=(',', ':'))
+
+
+def read_rows(path: str):
+    """Yield the archived rows of one file. The compressed file is memory-mapped instead of read into memory."""
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with gzip.GzipFile(fileobj=mapped, mode='rb') as decompressed:
+            for line in io.TextIOWrapper(decompressed, encoding='utf-8'):
+                yield json.loads(line)
+
+
+def summarize(path: str) -> dict:
+    rows = 0
+    total = 0
+
+    for row in read_rows(path):
+        rows += 1
+        total += cents.parse_cents(row['amount'])
+
+    return {'rows': rows, 'total': str(cents.to_decimal(total))}
+
+
+def months_to_archive(cutoff: datetime.date) -> list:
+    old = models.Transaction.objects.filter(created_on__lt=datetime.datetime.combine(
+        cutoff, datetime.time(), tzinfo=datetime.timezone.utc))
+    months = old.annotate(month=TruncMonth('created_on', tzinfo=datetime.timezone.utc)).values_list(
+        'amount_currency', 'month').order_by().distinct()
+    return sorted({(currency, month_start(month)) for currency, month in months})
+
+
+def month_queryset(currency: str, month: datetime.date):
+    start = datetime.datetime.combine(month, datetime.time(), tzinfo=datetime.timezone.utc)
+    end = datetime.datetime.combine(add_months(month, 1), datetime.time(), tzinfo=datetime.timezone.utc)
+    return models.Transaction.objects.filter(amount_currency=currency, created_on__gte=start, created_on__lt=end)
+
+
+def export_month(currency: str, month: datetime.date, path: str) -> dict:
+    queryset = month_queryset(currency, month)
+    expected = queryset.aggregate(rows=Count('id'), total=Sum('amount'))
+    expected = {'rows': expected['rows'], 'total': str(cents.to_decimal(cents.to_cents(expected['total'] or 0)))}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    counts = {}
+
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as compressed:
+            for row in queryset.order_by('created_on').values(*FIELDS).iterator(chunk_size=2000):
+                compressed.write(serialize(row).encode() + b'\n')
+                count_transaction(counts, str(row['from_account_id']), str(row['to_account_id']))
+
+    written = summarize(f.name)
+
+    if written != expected:
+        os.remove(f.name)
+        raise ArchiveVerificationError(f"{month_key(currency, month)}: exported {written}, expected {expected}")
+
+    os.replace(f.name, path)
+    save_account_counts(path, counts)
+    return written
+
+
+def delete_archived(currency: str, month: datetime.date, path: str, batch_size: int) -> int:
+    ids = [uuid.UUID(row['id']) for row in read_rows(path)]
+    deleted = 0
+
+    for i in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            deleted += month_queryset(currency, month).filter(id__in=ids[i:i + batch_size]).delete()[1].get(
+                'bank.Transaction', 0)
+
+    if month_queryset(currency, month).exists():
+        raise ArchiveVerificationError(f"{month_key(currency, month)} has transactions that aren't in the archive")
+
+    return deleted
+
+
+def archive_before(cutoff: datetime.date, batch_size: int = None, root=None) -> list:
+    """Move all transactions of months before `cutoff` into the archive. Returns a summary per archived file.
+
+    Files are only written once they match the database's row count and sum, and rows are only deleted once
+    they're in a verified file, so it's safe to run this again after it failed halfway."""
+
+    cutoff = month_start(cutoff)
+
+    if cutoff > month_start(timezone.now()):
+        raise ValueError("Only past months can be archived.")
+
+    batch_size = batch_size or settings.TRANSACTION_ARCHIVE_BATCH_SIZE
+    os.makedirs(get_root(root), exist_ok=True)
+    manifest = load_manifest(root)
+    summaries = []
+
+    for currency, month in months_to_archive(cutoff):
+        key = month_key(currency, month)
+        path = file_path(key, root)
+
+        # already exported on a previous, interrupted run, only the deletion is left
+        if key not in manifest['files']:
+            manifest['files'][key] = export_month(currency, month, path)
+            save_manifest(manifest, root)
+
+        deleted = delete_archived(currency, month, path, batch_size)
+        summaries.append({'file': key, 'deleted': deleted, **manifest['files'][key]})
+
+    if manifest['cutoff'] is None or manifest['cutoff'] < cutoff.isoformat():
+        manifest['cutoff'] = cutoff.isoformat()
+
+    save_manifest(manifest, root)
+    return summaries
+
+
+def to_transaction(row: dict, accounts: dict):
+    archived = models.Transaction(id=uuid.UUID(row['id']), amount=Money(row['amount'], row['currency']),
+                                  purpose=row['purpose'], created_on=parse_datetime(row['created_on']),
+                                  updated_on=parse_datetime(row['updated_on']),
+                                  authorized_by_id=row['authorized_by'], state=row['state'])
+    # accounts that were deleted since, like their transactions in the database, show up as the deleted account
+    archived.from_account = accounts.get(row['from_account']) or accounts['deleted']
+    archived.to_account = accounts.get(row['to_account']) or accounts['deleted']
+    archived.is_archived = True
+    return archived
+
+
+def to_transactions(rows: list) -> list:
+    ibans = {row['from_account'] for row in rows} | {row['to_account'] for row in rows}
+    accounts = {str(other.pk): other for other in models.Account.objects.filter(pk__in=ibans)}
+
+    if not ibans.issubset(accounts):
+        accounts['deleted'] = models.get_deleted_account()
+
+    return [to_transaction(row, accounts) for row in rows]
+
+
+def account_months(account, root=None) -> list:
+    """The archive files that hold transactions of `account`, and how many, oldest first. Only the manifest and the
+    files' account counts are read, and the result is cached until the archive grows."""
+
+    manifest = load_manifest(root)
+
+    if not manifest['files']:
+        return []
+
+    since = f"{month_start(account.history_start):%Y-%m}" if account.history_start else ""
+    iban = str(account.pk)
+
+    def count():
+        months = []
+
+        for key in sorted(manifest['files']):
+            currency, month = key.split('/')
+
+            if currency == account.balance.currency.code and month >= since:
+                transactions = load_account_counts(file_path(key, root)).get(iban, 0)
+
+                if transactions:
+                    months.append((key, transactions))
+
+        return months
+
+    version = hashlib.md5(json.dumps([get_root(root), manifest], sort_keys=True).encode()).hexdigest()
+    return cache.get_or_set(f"archive-months:{version}:{iban}", count, timeout=None)
+
+
+class AccountHistory:
+    """The transactions of an account by date: the ones in the database and the archived ones, which are all
+    older. Counting only reads the archive's account counts, and slices, like the pages of the account's table,
+    only read the archive files of the months they reach into."""
+
+    def __init__(self, transactions, account, root=None):
+        self.transactions = transactions
+        self.account = account
+        self.root = root
+        self.newest_first = True
+        self.read_months = {}
+
+    @cached_property
+    def months(self) -> list:
+        return account_months(self.account, self.root)
+
+    @cached_property
+    def live_count(self) -> int:
+        return self.transactions.count()
+
+    def ordered_live(self):
+        return self.transactions.order_by('-created_on' if self.newest_first else 'created_on')
+
+    def read_live(self, start: int, stop: int) -> list:
+        return list(self.ordered_live()[start:stop])
+
+    def month_transactions(self, key: str) -> list:
+        """The account's transactions in one archive file, oldest first. Read once, tables slice their data
+        several times."""
+
+        if key not in self.read_months:
+            iban = str(self.account.pk)
+            rows = [row for row in read_rows(file_path(key, self.root))
+                    if iban in (row['from_account'], row['to_account'])]
+            rows.sort(key=lambda row: row['created_on'])
+            self.read_months[key] = to_transactions(rows)
+
+        return self.read_months[key]
+
+    def read_month(self, key: str, start: int, stop: int) -> list:
+        transactions = self.month_transactions(key)
+        return (transactions[::-1] if self.newest_first else transactions)[start:stop]
+
+    def segments(self) -> list:
+        """The sources of the history in order, as (amount of transactions, read(start, stop)) pairs."""
+
+        live = (self.live_count, self.read_live)
+        archived = [(count, partial(self.read_month, key)) for key, count in self.months]
+        return [live, *reversed(archived)] if self.newest_first else [*archived, live]
+
+    def __len__(self):
+        return self.live_count + sum(count for _, count in self.months)
+
+    def __iter__(self):
+        for count, read in self.segments():
+            if read == self.read_live:
+                # exports go through the whole history, stream it instead of slicing it
+                yield from self.ordered_live().iterator(chunk_size=2000)
+            else:
+                yield from read(0, count)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop, step = index.indices(len(self))
+        transactions, offset = [], 0
+
+        for count, read in self.segments():
+            if offset < stop and start < offset + count:
+                transactions.extend(read(max(start - offset, 0), min(stop - offset, count)))
+
+            offset += count
+
+        return transactions[::step]
+
+
+def transactions_for_account(account, root=None) -> list:
+    """All archived transactions from or to `account`, oldest first, as unsaved Transaction instances."""
+
+    history = AccountHistory(models.Transaction.objects.none(), account, root)
+    history.newest_first = False
+    return list(history)
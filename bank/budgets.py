@@ -0,0 +1,82 @@
+"""
+Query budgets: the most database queries a view may make for one request, declared next to the view with
+`@query_budget(n)`, or with `register()` for views that are defined elsewhere. QueryBudgetMiddleware checks every
+request against the budget of its view, and flags queries that ran QUERY_REPEAT_THRESHOLD times or more with only
+their parameters changed, the signature of an N+1 query in a loop over rows.
+
+Depending on settings.QUERY_BUDGET_MODE, problems are logged ("warn"), raise QueryBudgetExceeded ("raise", used
+by bank/test_query_budgets.py) or aren't looked for at all ("off", in production).
+"""
+
+import re
+import logging
+
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# budgets of views that can't be decorated, by view name
+registry = {}
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(queries: int):
+    """Declare the most queries a function view, view class or viewset may make for one request."""
+
+    def decorate(view):
+        view.query_budget = queries
+        return view
+
+    return decorate
+
+
+def register(view_name: str, queries: int):
+    registry[view_name] = queries
+
+
+def get_budget(match):
+    """The budget of the view of a ResolverMatch, None if it has none."""
+
+    for view in (match.func, getattr(match.func, 'view_class', None), getattr(match.func, 'cls', None)):
+        if hasattr(view, 'query_budget'):
+            return view.query_budget
+
+    return registry.get(match.view_name)
+
+
+def normalize(sql: str) -> str:
+    """The SQL of a query without its parameters, whether they were interpolated or not."""
+
+    return PLACEHOLDER_LISTS.sub("(%s)", LITERALS.sub("%s", sql))
+
+
+def repeated_queries(queries: list, threshold: int) -> list:
+    """The normalized queries that ran at least `threshold` times, with how often they ran."""
+
+    return [(sql, count) for sql, count in Counter(map(normalize, queries)).most_common() if count >= threshold]
+
+
+def problems(view_name: str, budget, queries: list, threshold: int) -> list:
+    found = []
+
+    if budget is not None and len(queries) > budget:
+        found.append(f"{view_name} made {len(queries)} queries, its budget is {budget}")
+
+    for sql, count in repeated_queries(queries, threshold):
+        found.append(f"{view_name} ran this query {count} times: {sql}")
+
+    return found
+
+
+def report(found: list, mode: str):
+    if mode == 'raise':
+        raise QueryBudgetExceeded("\n".join(found))
+
+    for problem in found:
+        logger.warning(problem)
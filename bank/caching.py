@@ -0,0 +1,150 @@
+import json
+import time
+import hashlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.cache import cache, caches
+from django.utils.http import quote_etag
+from django.contrib.contenttypes.models import ContentType
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import get_objects_for_user
+
+from . import models
+
+# Which side(s) of a transaction a viewer holds, they decide what the detail page shows
+VIEWER_FROM = "from"
+VIEWER_TO = "to"
+VIEWER_BOTH = "both"
+VIEWER_ADMIN = "admin"
+
+
+def transaction_viewer_bucket(user, transaction) -> str:
+    sees_from = user.has_perm('bank.view_account', transaction.from_account)
+    sees_to = user.has_perm('bank.view_account', transaction.to_account)
+
+    if sees_from and sees_to:
+        return VIEWER_BOTH
+
+    if sees_from:
+        return VIEWER_FROM
+
+    if sees_to:
+        return VIEWER_TO
+
+    return ""
+
+
+def transaction_version(transaction) -> str:
+    # transactions only ever change their state, so a revocation changes every key and ETag derived from this
+    return f"{transaction.pk}:{transaction.state}:{transaction.updated_on.timestamp():.6f}"
+
+
+def transaction_parties_version(transaction) -> str:
+    """What the detail page shows of the accounts and the user that authorized the transaction. Unlike the
+    transaction, they can change after it was sent."""
+
+    parties = [transaction.from_account.name, transaction.from_account.pretty_holder,
+               transaction.to_account.name, transaction.to_account.pretty_holder,
+               transaction.authorized_by.username if transaction.authorized_by_id else ""]
+    return hashlib.md5("\0".join(map(str, parties)).encode()).hexdigest()
+
+
+def transaction_etag(transaction, *parts) -> str:
+    version = ":".join([transaction_version(transaction), transaction_parties_version(transaction), *map(str, parts)])
+    return quote_etag(hashlib.md5(version.encode()).hexdigest())
+
+
+def content_etag(data) -> str:
+    """An ETag of serialized data, for responses that nest objects without a version of their own."""
+
+    return quote_etag(hashlib.md5(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest())
+
+
+def transaction_cache_key(transaction, bucket: str) -> str:
+    return f"transaction:{transaction_version(transaction)}:{transaction_parties_version(transaction)}:{bucket}"
+
+
+def get_or_set_transaction(transaction, bucket: str, default):
+    """Return the cached rendering of `transaction` for viewers in `bucket`, or cache the result of `default()`.
+    Whatever `default()` renders besides the transaction itself must be part of its parties version."""
+
+    return cache.get_or_set(transaction_cache_key(transaction, bucket), default,
+                            timeout=settings.TRANSACTION_CACHE_TIMEOUT)
+
+
+def shared_cache():
+    """The cache that all app processes share, for data that must be invalidated everywhere at once."""
+
+    return caches[settings.SHARED_CACHE_ALIAS]
+
+
+def get_version(key: str) -> int:
+    # versions start at the current time, so a version that was evicted is never reused with stale data
+    shared_cache().add(key, time.time_ns(), timeout=None)
+    return shared_cache().get(key, 0)
+
+
+def bump_versions(keys):
+    for key in set(keys):
+        try:
+            shared_cache().incr(key)
+        except ValueError:
+            shared_cache().set(key, time.time_ns(), timeout=None)
+
+
+def account_list_version_key(user_id) -> str:
+    return f"account-list-version:{user_id}"
+
+
+def invalidate_account_lists(user_ids):
+    bump_versions(account_list_version_key(user_id) for user_id in user_ids)
+
+
+def invalidate_account_lists_of_viewers(ibans):
+    """Invalidate the account lists of everyone who can view one of the accounts, after a bulk update()."""
+
+    viewers = UserObjectPermission.objects.filter(
+        content_type=ContentType.objects.get_for_model(models.Account), permission__codename='view_account',
+        object_pk__in=[str(iban) for iban in ibans]).values_list('user_id', flat=True).distinct()
+    invalidate_account_lists(viewers)
+
+
+def get_accounts_for_user(user, ordering: str) -> list:
+    """The bank accounts `user` can view, cached until one of them or the user's employment changes."""
+
+    def get_accounts():
+        return get_objects_for_user(user, 'bank.view_account').select_related('corporate_holder').order_by(ordering)
+
+    # superusers see every account, any save anywhere would invalidate their list
+    if user.is_superuser:
+        return get_accounts()
+
+    key = f"account-list:{user.pk}:{get_version(account_list_version_key(user.pk))}:{ordering}"
+    return shared_cache().get_or_set(key, lambda: list(get_accounts()), timeout=settings.ACCOUNT_LIST_CACHE_TIMEOUT)
+
+
+MARKETPLACE_VERSION_KEY = "marketplace-version"
+
+
+def invalidate_marketplace():
+    bump_versions([MARKETPLACE_VERSION_KEY])
+
+
+def get_marketplace() -> dict:
+    """The featured and public organizations, cached until any organization or ad changes."""
+
+    def build():
+        return {
+            'featured': list(models.FeaturedCorporation.objects.select_related('corporation')
+                             .order_by('-featured_since')),
+            'corporations': list(models.Corporation.objects.filter(is_public_viewable=True)
+                                 .select_related('owner').order_by('name')),
+        }
+
+    key = f"marketplace:{get_version(MARKETPLACE_VERSION_KEY)}"
+    return shared_cache().get_or_set(key, build, timeout=settings.MARKETPLACE_CACHE_TIMEOUT)
+
+
+def marketplace_page_key(number: int) -> str:
+    return f"marketplace-page:{get_version(MARKETPLACE_VERSION_KEY)}:{number}"
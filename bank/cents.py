@@ -0,0 +1,86 @@
+"""
+Money as integer minor units (cents) for bulk jobs. Every balance and amount has two decimal places, so sums,
+differences and comparisons of cents are exact, and skip the currency checks and Decimal context work that
+djmoney's Money does for every operation. Convert back with `to_money()` or `to_decimal()` at the edges.
+
+Anything that has to round does so like Decimal.quantize() with ROUND_HALF_EVEN.
+"""
+
+import re
+import decimal
+
+from djmoney.money import Money
+
+DECIMAL_PLACES = 2
+SCALE = 10 ** DECIMAL_PLACES
+CENT = decimal.Decimal(1).scaleb(-DECIMAL_PLACES)
+PLAIN_AMOUNT = re.compile(r'^([+-]?)(?=\.?\d)(\d*)(?:\.(\d{0,%d}))?$' % DECIMAL_PLACES)
+
+
+def to_cents(value) -> int:
+    """Cents of a Money, Decimal, int or numeric string, rounded half to even to whole cents."""
+
+    if isinstance(value, Money):
+        value = value.amount
+
+    if isinstance(value, int):
+        return value * SCALE
+
+    if isinstance(value, str):
+        return parse_cents(value)
+
+    return int(decimal.Decimal(value).quantize(CENT, rounding=decimal.ROUND_HALF_EVEN).scaleb(DECIMAL_PLACES))
+
+
+def parse_cents(text: str) -> int:
+    """Cents of a string like "-12.3" or "1000.05", without going through Decimal unless it has more than two
+    decimal places or an exponent."""
+
+    match = PLAIN_AMOUNT.match(text.strip())
+
+    if not match:
+        return to_cents(decimal.Decimal(text))
+
+    sign, whole, fraction = match.groups()
+    cents = int(whole or 0) * SCALE + int((fraction or '').ljust(DECIMAL_PLACES, '0'))
+    return -cents if sign == '-' else cents
+
+
+def to_decimal(cents: int) -> decimal.Decimal:
+    return decimal.Decimal(cents).scaleb(-DECIMAL_PLACES)
+
+
+def to_money(cents: int, currency) -> Money:
+    return Money(to_decimal(cents), currency)
+
+
+def divide(cents: int, divisor: int) -> int:
+    """`cents / divisor` rounded half to even to whole cents."""
+
+    if divisor < 0:
+        cents, divisor = -cents, -divisor
+
+    quotient, remainder = divmod(cents, divisor)
+
+    if remainder * 2 > divisor or (remainder * 2 == divisor and quotient % 2):
+        quotient += 1
+
+    return quotient
+
+
+def ottoman_tax(balance: int, equilibrium: int) -> int:
+    """The Ottoman tax on `balance` in cents, see `bank.api.v1.views.calculate_ottoman_tax`. Half of the
+    difference to the equilibrium balance is taxed, and the new balance is rounded to a multiple of 10 towards
+    the equilibrium balance. Negative if the account is below its equilibrium balance."""
+
+    # the balance after taxing half of the difference is (balance + equilibrium) / 2, so the rounded balance is
+    # a multiple of 10 * SCALE cents of twice that, without ever leaving integers
+    step = 2 * 10 * SCALE
+    doubled = balance + equilibrium
+
+    if balance > equilibrium:
+        new_balance = (doubled // step) * 10 * SCALE
+    else:
+        new_balance = -(-doubled // step) * 10 * SCALE
+
+    return balance - new_balance
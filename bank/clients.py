@@ -0,0 +1,183 @@
+import time
+import random
+import threading
+import requests
+
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from django.conf import settings
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a service after `threshold` consecutive failures. After `reset_timeout` seconds, a single
+    trial request is let through again and closes the circuit if it succeeds."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, *, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+
+            return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # let exactly one trial request through
+                self._state = self.HALF_OPEN
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+            if self._state == self.HALF_OPEN or self.failures >= self.threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def make_adapter(pool_size: int = None) -> HTTPAdapter:
+    pool_size = pool_size or settings.DEMOCRACIV_DISCORD_BOT_POOL_SIZE
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+
+
+def mount_adapter(session: requests.Session, pool_size: int = None) -> requests.Session:
+    adapter = make_adapter(pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def is_connect_error(error: requests.RequestException) -> bool:
+    """Whether the request failed before it reached the server, so that it's safe to send it again."""
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class HttpClient:
+    """A keep-alive `requests.Session` with timeouts, capped exponential backoff retries and a circuit breaker
+    per host.
+
+    Requests with a non-idempotent method, like the bot's DM endpoints, are only retried if they never reached
+    the server. After a read timeout or a 5xx the bot may already have sent the DMs."""
+
+    RETRY_STATUS_CODES = frozenset((502, 503, 504))
+    IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+    def __init__(self, *, timeout=None, retries: int = None, backoff: float = None, backoff_max: float = None,
+                 pool_size: int = None, breaker_threshold: int = None, breaker_reset_timeout: float = None):
+        self.timeout = timeout or settings.DEMOCRACIV_DISCORD_BOT_TIMEOUT
+        self.retries = settings.DEMOCRACIV_DISCORD_BOT_RETRIES if retries is None else retries
+        self.backoff = settings.DEMOCRACIV_DISCORD_BOT_BACKOFF if backoff is None else backoff
+        self.backoff_max = settings.DEMOCRACIV_DISCORD_BOT_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.breaker_threshold = breaker_threshold or settings.DEMOCRACIV_DISCORD_BOT_BREAKER_THRESHOLD
+        self.breaker_reset_timeout = (settings.DEMOCRACIV_DISCORD_BOT_BREAKER_RESET_TIMEOUT
+                                      if breaker_reset_timeout is None else breaker_reset_timeout)
+        self.session = mount_adapter(requests.Session(), pool_size)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(threshold=self.breaker_threshold,
+                                                      reset_timeout=self.breaker_reset_timeout)
+
+            return self._breakers[host]
+
+    def get_backoff(self, attempt: int) -> float:
+        # "full jitter" so that several workers don't retry in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def request(self, method: str, url: str, *, retries: int = None, **kwargs) -> requests.Response:
+        breaker = self.breaker_for(url)
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method.upper() in self.IDEMPOTENT_METHODS
+
+        for attempt in range(retries + 1):
+            if not breaker.allow_request():
+                raise CircuitOpenError(f"Circuit breaker for {urlsplit(url).netloc} is open.")
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                breaker.record_failure()
+
+                if attempt == retries or not (idempotent or is_connect_error(error)):
+                    raise
+            except Exception:
+                # e.g. a ChunkedEncodingError, which still has to end a half-open breaker's trial request
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in self.RETRY_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+
+                breaker.record_failure()
+
+                if attempt == retries or not idempotent:
+                    return response
+
+            time.sleep(self.get_backoff(attempt))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_bot_client = None
+_bot_client_lock = threading.Lock()
+
+
+def bot_client() -> HttpClient:
+    """The process-wide client for every call to the Democraciv Discord Bot."""
+
+    global _bot_client
+
+    with _bot_client_lock:
+        if _bot_client is None:
+            _bot_client = HttpClient()
+
+        return _bot_client
@@ -0,0 +1,326 @@
+"""
+Synthetic economies for load tests and benchmarks, see the seed_economy command. Everything is written in bulk and
+skips the signals: users, organizations and their employees, one account per currency for each of them, the
+guardian permissions the signals would have assigned, and transactions, which are copied into the database with
+COPY on PostgreSQL.
+
+Activity follows a power law like the real economy: a few accounts send and receive most transactions, a few
+people own most organizations. Balances are consistent with the transaction history. A reserve account of the
+generated central bank pays every account an opening deposit that is large enough for its balance to never go
+negative, and every balance is exactly its deposit plus what it received minus what it sent.
+"""
+
+import io
+import math
+import uuid
+import random
+import datetime
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor
+
+import moneyed
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from guardian.models import UserObjectPermission
+
+from . import cents, models
+from .search import CORPORATIONS, USERS, invalidate_index
+from .taskrunner import initialize_process
+
+# accounts in this currency get an equilibrium balance for the Ottoman tax
+OTTOMAN_CURRENCY = "LRA"
+
+# the n-th most active account makes about 1 / n ** ACTIVITY_EXPONENT of the transactions of the most active one
+ACTIVITY_EXPONENT = 1.1
+BATCH_SIZE = 5000
+# transactions per unit of work, a worker keeps one chunk in memory
+CHUNK_SIZE = 100000
+NULL = r'\N'
+COPY_COLUMNS = ('id', 'from_account_id', 'to_account_id', 'amount', 'amount_currency', 'purpose', 'created_on',
+                'updated_on', 'authorized_by_id', 'state')
+
+
+def default_currencies() -> list:
+    return [code for code in (*settings.CURRENCIES, OTTOMAN_CURRENCY) if code in moneyed.CURRENCIES]
+
+
+def cumulative_weights(size: int, exponent: float = ACTIVITY_EXPONENT) -> list:
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+def random_cents(rng, median: int, sigma: float) -> int:
+    return max(1, int(rng.lognormvariate(math.log(median), sigma)))
+
+
+def generate(users: int, transactions: int, *, corporations: int = None, currencies=None, days: int = 90,
+             workers: int = 1, seed: int = 0, prefix: str = "citizen-") -> dict:
+    """Add a synthetic economy to the database and return how many rows of each kind were created. Usernames
+    and organization names start with `prefix`, which must not be in use yet. With more than one worker,
+    transactions are generated and copied by that many processes, on PostgreSQL only."""
+
+    rng = random.Random(seed)
+    currencies = list(currencies or default_currencies())
+    corporations = max(1, users // 20) if corporations is None else corporations
+
+    end = timezone.now().timestamp()
+    start = end - days * 86400
+    opening = datetime.datetime.fromtimestamp(start - 60, tz=datetime.timezone.utc)
+    created = 0
+
+    with transaction.atomic():
+        people = create_users(rng, users, prefix)
+        organizations, central_bank = create_corporations(rng, people, corporations, prefix)
+        employees = create_employees(rng, people, organizations)
+        accounts, reserves = create_accounts(rng, people, organizations, central_bank, currencies, opening)
+        permissions = create_permissions([central_bank, *organizations], employees, [*accounts, *reserves.values()])
+
+    for currency in currencies:
+        pool = [account for account in accounts if account.currency == currency]
+        rng.shuffle(pool)
+        deposits = fund(rng, pool, reserves[currency], opening,
+                        run_chunks(pool, currency, transactions // len(currencies), start, end, workers, seed))
+        created += transactions // len(currencies) + deposits
+
+    models.Account.objects.bulk_update([*accounts, *reserves.values()], ['balance'], batch_size=BATCH_SIZE)
+    invalidate_index(USERS)
+    invalidate_index(CORPORATIONS)
+
+    return {'users': len(people), 'corporations': len(organizations) + 1, 'employees': len(employees),
+            'accounts': len(accounts) + len(reserves), 'permissions': permissions, 'transactions': created}
+
+
+def create_users(rng, count: int, prefix: str) -> list:
+    user_model = get_user_model()
+
+    if user_model.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f"There already are users whose name starts with '{prefix}', pick another prefix.")
+
+    first_discord_id = (user_model.objects.aggregate(Max('discord_id'))['discord_id__max'] or 10 ** 17) + 1
+    password = make_password(None)
+    user_model.objects.bulk_create([
+        user_model(username=f"{prefix}{i}", password=password, discord_id=first_discord_id + i,
+                   discord_dms_enabled=rng.random() < 0.8)
+        for i in range(count)], batch_size=BATCH_SIZE)
+
+    # only PostgreSQL returns the primary keys of bulk inserts
+    return sorted(user_model.objects.filter(username__startswith=prefix).only('pk', 'username'),
+                  key=lambda user: int(user.username[len(prefix):]))
+
+
+def create_corporations(rng, people: list, count: int, prefix: str):
+    abbreviation = ''.join(filter(str.isalnum, prefix)).upper()[:3] or "SYN"
+    owners = rng.choices(people, cum_weights=cumulative_weights(len(people)), k=count)
+    organizations = [models.Corporation(name=f"{prefix}org-{i}", abbreviation=f"{abbreviation}{i:X}",
+                                        owner=owner, description="", is_public_viewable=rng.random() < 0.9)
+                     for i, owner in enumerate(owners, start=1)]
+    central_bank = models.Corporation(name=f"{prefix}central-bank", abbreviation=f"{abbreviation}0",
+                                      owner=people[0], description="",
+                                      organization_type=models.Corporation.OrganizationTypes.GOVERNMENT)
+    models.Corporation.objects.bulk_create([central_bank, *organizations], batch_size=BATCH_SIZE)
+    return organizations, central_bank
+
+
+def create_employees(rng, people: list, organizations: list) -> list:
+    employees = []
+
+    for organization in organizations:
+        size = min(int(rng.paretovariate(1.2)) - 1, 50, len(people) - 1)
+        staff = [person for person in rng.sample(people, size + 1) if person != organization.owner][:size]
+        employees.extend(models.Employee(person=person, corporation=organization) for person in staff)
+
+    models.Employee.objects.bulk_create(employees, batch_size=BATCH_SIZE)
+    return employees
+
+
+def create_accounts(rng, people: list, organizations: list, central_bank, currencies: list, opening):
+    """Accounts are opened at `opening`, the time of their opening deposit, since account histories start at
+    the account's creation."""
+
+    accounts, reserves = [], {}
+
+    for currency in currencies:
+        holders = itertools.chain((('individual_holder', person) for person in people),
+                                  (('corporate_holder', organization) for organization in organizations))
+
+        for field, holder in holders:
+            account = models.Account(iban=uuid.UUID(int=rng.getrandbits(128), version=4),
+                                     name=f"{holder} {currency}", currency=currency,
+                                     balance=cents.to_money(0, currency), created_on=opening,
+                                     **{field: holder})
+
+            if currency == OTTOMAN_CURRENCY:
+                account.ottoman_threshold_variable = cents.to_decimal(random_cents(rng, 10 ** 6, 1.0))
+
+            accounts.append(account)
+
+        reserves[currency] = models.Account(iban=uuid.UUID(int=rng.getrandbits(128), version=4),
+                                            name=f"Reserve {currency}", currency=currency, is_reserve=True,
+                                            balance=cents.to_money(0, currency), corporate_holder=central_bank,
+                                            created_on=opening)
+
+    for account in itertools.chain(accounts, reserves.values()):
+        account.refresh_holder()
+
+    models.Account.objects.bulk_create([*accounts, *reserves.values()], batch_size=BATCH_SIZE)
+    return accounts, reserves
+
+
+def create_permissions(organizations: list, employees: list, accounts: list) -> int:
+    """The object permissions the signals in bank/signals.py would have assigned, returns their number."""
+
+    def permission(model, codename):
+        return Permission.objects.get(content_type=ContentType.objects.get_for_model(model), codename=codename)
+
+    view, change, delete = (permission(models.Account, f'{action}_account') for action in ('view', 'change', 'delete'))
+    owner_of_corporation = [permission(models.Corporation, codename) for codename in (
+        'view_corporation', 'change_corporation', 'delete_corporation', 'manage_employees', 'add_corp_account')]
+    employee_of_corporation = [permission(models.Corporation, codename) for codename in (
+        'view_corporation', 'change_corporation', 'add_corp_account')]
+    account_type, corporation_type = (ContentType.objects.get_for_model(model)
+                                      for model in (models.Account, models.Corporation))
+
+    accounts_of = {}
+
+    for account in accounts:
+        if account.corporate_holder_id:
+            accounts_of.setdefault(account.corporate_holder_id, []).append(account)
+
+    def grants():
+        for account in accounts:
+            for codename in (view, change, delete):
+                yield UserObjectPermission(permission=codename, content_type=account_type,
+                                           object_pk=str(account.pk), user=account.owner)
+
+        for organization in organizations:
+            for codename in owner_of_corporation:
+                yield UserObjectPermission(permission=codename, content_type=corporation_type,
+                                           object_pk=organization.pk, user=organization.owner)
+
+        for employee in employees:
+            for codename in employee_of_corporation:
+                yield UserObjectPermission(permission=codename, content_type=corporation_type,
+                                           object_pk=employee.corporation.pk, user=employee.person)
+
+            for account in accounts_of.get(employee.corporation.pk, ()):
+                yield UserObjectPermission(permission=view, content_type=account_type,
+                                           object_pk=str(account.pk), user=employee.person)
+
+    created = 0
+    rows = grants()
+
+    while True:
+        batch = list(itertools.islice(rows, BATCH_SIZE))
+
+        if not batch:
+            return created
+
+        UserObjectPermission.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+
+
+def run_chunks(pool: list, currency: str, count: int, start: float, end: float, workers: int, seed) -> list:
+    """Generate and insert `count` transactions between the accounts of `pool`. Returns the (net, lowest)
+    balance changes per account of every chunk, in chronological order."""
+
+    ibans = [str(account.pk) for account in pool]
+    authorizers = [account.individual_holder_id or account.corporate_holder.owner_id for account in pool]
+    chunks = max(1, math.ceil(count / CHUNK_SIZE), workers)
+    window = (end - start) / chunks
+    jobs = [(ibans, authorizers, currency, count // chunks + (i < count % chunks), start + i * window,
+             start + (i + 1) * window, f"{seed}-{currency}-{i}") for i in range(chunks)]
+
+    if workers <= 1 or connection.vendor != 'postgresql':
+        return [generate_chunk(*job) for job in jobs]
+
+    # forked workers mustn't share the parent's connection
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_process) as executor:
+        return list(executor.map(generate_chunk, *zip(*jobs)))
+
+
+def generate_chunk(ibans, authorizers, currency, count, start, end, seed):
+    """Insert `count` transactions between `start` and `end`. Returns the net balance change of every account
+    involved, and the lowest it was at any point of the chunk."""
+
+    rng = random.Random(seed)
+    weights = cumulative_weights(len(ibans))
+    senders = rng.choices(range(len(ibans)), cum_weights=weights, k=count)
+    recipients = rng.choices(range(len(ibans)), cum_weights=weights, k=count)
+    net, lowest, rows = {}, {}, []
+
+    for created_on, sender, recipient in zip(sorted(rng.uniform(start, end) for _ in range(count)), senders,
+                                             recipients):
+        if sender == recipient:
+            recipient = (recipient + 1) % len(ibans)
+
+        amount = random_cents(rng, 2000, 1.4)
+        net[sender] = net.get(sender, 0) - amount
+        net[recipient] = net.get(recipient, 0) + amount
+        lowest[sender] = min(lowest.get(sender, 0), net[sender])
+        rows.append((uuid.UUID(int=rng.getrandbits(128), version=4), ibans[sender], ibans[recipient], amount,
+                     datetime.datetime.fromtimestamp(created_on, tz=datetime.timezone.utc), authorizers[sender]))
+
+    insert_transactions(rows, currency)
+    return net, lowest
+
+
+def fund(rng, pool: list, reserve, opening, chunks: list) -> int:
+    """Pay every account of `pool` an opening deposit out of `reserve`, enough for its balance to never go
+    negative in `chunks`, and set all balances. Returns the number of deposits."""
+
+    balances = [0] * len(pool)
+    lowest = [0] * len(pool)
+
+    for net, chunk_lowest in chunks:
+        for index, low in chunk_lowest.items():
+            lowest[index] = min(lowest[index], balances[index] + low)
+
+        for index, change in net.items():
+            balances[index] += change
+
+    rows, paid = [], 0
+
+    for index, account in enumerate(pool):
+        deposit = random_cents(rng, 50000, 1.0) - lowest[index]
+        account.balance = cents.to_money(balances[index] + deposit, account.currency)
+        paid += deposit
+        rows.append((uuid.UUID(int=rng.getrandbits(128), version=4), str(reserve.pk), str(account.pk), deposit,
+                     opening, reserve.corporate_holder.owner_id))
+
+    # the reserve's own opening balance is the only one without a transaction, it keeps as much as it paid out
+    reserve.balance = cents.to_money(paid, reserve.currency)
+    insert_transactions(rows, reserve.currency)
+    return len(rows)
+
+
+def insert_transactions(rows: list, currency: str):
+    """Insert (id, from_account_id, to_account_id, amount in cents, created_on, authorized_by_id) rows."""
+
+    if connection.vendor != 'postgresql':
+        models.Transaction.objects.bulk_create([
+            models.Transaction(id=id, from_account_id=sender, to_account_id=recipient, authorized_by_id=authorizer,
+                               amount=cents.to_money(amount, currency), created_on=created_on)
+            for id, sender, recipient, amount, created_on, authorizer in rows], batch_size=BATCH_SIZE)
+        return
+
+    buffer = io.StringIO()
+
+    for id, sender, recipient, amount, created_on, authorizer in rows:
+        buffer.write('\t'.join((str(id), sender, recipient, str(cents.to_decimal(amount)), currency, '',
+                                created_on.isoformat(), created_on.isoformat(),
+                                NULL if authorizer is None else str(authorizer),
+                                models.Transaction.TransactionState.SUCCESSFUL)) + '\n')
+
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {models.Transaction._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN",
+                           buffer)
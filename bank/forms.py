@@ -13,7 +13,8 @@ from djmoney.settings import CURRENCY_CHOICES
 from guardian.shortcuts import get_objects_for_user
 
 from . import models, util
-from .tasks import discord_dm_notification
+from .notifications import queue_dm
+from .search import search_users
 
 
 def account_exists(value):
@@ -23,6 +24,12 @@ def account_exists(value):
 
 def user_exists(value):
     if not get_user_model().objects.filter(username=value).exists():
+        suggestions = [user.username for user in search_users(value, limit=3)]
+
+        if suggestions:
+            raise forms.ValidationError(f"There's no user with that username. Did you mean "
+                                        f"{', '.join(suggestions)}?")
+
         raise forms.ValidationError("There's no user with that username.")
 
 
@@ -119,7 +126,7 @@ class UserRegisterForm(UserCreationForm):
 class UserUpdateForm(forms.ModelForm):
     class Meta:
         model = get_user_model()
-        fields = ['username', 'discord_dms_enabled']
+        fields = ['username', 'discord_dms_enabled', 'notification_mode']
 
 
 class EmployeeInvitationForm(forms.ModelForm):
@@ -206,4 +213,4 @@ class PasswordResetFormWithoutEmail(forms.Form):
                                 url=url)
 
         payload = {'targets': [user.discord_id], 'message': '', 'embed': embed}
-        discord_dm_notification(payload)
+        queue_dm(payload, priority=models.QueuedTask.Priorities.HIGH)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import httpx
+import requests
+
+from django.conf import settings
+
+from .clients import bot_client
+
+logger = logging.getLogger(__name__)
+
+# these describe the connection to us, not the one to the bot
+HOP_BY_HOP_HEADERS = frozenset(('host', 'content-length', 'connection', 'keep-alive', 'transfer-encoding'))
+
+
+def filter_headers(headers: dict) -> dict:
+    return {key: value for key, value in headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+
+
+class WebhookForwarder:
+    """Forwards webhook events to the bot from a bounded in-process queue, so that the request that delivered
+    the event can be answered right away. The queue needs a long-lived event loop, i.e. an ASGI server. Under WSGI,
+    every async view gets an event loop that is closed with its request, so events have to be `forward`ed right
+    away instead."""
+
+    def __init__(self, url: str, *, queue_size: int, workers: int):
+        self.url = url
+        self.queue_size = queue_size
+        self.workers = workers
+        self.queue = None
+        self.client = None
+        self.forwarded = 0
+        self.failed = 0
+        self.dropped = 0
+        self._loop = None
+        self._tasks = []
+
+    def ensure_started(self):
+        loop = asyncio.get_running_loop()
+
+        if self._loop is loop:
+            return
+
+        # the queue and the client's connection pool are bound to the loop they were created on
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(settings.DEMOCRACIV_DISCORD_BOT_TIMEOUT[1],
+                                                              connect=settings.DEMOCRACIV_DISCORD_BOT_TIMEOUT[0]),
+                                        limits=httpx.Limits(max_connections=self.workers,
+                                                            max_keepalive_connections=self.workers))
+        self._tasks = [loop.create_task(self.worker()) for _ in range(self.workers)]
+        self._loop = loop
+
+    def forward(self, headers: dict, body: bytes) -> bool:
+        """Forward an event and wait for the bot to take it."""
+
+        try:
+            response = bot_client().post(self.url, headers=filter_headers(headers), data=body)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.failed += 1
+            logger.warning("Could not forward webhook event to %s: %s", self.url, e)
+            return False
+
+        self.forwarded += 1
+        return True
+
+    def submit(self, headers: dict, body: bytes) -> bool:
+        self.ensure_started()
+        headers = filter_headers(headers)
+
+        try:
+            self.queue.put_nowait((headers, body))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Webhook queue is full, dropped event for %s", self.url)
+            return False
+
+        return True
+
+    async def worker(self):
+        while True:
+            headers, body = await self.queue.get()
+
+            try:
+                response = await self.client.post(self.url, headers=headers, content=body)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                self.failed += 1
+                logger.warning("Could not forward webhook event to %s: %s", self.url, e)
+            else:
+                self.forwarded += 1
+            finally:
+                self.queue.task_done()
+
+    async def join(self):
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+        if self.client is not None:
+            await self.client.aclose()
+
+        self._loop, self._tasks = None, []
+
+
+twitch_forwarder = WebhookForwarder(settings.DEMOCRACIV_DISCORD_BOT_API_TWITCH_CALLBACK,
+                                    queue_size=settings.DEMOCRACIV_DISCORD_BOT_WEBHOOK_QUEUE_SIZE,
+                                    workers=settings.DEMOCRACIV_DISCORD_BOT_WEBHOOK_WORKERS)
@@ -0,0 +1,57 @@
+import statistics
+
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+
+@contextmanager
+def scratch_database(keepdb=False):
+    """Run a benchmark against a throwaway test database instead of the configured one."""
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+
+    try:
+        yield
+    finally:
+        teardown_databases(config, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+@contextmanager
+def capture_queries():
+    """Capture the queries of all database connections, replicas included. Yields a list that holds the
+    queries once the block is done."""
+
+    captured = []
+
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        yield captured
+
+    for context in contexts:
+        captured.extend(context.captured_queries)
+
+
+def percentile(timings, percent):
+    timings = sorted(timings)
+
+    if not timings:
+        return 0.0
+
+    return timings[min(len(timings) - 1, max(0, round(len(timings) * percent / 100) - 1))]
+
+
+def summarize(timings, elapsed=None):
+    result = {'requests': len(timings),
+              'mean_ms': statistics.mean(timings) * 1000 if timings else 0.0,
+              'p50_ms': percentile(timings, 50) * 1000,
+              'p99_ms': percentile(timings, 99) * 1000}
+
+    if elapsed is not None:
+        result['per_second'] = len(timings) / elapsed if elapsed else 0.0
+
+    return result
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank import archive, partitions
+
+
+class Command(BaseCommand):
+    help = "Move transactions of months before a cutoff into compressed archive files, one per currency and month. " \
+           "They stay visible in account histories and exports."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=datetime.date.fromisoformat, required=True, metavar="YYYY-MM-DD",
+                            help="Archive all months before the month of this date.")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Amount of transactions to delete per database transaction.")
+        parser.add_argument('--detach', action='store_true',
+                            help="Detach the emptied partitions afterwards. PostgreSQL only.")
+
+    def handle(self, *args, **options):
+        try:
+            summaries = archive.archive_before(options['before'], batch_size=options['batch_size'])
+            detached = partitions.detach_partitions(options['before']) if options['detach'] else []
+        except (ValueError, archive.ArchiveVerificationError) as e:
+            raise CommandError(str(e))
+
+        for summary in summaries:
+            self.stdout.write(f"{summary['file']}: {summary['rows']} transactions totalling {summary['total']} "
+                              f"archived, {summary['deleted']} deleted from the database")
+
+        for name in detached:
+            self.stdout.write(f"Detached {name}")
+
+        self.stdout.write(f"Archived {len(summaries)} months.")
@@ -0,0 +1,200 @@
+import json
+import time
+import random
+import logging
+import platform
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from bank import economy, models
+from ._benchmark import capture_queries, scratch_database, summarize
+
+# a scenario got slower or needs more queries or memory than the baseline by more than this factor
+DEFAULT_TOLERANCE = 0.2
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic economy in a scratch database and time the key paths of the bank: wall clock, " \
+           "database queries and peak memory per request. Writes the results as JSON, and compares them with " \
+           "an earlier run with --compare."
+
+    SCENARIOS = ('send_transaction', 'account_history', 'account_history_last_page', 'export_csv', 'statistics',
+                 'currencies', 'ottoman_dry_run', 'discord_user', 'discord_accounts', 'default_account')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--transactions', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per scenario.")
+        parser.add_argument('--scenario', action='append', choices=self.SCENARIOS,
+                            help="Only run this scenario, can be given more than once.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random economy.")
+        parser.add_argument('--output', help="Write the results to this file instead of stdout.")
+        parser.add_argument('--compare', help="Results of an earlier run to flag regressions against.")
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+
+    def handle(self, *args, **options):
+        # failed requests are reported as errors, their tracebacks would drown the results
+        logging.disable(logging.ERROR)
+        self.rng = random.Random(options['seed'])
+
+        with scratch_database():
+            started = time.perf_counter()
+            self.seed(options['users'], options['transactions'], options['seed'])
+            seeded = time.perf_counter() - started
+
+            results = {name: self.measure(getattr(self, f"scenario_{name}"), options['repeat'])
+                       for name in options['scenario'] or self.SCENARIOS}
+
+            report = {
+                'meta': {
+                    'created_on': timezone.now().isoformat(),
+                    'users': options['users'],
+                    'transactions': options['transactions'],
+                    'repeat': options['repeat'],
+                    'seed_seconds': seeded,
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                },
+                'results': results,
+            }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = compare(json.load(f), report, options['tolerance'])
+
+            for regression in regressions:
+                self.stderr.write(f"Regression: {regression}")
+
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}.")
+
+    def seed(self, users, transactions, seed):
+        admin = get_user_model().objects.create(username="benchmark-admin", is_staff=True, is_superuser=True)
+        self.token = Token.objects.create(user=admin).key
+        economy.generate(users, transactions, seed=seed, prefix="user-")
+
+        self.currency = settings.CURRENCIES[0]
+        accounts = models.Account.objects.filter(currency=self.currency, individual_holder__isnull=False) \
+            .select_related('individual_holder')
+        self.accounts = list(accounts)
+        # the most active account, its history is the longest
+        self.busiest = accounts.annotate(sent=Count('transactions_from')).order_by('-sent').first()
+
+        # the history scenarios would time empty pages otherwise
+        export = self.owner().get(reverse('bank:account-detail', args=[self.busiest.pk]), {'_export': 'csv'})
+
+        if not self.ok(export) or len(export.content.decode().splitlines()) < 2:
+            raise CommandError(f"The history of account {self.busiest.pk} is empty, the seeded economy can't be "
+                               f"benchmarked.")
+
+    def measure(self, scenario, repeat) -> dict:
+        scenario()  # warm up caches and lazy imports, the first request isn't representative
+        timings, errors = [], 0
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            errors += not scenario()
+            timings.append(time.perf_counter() - started)
+
+        # queries and memory of one more run, tracing would distort the timings
+        caches['default'].clear()
+        tracemalloc.start()
+
+        try:
+            with capture_queries() as queries:
+                scenario()
+
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {**summarize(timings), 'errors': errors, 'queries': len(queries), 'peak_memory_kb': peak / 1024}
+
+    def api(self):
+        return Client(raise_request_exception=False, HTTP_AUTHORIZATION=f"Token {self.token}")
+
+    def owner(self):
+        client = Client(raise_request_exception=False)
+        client.force_login(self.busiest.individual_holder)
+        return client
+
+    def ok(self, response) -> bool:
+        return response.status_code < 400
+
+    def scenario_send_transaction(self):
+        sender, recipient = self.rng.sample(self.accounts, 2)
+        return self.ok(self.api().post("/api/v1/send/", data={
+            'discord_id': sender.individual_holder.discord_id, 'from_account': str(sender.pk),
+            'to_account': str(recipient.pk), 'amount': '0.01'}, content_type="application/json"))
+
+    def scenario_account_history(self):
+        return self.ok(self.owner().get(reverse('bank:account-detail', args=[self.busiest.pk])))
+
+    def scenario_account_history_last_page(self):
+        return self.ok(self.owner().get(reverse('bank:account-detail', args=[self.busiest.pk]), {'page': 50}))
+
+    def scenario_export_csv(self):
+        return self.ok(self.owner().get(reverse('bank:account-detail', args=[self.busiest.pk]), {'_export': 'csv'}))
+
+    def scenario_statistics(self):
+        return self.ok(self.api().get("/api/v1/statistics/"))
+
+    def scenario_currencies(self):
+        return self.ok(self.api().get("/api/v1/currencies/"))
+
+    def scenario_ottoman_dry_run(self):
+        return self.ok(self.api().get("/api/v1/ottoman/apply/"))
+
+    def scenario_discord_user(self):
+        return self.ok(self.api().get(f"/api/v1/discord_user/{self.random_discord_id()}/"))
+
+    def scenario_discord_accounts(self):
+        return self.ok(self.api().get(f"/api/v1/accounts/{self.random_discord_id()}/"))
+
+    def scenario_default_account(self):
+        return self.ok(self.api().get("/api/v1/default_account/",
+                                      {'discord_id': self.random_discord_id(), 'currency': self.currency}))
+
+    def random_discord_id(self):
+        return self.rng.choice(self.accounts).individual_holder.discord_id
+
+
+def compare(baseline: dict, report: dict, tolerance: float) -> list:
+    """Describe every scenario that got slower, or needs more queries or memory than in `baseline`."""
+
+    regressions = []
+
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+
+        if before is None:
+            continue
+
+        for metric in ('p50_ms', 'queries', 'peak_memory_kb'):
+            if result[metric] > before[metric] * (1 + tolerance) and result[metric] - before[metric] >= 1:
+                regressions.append(f"{name} {metric}: {before[metric]:.2f} -> {result[metric]:.2f}")
+
+        if result['errors'] > before.get('errors', 0):
+            regressions.append(f"{name} errors: {before.get('errors', 0)} -> {result['errors']}")
+
+    return regressions
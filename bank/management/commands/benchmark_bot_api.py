@@ -0,0 +1,123 @@
+import time
+import asyncio
+import logging
+import random
+
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from djmoney.money import Money
+from rest_framework.authtoken.models import Token
+
+from bank import models
+from ._benchmark import scratch_database, summarize
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec and p99 latency of the bot endpoints as synchronous DRF views (WSGI) and as " \
+           "async views (ASGI) under concurrent load, against a scratch database."
+
+    ENDPOINTS = ('discord_user', 'accounts', 'default_account', 'currencies', 'send')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and deployment.")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--users', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # failed requests are counted, their tracebacks would drown the results
+        logging.disable(logging.ERROR)
+
+        with scratch_database():
+            token = self.seed(options['users'])
+
+            for endpoint in self.ENDPOINTS:
+                wsgi = self.run_wsgi(endpoint, token, options['requests'], options['concurrency'], options['users'])
+                asgi = asyncio.run(self.run_asgi(endpoint, token, options['requests'], options['concurrency'],
+                                                 options['users']))
+                self.report(endpoint, "wsgi", wsgi)
+                self.report(endpoint, "asgi", asgi)
+
+    def seed(self, users):
+        bot = get_user_model().objects.create(username="bot", is_staff=True)
+
+        for i in range(1, users + 1):
+            user = get_user_model().objects.create(username=f"user-{i}", discord_id=i)
+            models.Account.objects.create(individual_holder=user, currency="USD", balance=Money(10 ** 6, 'USD'))
+
+        return Token.objects.create(user=bot).key
+
+    def make_request(self, endpoint, users):
+        discord_id = random.randint(1, users)
+
+        if endpoint == 'discord_user':
+            return 'get', f"discord_user/{discord_id}/", None
+        elif endpoint == 'accounts':
+            return 'get', f"accounts/{discord_id}/", None
+        elif endpoint == 'default_account':
+            return 'get', f"default_account/?discord_id={discord_id}&currency=USD", None
+        elif endpoint == 'currencies':
+            return 'get', "currencies/", None
+
+        to_id = discord_id % users + 1
+        accounts = dict(models.Account.objects.filter(individual_holder__discord_id__in=[discord_id, to_id])
+                        .values_list('individual_holder__discord_id', 'iban'))
+        return 'post', "send/", {'discord_id': discord_id, 'from_account': str(accounts[discord_id]),
+                                 'to_account': str(accounts[to_id]), 'amount': '1'}
+
+    def run_wsgi(self, endpoint, token, requests, concurrency, users):
+        calls = [self.make_request(endpoint, users) for _ in range(requests)]
+        timings, errors = [], []
+
+        def call(request):
+            method, path, data = request
+            client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f"Token {token}")
+            started = time.perf_counter()
+            response = getattr(client, method)(f"/api/v1/{path}", data=data, content_type="application/json") \
+                if data else client.get(f"/api/v1/{path}")
+            timings.append(time.perf_counter() - started)
+
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(call, calls))
+
+        return summarize(timings, time.perf_counter() - started), len(errors)
+
+    async def run_asgi(self, endpoint, token, requests, concurrency, users):
+        calls = await sync_to_async(lambda: [self.make_request(endpoint, users) for _ in range(requests)])()
+        semaphore = asyncio.Semaphore(concurrency)
+        timings, errors = [], []
+
+        async def call(request):
+            method, path, data = request
+
+            async with semaphore:
+                client = AsyncClient(raise_request_exception=False)
+                started = time.perf_counter()
+
+                if data:
+                    response = await client.post(f"/api/v1/async/{path}", data=data,
+                                                 content_type="application/json", authorization=f"Token {token}")
+                else:
+                    response = await client.get(f"/api/v1/async/{path}", authorization=f"Token {token}")
+
+                timings.append(time.perf_counter() - started)
+
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call(request) for request in calls))
+        return summarize(timings, time.perf_counter() - started), len(errors)
+
+    def report(self, endpoint, deployment, result):
+        summary, errors = result
+        self.stdout.write(f"{endpoint:>16} {deployment}: {summary['per_second']:8.1f} req/s, "
+                          f"p50 {summary['p50_ms']:7.2f}ms, p99 {summary['p99_ms']:7.2f}ms, {errors} errors")
@@ -0,0 +1,80 @@
+import time
+import random
+import statistics
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from djmoney.money import Money
+
+from bank import models
+from ._benchmark import scratch_database
+
+
+class Command(BaseCommand):
+    help = "Measure how long the transfer path holds its database transaction open, with the delivery of its " \
+           "notifications scheduled after the commit versus inside of it, against a scratch database. The " \
+           "notifications themselves are always written inside of it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=200, help="Amount of transfers per mode.")
+        parser.add_argument('--employees', type=int, default=10,
+                            help="Amount of employees of the receiving organization that get a DM.")
+
+    def handle(self, *args, **options):
+        # keep a reference to the real on_commit, the "inline" mode replaces it
+        self.commit_hook = transaction.on_commit
+
+        with scratch_database():
+            sender, recipient = self.setup_economy(options['employees'])
+            deferred = self.run(sender, recipient, options['transfers'])
+
+            with mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+                inline = self.run(sender, recipient, options['transfers'])
+
+        self.report("inline", inline)
+        self.report("deferred", deferred)
+        saved = 1 - statistics.mean(deferred) / statistics.mean(inline)
+        self.stdout.write(f"Scheduling delivery after the commit shortens the mean lock hold time by {saved:.0%}.")
+
+    def setup_economy(self, employees):
+        user_model = get_user_model()
+
+        def make_user(name):
+            return user_model.objects.create(username=f"bench-{name}", discord_id=random.randint(10 ** 17, 10 ** 18))
+
+        owner = make_user("owner")
+        corporation = models.Corporation.objects.create(name="Benchmark", abbreviation="BENCH", owner=owner)
+
+        for i in range(employees):
+            models.Employee.objects.create(corporation=corporation, person=make_user(f"employee-{i}"))
+
+        sender = models.Account.objects.create(individual_holder=make_user("sender"), balance=Money(10 ** 9, 'USD'))
+        recipient = models.Account.objects.create(corporate_holder=corporation)
+        return sender, recipient
+
+    def run(self, sender, recipient, transfers):
+        timings = []
+
+        for _ in range(transfers):
+            marker = {}
+            started = time.perf_counter()
+
+            with transaction.atomic():
+                # registered first, so it runs before any other callback once the locks are released
+                self.commit_hook(lambda: marker.setdefault('committed', time.perf_counter()))
+                models.Transaction.objects.create(from_account=sender, to_account=recipient,
+                                                  amount=Money(1, 'USD'))
+
+            timings.append(marker['committed'] - started)
+
+        return timings
+
+    def report(self, mode, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f"{mode:>8}: mean {statistics.mean(timings) * 1000:.2f}ms, "
+                          f"median {statistics.median(timings) * 1000:.2f}ms, p95 {p95 * 1000:.2f}ms "
+                          f"over {len(timings)} transfers")
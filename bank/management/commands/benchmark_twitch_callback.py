@@ -0,0 +1,103 @@
+import json
+import time
+import asyncio
+import statistics
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory
+
+from bank import views
+from bank.clients import HttpClient
+from bank.forwarding import WebhookForwarder
+
+
+class SlowBotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.delay)
+        self.server.received += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Compare how long a worker is tied up by a Twitch webhook when it is forwarded to a slow bot " \
+           "synchronously, versus through the async view and its forwarding queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=50)
+        parser.add_argument('--bot-delay', type=float, default=0.2,
+                            help="Seconds the stub bot takes to answer every forwarded event.")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SlowBotHandler)
+        server.daemon_threads = True
+        server.delay = options['bot_delay']
+        server.received = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/twitch/callback"
+        body = json.dumps({'subscription': {'type': 'stream.online'}, 'event': {}})
+
+        try:
+            blocking = self.run_blocking(url, body, options['events'])
+            forwarder = WebhookForwarder(url, queue_size=options['events'], workers=4)
+            queued, drained = asyncio.run(self.run_async(forwarder, body, options['events']))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.report("blocking", blocking)
+        self.report("async", queued)
+        self.stdout.write(f"The async view forwarded {forwarder.forwarded} of {options['events']} events in the "
+                          f"background, the queue was drained after {drained:.2f}s.")
+
+    def run_blocking(self, url, body, events):
+        # what the WSGI view used to do: forward to the bot, then parse the body and answer Twitch
+        client = HttpClient(retries=0)
+        timings = []
+
+        for _ in range(events):
+            started = time.perf_counter()
+            client.post(url, data=body, headers={'Content-Type': 'application/json'})
+            json.loads(body)
+            timings.append(time.perf_counter() - started)
+
+        client.close()
+        return timings
+
+    async def run_async(self, forwarder, body, events):
+        factory = AsyncRequestFactory()
+        original, views.twitch_forwarder = views.twitch_forwarder, forwarder
+        timings = []
+
+        try:
+            started_all = time.perf_counter()
+
+            for _ in range(events):
+                request = factory.post("/twitch/callback", data=body, content_type="application/json")
+                started = time.perf_counter()
+                await views.bot_twitch_callback(request)
+                timings.append(time.perf_counter() - started)
+
+            await forwarder.join()
+            drained = time.perf_counter() - started_all
+            await forwarder.close()
+        finally:
+            views.twitch_forwarder = original
+
+        return timings, drained
+
+    def report(self, mode, timings):
+        timings = sorted(timings)
+        p99 = timings[max(int(len(timings) * 0.99) - 1, 0)]
+        self.stdout.write(f"{mode:>8}: worker busy for mean {statistics.mean(timings) * 1000:.2f}ms, "
+                          f"p99 {p99 * 1000:.2f}ms per event, {sum(timings):.2f}s in total")
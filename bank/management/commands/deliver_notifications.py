@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank import notifications
+
+
+class Command(BaseCommand):
+    help = "Deliver pending Discord DM notifications from the outbox to the Democraciv Discord Bot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Amount of notifications to claim per batch.")
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the outbox once and exit instead of polling forever.")
+
+    def handle(self, *args, **options):
+        while True:
+            totals = notifications.deliver_pending(batch_size=options['batch_size'])
+
+            if totals['notifications']:
+                stats = notifications.outbox_statistics()
+                self.stdout.write(f"Delivered {totals['notifications'] - totals['failed']} notifications "
+                                  f"in {totals['messages']} DMs ({totals['per_second']:.1f}/s), "
+                                  f"{totals['failed']} failed. Backlog: {stats['pending']} pending, "
+                                  f"oldest is {stats['oldest_pending_seconds']:.0f}s old.")
+
+            if options['once']:
+                return
+
+            if not totals['notifications'] or totals['failed']:
+                time.sleep(options['interval'])
@@ -0,0 +1,241 @@
+import json
+import time
+import random
+import logging
+
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from bank import economy, models
+from ._benchmark import percentile, scratch_database
+
+PREFIX = "load-"
+OPERATIONS = ('balance', 'default_account', 'send')
+
+
+def parse_mix(mix: str) -> dict:
+    """'balance=60,send=40' as {'balance': 60.0, 'send': 40.0}."""
+
+    weights = {}
+
+    for part in filter(None, mix.split(',')):
+        operation, _, weight = part.partition('=')
+
+        if operation not in OPERATIONS:
+            raise CommandError(f"Unknown operation '{operation}' in --mix, pick from {', '.join(OPERATIONS)}.")
+
+        try:
+            weights[operation] = float(weight)
+        except ValueError:
+            raise CommandError(f"The weight of '{operation}' in --mix must be a number.")
+
+    if not weights or sum(weights.values()) <= 0:
+        raise CommandError("--mix needs at least one operation with a positive weight.")
+
+    return weights
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    """Throughput, error rate and latency percentiles of (latency, status) pairs."""
+
+    timings = [latency for latency, _ in results]
+    errors = {}
+
+    for _, status in results:
+        if status >= 400:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    return {'requests': len(results),
+            'per_second': len(results) / elapsed if elapsed else 0.0,
+            'errors': errors,
+            'error_rate': sum(errors.values()) / len(results) if results else 0.0,
+            **{f'p{percent}_ms': percentile(timings, percent) * 1000 for percent in (50, 90, 95, 99)},
+            'max_ms': max(timings, default=0.0) * 1000}
+
+
+class Command(BaseCommand):
+    help = "Load test the Discord bot's API endpoints against a scratch database: many concurrent bot clients, " \
+           "each with its own API token, send a weighted mix of balance checks, default account lookups and " \
+           "transfers for --duration seconds. Reports throughput, error rate and latency percentiles, and " \
+           "checks that the balances of the accounts that sent or received money add up afterwards."
+
+    SCENARIOS = {
+        'steady': "transfers between random accounts",
+        'hot_recipients': "every transfer goes to one of --hot-accounts accounts, like an event's shop",
+        'hot_senders': "every transfer comes from one of --hot-accounts accounts, like an event's payouts",
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=self.SCENARIOS, default='steady')
+        parser.add_argument('--mix', default="balance=60,default_account=25,send=15",
+                            help="Relative weights of the operations, " + ", ".join(OPERATIONS) + ".")
+        parser.add_argument('--clients', type=int, default=32, help="Concurrent bot clients.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to send requests for.")
+        parser.add_argument('--think-time', type=float, default=0,
+                            help="Mean pause of a client between its requests, in milliseconds.")
+        parser.add_argument('--hot-accounts', type=int, default=3)
+        parser.add_argument('--amount', default="0.01", help="Amount of every transfer.")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--transactions', type=int, default=20000, help="Transaction history to seed.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Also write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        # failed requests are counted, their tracebacks would drown the results
+        logging.disable(logging.ERROR)
+        weights = parse_mix(options['mix'])
+        self.operations, self.cum_weights = list(weights), []
+
+        for weight in weights.values():
+            self.cum_weights.append((self.cum_weights[-1] if self.cum_weights else 0) + weight)
+
+        self.scenario, self.amount = options['scenario'], Decimal(options['amount'])
+
+        with scratch_database():
+            tokens = self.seed(options)
+            self.started_on = timezone.now()
+            started = time.perf_counter()
+            deadline = started + options['duration']
+
+            with ThreadPoolExecutor(max_workers=len(tokens)) as executor:
+                per_client = list(executor.map(
+                    lambda args: self.run_client(*args, deadline, options['think_time'] / 1000),
+                    [(token, random.Random(options['seed'] + i)) for i, token in enumerate(tokens)]))
+
+            elapsed = time.perf_counter() - started
+            inconsistent = self.check_balances()
+
+        results = [result for requests in per_client for result in requests]
+        report = {
+            'meta': {'scenario': self.scenario, 'mix': weights, 'clients': len(tokens),
+                     'duration_seconds': elapsed, 'think_time_ms': options['think_time'],
+                     'hot_accounts': len(self.hot), 'users': options['users'], 'database': connection.vendor},
+            'total': summarize([(latency, status) for _, latency, status in results], elapsed),
+            'operations': {operation: summarize([(latency, status) for name, latency, status in results
+                                                 if name == operation], elapsed)
+                           for operation in self.operations},
+            'inconsistent_balances': inconsistent,
+        }
+
+        self.report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    def seed(self, options) -> list:
+        economy.generate(options['users'], options['transactions'], seed=options['seed'], prefix=PREFIX)
+        individual = models.Account.objects.filter(individual_holder__username__startswith=PREFIX)
+        # one account per user and currency, the bot looks those up as the users' defaults
+        individual.update(is_default_for_currency=True)
+
+        self.accounts = list(individual.values_list('iban', 'individual_holder__discord_id', 'currency'))
+        self.by_currency = {}
+
+        for account in self.accounts:
+            self.by_currency.setdefault(account[2], []).append(account)
+
+        # the richest accounts, so that hot senders don't run out of money halfway through
+        richest = set(individual.order_by('-balance').values_list('iban', flat=True)[:options['hot_accounts']])
+        self.hot = [account for account in self.accounts if account[0] in richest]
+        self.balances = dict(individual.values_list('iban', 'balance'))
+
+        bots = [get_user_model().objects.create(username=f"{PREFIX}bot-{i}", is_staff=True)
+                for i in range(options['clients'])]
+        return [Token.objects.create(user=bot).key for bot in bots]
+
+    def make_request(self, operation, rng):
+        iban, discord_id, currency = rng.choice(self.accounts)
+
+        if operation == 'balance':
+            return 'get', f"/api/v1/accounts/{discord_id}/", None
+        elif operation == 'default_account':
+            return 'get', "/api/v1/default_account/", {'discord_id': discord_id, 'currency': currency}
+
+        sender, recipient = rng.sample(self.by_currency[currency], 2)
+
+        if self.scenario == 'hot_recipients' and self.hot:
+            recipient = rng.choice(self.hot)
+            sender = rng.choice([account for account in self.by_currency[recipient[2]] if account != recipient])
+        elif self.scenario == 'hot_senders' and self.hot:
+            sender = rng.choice(self.hot)
+            recipient = rng.choice([account for account in self.by_currency[sender[2]] if account != sender])
+
+        return 'post', "/api/v1/send/", {'discord_id': sender[1], 'from_account': str(sender[0]),
+                                         'to_account': str(recipient[0]), 'amount': str(self.amount)}
+
+    def run_client(self, token, rng, deadline, think_time):
+        """Send requests until the deadline, one at a time. Returns the operation, latency and status of every
+        request."""
+
+        client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f"Token {token}")
+        requests = []
+
+        try:
+            while time.perf_counter() < deadline:
+                operation = rng.choices(self.operations, cum_weights=self.cum_weights)[0]
+                method, path, data = self.make_request(operation, rng)
+                started = time.perf_counter()
+
+                if method == 'post':
+                    response = client.post(path, data=data, content_type="application/json")
+                else:
+                    response = client.get(path, data)
+
+                requests.append((operation, time.perf_counter() - started, response.status_code))
+
+                if think_time:
+                    time.sleep(rng.expovariate(1 / think_time))
+        finally:
+            # the scratch database can't be dropped while this thread's connections are open
+            connections.close_all()
+
+        return requests
+
+    def check_balances(self) -> list:
+        """The accounts whose balance changed by something else than the transfers that were saved during the
+        test, which happens when concurrent transfers overwrite each other's balance updates."""
+
+        expected = {}
+        transfers = models.Transaction.objects.filter(created_on__gte=self.started_on)
+
+        for sender, recipient, amount in transfers.values_list('from_account', 'to_account', 'amount'):
+            expected[sender] = expected.get(sender, 0) - Decimal(str(amount))
+            expected[recipient] = expected.get(recipient, 0) + Decimal(str(amount))
+
+        balances = dict(models.Account.objects.filter(iban__in=list(expected)).values_list('iban', 'balance'))
+        inconsistent = []
+
+        for account, balance in balances.items():
+            change = Decimal(str(balance)) - Decimal(str(self.balances[account]))
+
+            if abs(change - expected[account]) >= Decimal("0.01"):
+                inconsistent.append({'iban': str(account), 'expected_change': str(expected[account]),
+                                     'change': str(change)})
+
+        return inconsistent
+
+    def report(self, report):
+        meta = report['meta']
+        self.stdout.write(f"{meta['scenario']} with {meta['clients']} clients for {meta['duration_seconds']:.1f}s "
+                          f"on {meta['database']}")
+
+        for name, result in [*report['operations'].items(), ('total', report['total'])]:
+            self.stdout.write(f"{name:>16}: {result['requests']:7} requests, {result['per_second']:8.1f} req/s, "
+                              f"{result['error_rate']:6.1%} errors, p50 {result['p50_ms']:7.2f}ms, "
+                              f"p95 {result['p95_ms']:7.2f}ms, p99 {result['p99_ms']:7.2f}ms, "
+                              f"max {result['max_ms']:7.2f}ms")
+
+        if report['total']['errors']:
+            self.stdout.write(f"Errors by status: {report['total']['errors']}")
+
+        if report['inconsistent_balances']:
+            self.stderr.write(f"{len(report['inconsistent_balances'])} account(s) lost balance updates under "
+                              f"contention: {report['inconsistent_balances'][:5]}")
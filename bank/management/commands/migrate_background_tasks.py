@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bank import notifications
+
+# left behind by django-background-tasks, which `run_tasks` replaced
+TABLE = 'background_task'
+DM_TASK = 'bank.tasks.discord_dm_notification'
+
+
+class Command(BaseCommand):
+    help = "Move the DMs that still wait in the queue of django-background-tasks into the notification outbox, " \
+           "where `run_tasks` delivers them. Run it once after upgrading from django-background-tasks."
+
+    def handle(self, *args, **options):
+        if TABLE not in connection.introspection.table_names():
+            self.stdout.write("There is no django-background-tasks queue to migrate.")
+            return
+
+        moved, skipped = [], 0
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"SELECT id, task_name, task_params FROM {TABLE} WHERE failed_at IS NULL")
+
+            for task_id, task_name, task_params in cursor.fetchall():
+                if task_name != DM_TASK:
+                    skipped += 1
+                    continue
+
+                task_args, task_kwargs = json.loads(task_params)
+                notifications.queue_dm(*task_args, **task_kwargs)
+                moved.append(task_id)
+
+            if moved:
+                cursor.execute(f"DELETE FROM {TABLE} WHERE id IN ({', '.join(['%s'] * len(moved))})", moved)
+
+        self.stdout.write(f"Moved {len(moved)} DMs into the notification outbox, skipped {skipped} other tasks.")
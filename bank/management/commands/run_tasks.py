@@ -0,0 +1,68 @@
+import time
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from bank import metrics, taskrunner, tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks concurrently, by priority. Several runners can share the queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=None,
+                            help="Amount of worker threads for I/O bound tasks.")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Amount of worker processes for CPU heavy tasks.")
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help="Seconds between queue statistics while the queue is idle.")
+        parser.add_argument('--once', action='store_true',
+                            help="Run all tasks that are due and exit instead of polling forever.")
+        parser.add_argument('--metrics-port', type=int, default=None,
+                            help="Serve this runner's task metrics in the Prometheus text format on this port "
+                                 "of localhost.")
+
+    def handle(self, *args, **options):
+        tasks.schedule_periodic_tasks()
+        runner = taskrunner.TaskRunner(threads=options['threads'], processes=options['processes'])
+        last_report = time.monotonic()
+
+        def report():
+            nonlocal last_report
+
+            if time.monotonic() - last_report < options['stats_interval']:
+                return
+
+            last_report = time.monotonic()
+            stats = taskrunner.queue_statistics()
+            lanes = ", ".join(f"{lane} {lane_stats['depth']} ({lane_stats['oldest_seconds']:.0f}s)"
+                              for lane, lane_stats in stats['lanes'].items())
+            self.stdout.write(f"Waiting: {lanes}. {stats['running']} running, {stats['failed']} failed, "
+                              f"mean latency {stats['mean_latency_seconds']:.2f}s.")
+
+        if options['metrics_port']:
+            serve_metrics(options['metrics_port'])
+
+        self.stdout.write(f"Running tasks as {runner.worker_id} with {runner.threads} threads "
+                          f"and {runner.processes} processes.")
+        runner.run(drain=options['once'], on_idle=report)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bank import economy
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic economy for load tests: users, organizations, employees, accounts " \
+           "with consistent balances and power law distributed transactions. Writes in bulk and skips the signals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--corporations', type=int, default=None,
+                            help="Amount of organizations, one per 20 users by default.")
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=90, help="Spread the transactions over this many days.")
+        parser.add_argument('--currency', action='append', dest='currencies',
+                            help="Create accounts in this currency, can be given more than once. All configured "
+                                 "currencies by default.")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes that generate and copy transactions. PostgreSQL only.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random economy.")
+        parser.add_argument('--prefix', default="citizen-", help="Prefix of the generated usernames.")
+
+    def handle(self, *args, **options):
+        try:
+            created = economy.generate(options['users'], options['transactions'],
+                                       corporations=options['corporations'], currencies=options['currencies'],
+                                       days=options['days'], workers=options['workers'], seed=options['seed'],
+                                       prefix=options['prefix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(', '.join(f"{amount} {kind}" for kind, amount in created.items()) + " created.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from bank import models, notifications
+
+
+class Command(BaseCommand):
+    help = "Send one summary DM per recipient for all held back transaction notifications. " \
+           "Run this every hour with --mode hourly and once a day with --mode daily, for example with cron."
+
+    MODES = {'hourly': models.User.NotificationModes.HOURLY,
+             'daily': models.User.NotificationModes.DAILY}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=self.MODES.keys(), required=True)
+
+    def handle(self, *args, **options):
+        recipients = notifications.send_digests(self.MODES[options['mode']])
+        self.stdout.write(f"Queued {options['mode']} digests for {recipients} recipients.")
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank import partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly partitions of the transaction table, or detach old ones. PostgreSQL only."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=None,
+                            help="Create partitions for this many months after the current one.")
+        parser.add_argument('--detach-before', type=datetime.date.fromisoformat, default=None, metavar="YYYY-MM-DD",
+                            help="Detach all partitions of months before this date. They have to be archived "
+                                 "with `archive_transactions` first.")
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError("The transaction table is only partitioned on PostgreSQL.")
+
+        for name in partitions.ensure_partitions(options['months_ahead']):
+            self.stdout.write(f"Created {name}")
+
+        if options['detach_before']:
+            try:
+                detached = partitions.detach_partitions(options['detach_before'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            for name in detached:
+                self.stdout.write(f"Detached {name}, it's now a standalone table")
+
+        self.stdout.write(f"Attached partitions: {', '.join(partitions.list_partitions()) or 'none'}")
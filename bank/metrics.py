@@ -0,0 +1,188 @@
+"""
+Request and background task metrics in the Prometheus text format. MetricsMiddleware records every request by
+the name of its view, the task runner records every task it ran, and `render()` formats the totals for
+/api/v1/metrics/ (admins only), and for the task runner's --metrics-port.
+
+Every thread counts into its own shard, so recording never takes a lock or contends with other threads. The
+shards are only added up when the metrics are rendered. When a thread ends, its shard is folded into the retired
+totals, so servers that start a thread per request don't pile up shards. Metrics are per process: with several Gunicorn workers,
+each one counts the requests it served since it started.
+"""
+
+import bisect
+import threading
+import weakref
+
+# upper bounds of the latency histograms, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+UNRESOLVED = "<unresolved>"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# requests, server errors, seconds, queries, query seconds, then one count per bucket and one for slower ones
+REQUESTS, ERRORS, SECONDS, QUERIES, QUERY_SECONDS, FIRST_BUCKET = range(6)
+# runs, failures, seconds, then the buckets
+RUNS, FAILURES, TASK_SECONDS, FIRST_TASK_BUCKET = range(4)
+
+_local = threading.local()
+_shards = []
+# guards the list of shards while one is retired, recording doesn't need it
+_lock = threading.RLock()
+
+
+class Shard:
+    def __init__(self):
+        self.views = {}
+        self.tasks = {}
+
+    def add(self, other: 'Shard'):
+        for attribute in ('views', 'tasks'):
+            totals = getattr(self, attribute)
+
+            # copying the items doesn't run any Python code, so no other thread can add a key halfway through
+            for key, stats in list(getattr(other, attribute).items()):
+                if key in totals:
+                    totals[key] = [total + value for total, value in zip(totals[key], stats)]
+                else:
+                    totals[key] = list(stats)
+
+
+class ThreadMarker:
+    """Only referenced by a thread's locals, so it's garbage once the thread ended."""
+
+
+# the counts of the threads that ended
+_retired = Shard()
+
+
+def retire(existing: Shard):
+    with _lock:
+        _shards.remove(existing)
+        _retired.add(existing)
+
+
+def shard() -> Shard:
+    try:
+        return _local.shard
+    except AttributeError:
+        _local.shard, _local.marker = Shard(), ThreadMarker()
+        weakref.finalize(_local.marker, retire, _local.shard).atexit = False
+
+        # the shard is only ever written by this thread
+        with _lock:
+            _shards.append(_local.shard)
+
+        return _local.shard
+
+
+def reset():
+    with _lock:
+        for existing in _shards + [_retired]:
+            existing.views.clear()
+            existing.tasks.clear()
+
+
+def observe_request(view: str, seconds: float, queries: int, query_seconds: float, server_error: bool):
+    stats = shard().views.get(view)
+
+    if stats is None:
+        stats = shard().views[view] = [0, 0, 0.0, 0, 0.0] + [0] * (len(BUCKETS) + 1)
+
+    stats[REQUESTS] += 1
+    stats[ERRORS] += server_error
+    stats[SECONDS] += seconds
+    stats[QUERIES] += queries
+    stats[QUERY_SECONDS] += query_seconds
+    stats[FIRST_BUCKET + bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+def observe_task(name: str, seconds: float, failed: bool):
+    stats = shard().tasks.get(name)
+
+    if stats is None:
+        stats = shard().tasks[name] = [0, 0, 0.0] + [0] * (len(BUCKETS) + 1)
+
+    stats[RUNS] += 1
+    stats[FAILURES] += failed
+    stats[TASK_SECONDS] += seconds
+    stats[FIRST_TASK_BUCKET + bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+def collect(attribute: str) -> dict:
+    """The sum of the `views` or `tasks` of all shards, including the retired ones."""
+
+    totals = Shard()
+
+    # a shard that's being retired is counted either on its own or in the retired totals, never twice
+    with _lock:
+        for existing in _shards + [_retired]:
+            totals.add(existing)
+
+    return getattr(totals, attribute)
+
+
+def escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def histogram(name: str, label: str, key: str, buckets: list, total: float, count: int) -> list:
+    lines, cumulative = [], 0
+
+    for bound, observed in zip(BUCKETS, buckets):
+        cumulative += observed
+        lines.append(f'{name}_bucket{{{label}="{escape(key)}",le="{bound}"}} {cumulative}')
+
+    lines.append(f'{name}_bucket{{{label}="{escape(key)}",le="+Inf"}} {count}')
+    lines.append(f'{name}_sum{{{label}="{escape(key)}"}} {total}')
+    lines.append(f'{name}_count{{{label}="{escape(key)}"}} {count}')
+    return lines
+
+
+def header(name: str, kind: str, description: str) -> list:
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+
+def render(queue: dict = None) -> str:
+    """All metrics of this process in the Prometheus text format. `queue` are the statistics of
+    `bank.taskrunner.queue_statistics()`, shared by all task runners."""
+
+    views, tasks = sorted(collect('views').items()), sorted(collect('tasks').items())
+    lines = []
+
+    for name, column, kind, description in (
+            ('bank_http_requests_total', REQUESTS, 'counter', "Requests by view."),
+            ('bank_http_server_errors_total', ERRORS, 'counter', "Responses with a 5xx status by view."),
+            ('bank_http_db_queries_total', QUERIES, 'counter', "Database queries by view."),
+            ('bank_http_db_seconds_total', QUERY_SECONDS, 'counter', "Time spent in database queries by view.")):
+        lines += header(name, kind, description)
+        lines += [f'{name}{{view="{escape(view)}"}} {stats[column]}' for view, stats in views]
+
+    lines += header('bank_http_request_duration_seconds', 'histogram', "Request latency by view.")
+
+    for view, stats in views:
+        lines += histogram('bank_http_request_duration_seconds', 'view', view, stats[FIRST_BUCKET:],
+                           stats[SECONDS], stats[REQUESTS])
+
+    lines += header('bank_task_failures_total', 'counter', "Failed background task runs by task.")
+    lines += [f'bank_task_failures_total{{task="{escape(task)}"}} {stats[FAILURES]}' for task, stats in tasks]
+    lines += header('bank_task_duration_seconds', 'histogram', "Background task run time by task.")
+
+    for task, stats in tasks:
+        lines += histogram('bank_task_duration_seconds', 'task', task, stats[FIRST_TASK_BUCKET:],
+                           stats[TASK_SECONDS], stats[RUNS])
+
+    if queue is not None:
+        lines += header('bank_task_queue_depth', 'gauge', "Tasks that are due and wait for a runner, by lane.")
+        lines += [f'bank_task_queue_depth{{lane="{lane}"}} {stats["depth"]}'
+                  for lane, stats in queue['lanes'].items()]
+        lines += header('bank_task_queue_oldest_seconds', 'gauge', "Wait of the oldest due task, by lane.")
+        lines += [f'bank_task_queue_oldest_seconds{{lane="{lane}"}} {stats["oldest_seconds"]}'
+                  for lane, stats in queue['lanes'].items()]
+
+        for name, key, description in (
+                ('bank_task_running', 'running', "Tasks that are running now."),
+                ('bank_task_mean_duration_seconds', 'mean_duration_seconds',
+                 "Mean run time of the tasks that started in the last hour.")):
+            lines += header(name, 'gauge', description)
+            lines.append(f"{name} {queue[key]}")
+
+    return '\n'.join(lines) + '\n'
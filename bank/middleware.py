@@ -0,0 +1,155 @@
+import time
+import hashlib
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import budgets, metrics, profiling, routers
+from .caching import shared_cache
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+
+def get_client_key(request, response=None):
+    """Identify the client across requests, by its API credentials or its session."""
+
+    identity = request.META.get('HTTP_AUTHORIZATION')
+
+    if not identity and response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+        # the session was just created or rotated, e.g. on login
+        identity = response.cookies[settings.SESSION_COOKIE_NAME].value
+
+    if not identity:
+        identity = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+    if not identity:
+        return None
+
+    return f"replica-pin:{hashlib.sha256(identity.encode()).hexdigest()}"
+
+
+class ReplicaMiddleware:
+    """Lets read-only requests read from a replica. Clients that just wrote something are pinned to the primary
+    for `settings.REPLICA_PIN_SECONDS`, so they see their writes even if the replicas lag behind."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = get_client_key(request)
+        use_replica = request.method in SAFE_METHODS and not (key and shared_cache().get(key))
+        token = routers.start_request(use_replica)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish_request(token)
+
+        if wrote:
+            key = get_client_key(request, response)
+
+            if key:
+                shared_cache().set(key, True, timeout=settings.REPLICA_PIN_SECONDS)
+
+        return response
+
+
+class QueryTimer:
+    """An execute wrapper that counts the queries of a request and the time spent in them."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Records the latency and database queries of every request by the name of its view, see bank/metrics.py."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        response = None
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+
+                response = self.get_response(request)
+        finally:
+            match = getattr(request, 'resolver_match', None)
+            metrics.observe_request(match.view_name if match else metrics.UNRESOLVED,
+                                    time.perf_counter() - started, timer.queries, timer.seconds,
+                                    response is None or response.status_code >= 500)
+
+        return response
+
+
+class QueryBudgetMiddleware:
+    """Checks the queries of every request against the budget of its view, see bank/budgets.py. Does nothing
+    unless settings.QUERY_BUDGET_MODE is "warn" or "raise"."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_BUDGET_MODE
+
+        if mode == 'off':
+            return self.get_response(request)
+
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+
+        if match is not None:
+            found = budgets.problems(match.view_name, budgets.get_budget(match), queries,
+                                     settings.QUERY_REPEAT_THRESHOLD)
+
+            if found:
+                budgets.report(found, mode)
+
+        return response
+
+
+class ProfilingMiddleware:
+    """Profiles the requests that staff ask to be profiled, see bank/profiling.py. Comes after the authentication
+    middleware, so that it knows who is asking."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.requested(request):
+            return self.get_response(request)
+
+        user = profiling.get_user(request)
+
+        if user is None or not user.is_staff:
+            return self.get_response(request)
+
+        return profiling.profile(request, self.get_response)
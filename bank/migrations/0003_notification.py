@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0002_auto_20210329_1456'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.BigIntegerField()),
+                ('message', models.TextField(blank=True, default='')),
+                ('embed', models.JSONField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_on', models.DateTimeField(blank=True, null=True)),
+                ('delivered_on', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['delivered_on', 'created_on'], name='bank_notifi_deliver_ce2cc1_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0003_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='mode',
+            field=models.CharField(choices=[('I', 'Immediately'), ('H', 'Hourly Digest'), ('D', 'Daily Digest')], default='I', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='transaction',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bank.transaction'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='notification_mode',
+            field=models.CharField(choices=[('I', 'Immediately'), ('H', 'Hourly Digest'), ('D', 'Daily Digest')], default='I', help_text='With a digest, you get one summary of all transactions you and your organizations received every hour or every day, instead of one notification per transaction.', max_length=1, verbose_name='Notifications about received transactions'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['mode', 'delivered_on', 'target'], name='bank_notifi_mode_bf4f71_idx'),
+        ),
+    ]
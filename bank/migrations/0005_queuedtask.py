@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:22
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0004_user_notification_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('arguments', models.JSONField(default=dict)),
+                ('priority', models.PositiveSmallIntegerField(choices=[(0, 'High'), (10, 'Normal'), (20, 'Bulk')], default=10)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('repeat', models.DurationField(blank=True, null=True)),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('started_on', models.DateTimeField(blank=True, null=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'High'), (10, 'Normal'), (20, 'Bulk')], default=10),
+        ),
+        migrations.AddIndex(
+            model_name='queuedtask',
+            index=models.Index(fields=['finished_on', 'priority', 'run_at'], name='bank_queued_finishe_612a4a_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:26
+
+from django.db import migrations, models
+
+
+def set_updated_on(apps, schema_editor):
+    Transaction = apps.get_model('bank', 'Transaction')
+    Transaction.objects.update(updated_on=models.F('created_on'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0005_queuedtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(set_updated_on, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:32
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Partitions for this many months ahead are created right away, `manage.py transaction_partitions` and the
+# task runner keep creating them later on
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_transactions(apps, schema_editor):
+    # declarative partitioning is PostgreSQL only, other databases keep the regular table
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(created_on), NOW() FROM bank_transaction")
+        oldest, now = cursor.fetchone()
+
+    first = datetime.date((oldest or now).year, (oldest or now).month, 1)
+    last = add_months(datetime.date(now.year, now.month, 1), MONTHS_AHEAD)
+
+    schema_editor.execute("ALTER TABLE bank_transaction RENAME TO bank_transaction_unpartitioned")
+    schema_editor.execute("CREATE TABLE bank_transaction (LIKE bank_transaction_unpartitioned "
+                          "INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_on)")
+
+    # the partition key has to be part of the primary key, `id` alone is still unique since it's a UUID
+    schema_editor.execute("ALTER TABLE bank_transaction ADD PRIMARY KEY (id, created_on)")
+
+    for column, target in (('from_account_id', 'bank_account (iban)'), ('to_account_id', 'bank_account (iban)'),
+                           ('authorized_by_id', 'bank_user (id)')):
+        schema_editor.execute(f"ALTER TABLE bank_transaction ADD CONSTRAINT bank_transaction_{column}_fk "
+                              f"FOREIGN KEY ({column}) REFERENCES {target} DEFERRABLE INITIALLY DEFERRED")
+        schema_editor.execute(f"CREATE INDEX bank_transaction_{column}_idx ON bank_transaction ({column})")
+
+    schema_editor.execute("CREATE INDEX bank_transaction_created_on_idx ON bank_transaction (created_on)")
+
+    month = first
+
+    while month <= last:
+        following = add_months(month, 1)
+        schema_editor.execute(f"CREATE TABLE bank_transaction_{month:%Y_%m} PARTITION OF bank_transaction "
+                              f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') "
+                              f"TO ('{following:%Y-%m-%d} 00:00:00+00')")
+        month = following
+
+    # catches transactions outside of all partitions, e.g. if partitions weren't created in time
+    schema_editor.execute("CREATE TABLE bank_transaction_default PARTITION OF bank_transaction DEFAULT")
+
+    schema_editor.execute("INSERT INTO bank_transaction SELECT * FROM bank_transaction_unpartitioned")
+    schema_editor.execute("DROP TABLE bank_transaction_unpartitioned")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0006_transaction_updated_on'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='transaction',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bank.transaction'),
+        ),
+        migrations.RunPython(partition_transactions, migrations.RunPython.noop),
+    ]
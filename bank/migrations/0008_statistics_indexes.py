@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0007_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['currency', 'is_reserve'], name='bank_account_currency_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['individual_holder', 'currency'], name='bank_account_individual_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['corporate_holder', 'currency'], name='bank_account_corporate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['amount_currency', 'created_on'], name='bank_transaction_currency_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:37
+
+from django.db import migrations, models
+
+
+def set_holder_names(apps, schema_editor):
+    Account = apps.get_model('bank', 'Account')
+    User = apps.get_model('bank', 'User')
+    Corporation = apps.get_model('bank', 'Corporation')
+
+    Account.objects.filter(individual_holder__isnull=False).update(holder_type='I', holder_name=models.Subquery(
+        User.objects.filter(pk=models.OuterRef('individual_holder')).values('username')[:1]))
+    Account.objects.filter(corporate_holder__isnull=False).update(holder_type='C', holder_name=models.Subquery(
+        Corporation.objects.filter(pk=models.OuterRef('corporate_holder')).values('name')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0008_statistics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='holder_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='holder_type',
+            field=models.CharField(blank=True, choices=[('I', 'Individual'), ('C', 'Organization')], default='', editable=False, max_length=1),
+        ),
+        migrations.RunPython(set_holder_names, migrations.RunPython.noop),
+    ]
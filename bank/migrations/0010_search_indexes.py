@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:05
+
+from django.db import migrations
+
+# The columns are upper-cased the same way Django's icontains lookup does, so that both icontains and the
+# trigram similarity operator in bank/search.py can use these indexes
+INDEXES = {
+    'bank_user_username_trgm': ('bank_user', 'username'),
+    'bank_user_discord_username_trgm': ('bank_user', 'discord_username'),
+    'bank_corporation_name_trgm': ('bank_corporation', 'name'),
+    'bank_corporation_abbreviation_trgm': ('bank_corporation', 'abbreviation'),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    # other databases search through the in-process index in bank/search.py
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for name, (table, column) in INDEXES.items():
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+                              f"USING gin (UPPER({column}::text) gin_trgm_ops)")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0009_account_holder_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
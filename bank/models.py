@@ -1,17 +1,23 @@
 import uuid
+import decimal
 import moneyed
 import django_tables2 as tables
 
+from collections import defaultdict
+
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
 from django.db import models, transaction
 from django.utils.html import format_html
+from django.utils.functional import cached_property
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import CICharField
 
 from djmoney.models import fields
+from django_tables2.data import TableData
+from guardian.shortcuts import get_objects_for_user
 
 
 class User(AbstractUser):
@@ -22,6 +28,19 @@ class User(AbstractUser):
     discord_dms_enabled = models.BooleanField(
         default=True, verbose_name="Notifications via the Democraciv Discord Bot")
 
+    class NotificationModes(models.TextChoices):
+        IMMEDIATE = "I", "Immediately"
+        HOURLY = "H", "Hourly Digest"
+        DAILY = "D", "Daily Digest"
+
+    notification_mode = models.CharField(
+        max_length=1,
+        choices=NotificationModes.choices,
+        default=NotificationModes.IMMEDIATE,
+        verbose_name="Notifications about received transactions",
+        help_text="With a digest, you get one summary of all transactions you and your organizations received "
+                  "every hour or every day, instead of one notification per transaction.")
+
 
 class Corporation(models.Model):
     name = models.CharField(unique=True, max_length=100)
@@ -84,7 +103,7 @@ class Corporation(models.Model):
         return self.name
 
     def get_discord_ids(self):
-        employees = self.employee_set.all()
+        employees = self.employee_set.select_related('person')
         ids = [employee.person.discord_id for employee in employees
                if employee.person.discord_id and employee.person.discord_dms_enabled]
 
@@ -157,9 +176,52 @@ class Account(models.Model):
     ottoman_threshold_variable = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
     is_reserve = models.BooleanField(default=False)
 
+    class HolderTypes(models.TextChoices):
+        INDIVIDUAL = "I", "Individual"
+        CORPORATE = "C", "Organization"
+
+    # copies of str(self.holder), so that lists of counterparties don't need to load every user and organization.
+    # Kept up to date by the signals in bank/signals.py when the holder is renamed.
+    holder_name = models.CharField(max_length=150, blank=True, default="", editable=False)
+    holder_type = models.CharField(max_length=1, choices=HolderTypes.choices, blank=True, default="",
+                                   editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['currency', 'is_reserve'], name='bank_account_currency_idx'),
+            models.Index(fields=['individual_holder', 'currency'], name='bank_account_individual_idx'),
+            models.Index(fields=['corporate_holder', 'currency'], name='bank_account_corporate_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_holder = (instance.__dict__.get('individual_holder_id'),
+                                   instance.__dict__.get('corporate_holder_id'))
+        return instance
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # transactions save both accounts, so only look at the holder if it could have changed
+        if getattr(self, '_loaded_holder', None) != (self.individual_holder_id, self.corporate_holder_id):
+            self.refresh_holder()
+
+            if update_fields is not None:
+                update_fields = {*update_fields, 'holder_name', 'holder_type'}
+
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        self._loaded_holder = (self.individual_holder_id, self.corporate_holder_id)
+
+    def refresh_holder(self):
+        if self.individual_holder_id:
+            self.holder_name, self.holder_type = str(self.individual_holder), self.HolderTypes.INDIVIDUAL
+        elif self.corporate_holder_id:
+            self.holder_name, self.holder_type = str(self.corporate_holder), self.HolderTypes.CORPORATE
+        else:
+            self.holder_name, self.holder_type = "", ""
+
     def clean(self):
         # Don't allow both a Corporation and a User to own this Account
         if self.corporate_holder and self.individual_holder:
@@ -172,6 +234,13 @@ class Account(models.Model):
     def get_absolute_url(self):
         return reverse('bank:account-detail', kwargs={'pk': self.pk})
 
+    @property
+    def history_start(self):
+        """No transaction of this account is older than this, None if that's not known. The deleted account
+        takes over the transactions of accounts that were opened long before it."""
+
+        return None if self.pk == DELETED_ACCOUNT_IBAN else self.created_on
+
     @property
     def holder(self):
         return self.individual_holder if self.individual_holder else self.corporate_holder
@@ -185,6 +254,9 @@ class Account(models.Model):
 
     @property
     def pretty_holder(self):
+        if self.holder_type:
+            return self.holder_name
+
         return str(self.holder)
 
     def get_discord_ids(self):
@@ -198,8 +270,11 @@ class Account(models.Model):
             return self.corporate_holder.get_discord_ids()
 
 
+DELETED_ACCOUNT_IBAN = uuid.UUID('00000000-0000-0000-0000-000000000000')
+
+
 def get_deleted_account():
-    return Account.objects.get_or_create(iban=uuid.UUID('00000000-0000-0000-0000-000000000000'),
+    return Account.objects.get_or_create(iban=DELETED_ACCOUNT_IBAN,
                                          name="Deleted Bank Account",
                                          is_frozen=True)[0]
 
@@ -214,11 +289,15 @@ class Transaction(models.Model):
     purpose = models.TextField(max_length=500, blank=True, default="", help_text="The recipient can read this. You can "
                                                                                  "leave this blank.")
     created_on = models.DateTimeField(default=timezone.now)
+    updated_on = models.DateTimeField(auto_now=True)
 
     authorized_by = models.ForeignKey(settings.AUTH_USER_MODEL,
                                       on_delete=models.SET_NULL,
                                       null=True)
 
+    # set on the unsaved copies that bank/archive.py reads back from the archive files
+    is_archived = False
+
     class TransactionState(models.TextChoices):
         SUCCESSFUL = 'SC', 'Successful'
         REVOKED = 'RV', 'Revoked'
@@ -229,6 +308,12 @@ class Transaction(models.Model):
         default=TransactionState.SUCCESSFUL,
     )
 
+    class Meta:
+        indexes = [
+            # statistics per currency, amount_currency is always the currency of the sending account
+            models.Index(fields=['amount_currency', 'created_on'], name='bank_transaction_currency_idx'),
+        ]
+
     def __str__(self):
         return str(self.id)
 
@@ -270,6 +355,87 @@ class Transaction(models.Model):
         return reverse('bank:account-transaction-detail', kwargs={'pk': self.pk})
 
 
+def revoke_transactions(queryset) -> list:
+    """Revoke the successful transactions in `queryset` and give the money back, with one UPDATE per affected
+    account instead of a save() per transaction. Returns the IBANs of the affected accounts."""
+
+    with transaction.atomic():
+        ids = list(queryset.filter(state=Transaction.TransactionState.SUCCESSFUL).select_for_update()
+                   .values_list('pk', flat=True))
+        revoked = Transaction.objects.filter(pk__in=ids)
+        changes = defaultdict(decimal.Decimal)
+
+        for iban, total in revoked.values_list('from_account').annotate(total=models.Sum('amount')).order_by():
+            changes[iban] += total
+
+        for iban, total in revoked.values_list('to_account').annotate(total=models.Sum('amount')).order_by():
+            changes[iban] -= total
+
+        # always in the same order, so that concurrent revocations can't deadlock
+        for iban in sorted(changes):
+            Account.objects.filter(pk=iban).update(balance=models.F('balance') + changes[iban])
+
+        revoked.update(state=Transaction.TransactionState.REVOKED, updated_on=timezone.now())
+
+    return sorted(changes)
+
+
+class QueuedTask(models.Model):
+    class Priorities(models.IntegerChoices):
+        HIGH = 0, "High"
+        NORMAL = 10, "Normal"
+        BULK = 20, "Bulk"
+
+    name = models.CharField(max_length=200)
+    arguments = models.JSONField(default=dict)
+    priority = models.PositiveSmallIntegerField(choices=Priorities.choices, default=Priorities.NORMAL)
+    run_at = models.DateTimeField(default=timezone.now)
+    repeat = models.DurationField(null=True, blank=True)
+    created_on = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    started_on = models.DateTimeField(null=True, blank=True)
+    finished_on = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['finished_on', 'priority', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_priority_display()})"
+
+
+class Notification(models.Model):
+    target = models.BigIntegerField()
+    message = models.TextField(blank=True, default="")
+    embed = models.JSONField(null=True, blank=True)
+    created_on = models.DateTimeField(default=timezone.now)
+    claimed_on = models.DateTimeField(null=True, blank=True)
+    delivered_on = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    # only set for notifications about received transactions, those can be summarized in a digest. There's no
+    # database constraint since the partitioned transaction table can't have a unique index on just its id.
+    transaction = models.ForeignKey('Transaction', null=True, blank=True, on_delete=models.SET_NULL,
+                                    db_constraint=False)
+    mode = models.CharField(max_length=1, choices=User.NotificationModes.choices,
+                            default=User.NotificationModes.IMMEDIATE)
+    priority = models.PositiveSmallIntegerField(choices=QueuedTask.Priorities.choices,
+                                                default=QueuedTask.Priorities.NORMAL)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivered_on', 'created_on']),
+            models.Index(fields=['mode', 'delivered_on', 'target']),
+        ]
+
+    def __str__(self):
+        return f"{self.target} ({self.created_on})"
+
+
 class AccountsTable(tables.Table):
     iban = tables.Column(verbose_name="IBAN")
     name = tables.Column(linkify=True)
@@ -321,6 +487,20 @@ class CorporationTable(tables.Table):
         return value.strftime("%A, %d %B %Y %H:%M")
 
 
+class AccountHistoryData(TableData):
+    """Table data for an archive.AccountHistory, which can only be ordered by date."""
+
+    @property
+    def model(self):
+        return Transaction
+
+    def __len__(self):
+        return len(self.data)
+
+    def order_by(self, aliases):
+        self.data.newest_first = not aliases or aliases[0] != 'created_on'
+
+
 class TransactionTable(tables.Table):
     transaction_id = tables.Column(verbose_name="Transaction ID", accessor="id", visible=False)
     id = tables.Column(verbose_name="", exclude_from_export=True)
@@ -339,32 +519,42 @@ class TransactionTable(tables.Table):
         fields = ['transaction_id', 'from_account', 'from_iban', 'to_account', 'to_iban', 'amount', 'raw_amount',
                   'currency', 'created_on', 'id']
 
-    def value_raw_amount(self, value, record):
-        context_account = Account.objects.get(pk=self.request.resolver_match.kwargs['pk'])
+    @cached_property
+    def viewable_accounts(self):
+        """The IBANs of the accounts the user can view, looked up once for all rows. None if they can view any."""
+
+        if self.request.user.has_perm('bank.view_account'):
+            return None
+
+        return set(get_objects_for_user(self.request.user, 'bank.view_account').values_list('pk', flat=True))
 
-        if context_account == record.from_account:
+    def can_view(self, account) -> bool:
+        return self.viewable_accounts is None or account.pk in self.viewable_accounts
+
+    def value_raw_amount(self, value, record):
+        if self.request.resolver_match.kwargs['pk'] == record.from_account_id:
             return value.copy_negate()
         else:
             return value
 
     def render_from_account(self, value):
-        if self.request.user.has_perm('bank.view_account', value):
+        if self.can_view(value):
             return value.name
         else:
             return value.pretty_holder
 
     def render_to_account(self, value):
-        if self.request.user.has_perm('bank.view_account', value):
+        if self.can_view(value):
             return value.name
         else:
             return value.pretty_holder
 
     def render_amount(self, value, record):
-        account = Account.objects.get(pk=self.request.resolver_match.kwargs['pk'])
+        iban = self.request.resolver_match.kwargs['pk']
 
-        if account.pk == record.to_account.pk:
+        if iban == record.to_account_id:
             return format_html('<p class="text-success">+{}</p>', value)
-        elif account.pk == record.from_account.pk:
+        elif iban == record.from_account_id:
             return format_html('<p class="text-danger">-{}</p>', value)
 
     def value_amount(self, value):
@@ -373,7 +563,10 @@ class TransactionTable(tables.Table):
     def value_id(self, value):
         return value
 
-    def render_id(self, value):
+    def render_id(self, value, record):
+        if record.is_archived:
+            return format_html('<span class="text-muted">{}</span>', "Archived")
+
         return format_html(
             '<a href="{}"><button class="btn btn-primary" style="margin-bottom: 10px" >Details</button></a>',
             reverse('bank:account-transaction-detail', kwargs={'pk': str(value)}))
@@ -0,0 +1,243 @@
+import json
+import decimal
+import time
+import requests
+
+from datetime import timedelta
+from functools import partial
+from collections import OrderedDict
+from djmoney.money import Money
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.urls import reverse
+from django.utils import timezone
+
+from . import models, util
+from .clients import bot_client
+
+# Discord only allows 25 fields per embed
+MAX_COALESCED_FIELDS = 25
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def queue_dm(payload: dict, transaction_id=None, priority=models.QueuedTask.Priorities.NORMAL):
+    """Write one outbox row per target of a `{'targets': [], 'message': '', 'embed': {}}` DM payload.
+
+    Rows are written in the caller's database transaction, so a rollback also discards the DM, and a committed
+    one is never lost. Delivery is only scheduled once that transaction committed. Rows whose delivery wasn't
+    scheduled, after a crash right after the commit, are sent by the next delivery run.
+    Notifications about a received transaction (`transaction_id`) respect each target's notification mode,
+    and are held back for a digest if they chose one. Notifications with a lower `priority` are delivered first.
+    """
+
+    from .tasks import deliver_notifications
+
+    targets = set(payload.get('targets') or [])
+
+    if not targets:
+        return
+
+    modes = {}
+
+    if transaction_id:
+        modes = dict(get_user_model().objects.filter(discord_id__in=targets)
+                     .values_list('discord_id', 'notification_mode'))
+
+    models.Notification.objects.bulk_create([
+        models.Notification(target=target, message=payload.get('message', ''), embed=payload.get('embed'),
+                            transaction_id=transaction_id, priority=priority,
+                            mode=modes.get(target, models.User.NotificationModes.IMMEDIATE))
+        for target in targets
+    ])
+
+    # notifications held back for a digest are sent by the digest task instead
+    if len(modes) < len(targets) or models.User.NotificationModes.IMMEDIATE in modes.values():
+        transaction.on_commit(partial(deliver_notifications.schedule, priority=priority, unique=True))
+
+
+def pending_notifications():
+    return models.Notification.objects.filter(delivered_on__isnull=True,
+                                              mode=models.User.NotificationModes.IMMEDIATE,
+                                              attempts__lt=settings.NOTIFICATION_MAX_ATTEMPTS)
+
+
+def claim_batch(batch_size: int) -> list:
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT)
+
+    with transaction.atomic():
+        ids = list(pending_notifications().filter(Q(claimed_on__isnull=True) | Q(claimed_on__lt=stale))
+                   .select_for_update(skip_locked=True)
+                   .order_by('priority', 'created_on')
+                   .values_list('id', flat=True)[:batch_size])
+        models.Notification.objects.filter(id__in=ids).update(claimed_on=now)
+
+    return list(models.Notification.objects.filter(id__in=ids).order_by('priority', 'created_on'))
+
+
+def coalesce_embeds(notifications: list) -> dict:
+    """One embed with a field per notification, for at most MAX_COALESCED_FIELDS notifications."""
+
+    if len(notifications) == 1:
+        return notifications[0].embed
+
+    embed = util.make_embed(title=f"{len(notifications)} New Notifications",
+                            description="Here's what happened since your last notification.",
+                            url="https://democracivbank.com")
+
+    for notification in notifications:
+        event = notification.embed or {}
+        value = notification.message or event.get('description', '')
+
+        if event.get('url'):
+            value = f"{value}\n[Details]({event['url']})"
+
+        util.add_field(embed, name=event.get('title', 'Notification'), value=value)
+
+    return embed
+
+
+def build_payloads(notifications: list) -> list:
+    """Coalesce several notifications for the same target into one DM, or several once they don't fit into the
+    fields of one embed, and then share identical DMs between targets so that organization-wide events are only
+    sent once."""
+
+    per_target = OrderedDict()
+
+    for notification in notifications:
+        per_target.setdefault(notification.target, []).append(notification)
+
+    payloads = OrderedDict()
+
+    for target, target_notifications in per_target.items():
+        for start in range(0, len(target_notifications), MAX_COALESCED_FIELDS):
+            chunk = target_notifications[start:start + MAX_COALESCED_FIELDS]
+            message = chunk[0].message if len(chunk) == 1 else ''
+            embed = coalesce_embeds(chunk)
+            key = json.dumps([message, embed], sort_keys=True, default=str)
+            payload = payloads.setdefault(key, {'targets': [], 'message': message, 'embed': embed})
+            payload['targets'].append(target)
+
+    return list(payloads.values())
+
+
+def post_payloads(payloads: list):
+    response = bot_client().post(settings.DEMOCRACIV_DISCORD_BOT_DM_BATCH_ENDPOINT, json={'messages': payloads})
+    response.raise_for_status()
+
+
+def deliver_batch(batch_size: int = None) -> dict:
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    notifications = claim_batch(batch_size)
+    result = {'notifications': len(notifications), 'messages': 0, 'failed': 0}
+
+    if not notifications:
+        return result
+
+    ids = [notification.id for notification in notifications]
+    payloads = build_payloads(notifications)
+
+    try:
+        post_payloads(payloads)
+    except requests.RequestException:
+        models.Notification.objects.filter(id__in=ids).update(claimed_on=None, attempts=F('attempts') + 1)
+        result['failed'] = len(notifications)
+        return result
+
+    models.Notification.objects.filter(id__in=ids).update(delivered_on=timezone.now())
+    result['messages'] = len(payloads)
+    return result
+
+
+def outbox_statistics() -> dict:
+    now = timezone.now()
+    pending = pending_notifications()
+    oldest = pending.aggregate(oldest=Min('created_on'))['oldest']
+
+    return {
+        'pending': pending.count(),
+        'oldest_pending_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+        'delivered_last_hour': models.Notification.objects.filter(
+            delivered_on__gte=now - timedelta(hours=1)).count(),
+        'failed': models.Notification.objects.filter(
+            delivered_on__isnull=True, attempts__gte=settings.NOTIFICATION_MAX_ATTEMPTS).count(),
+        'held_for_digest': models.Notification.objects.filter(delivered_on__isnull=True).exclude(
+            mode=models.User.NotificationModes.IMMEDIATE).count()
+    }
+
+
+def deliver_pending(batch_size: int = None, max_batches: int = None) -> dict:
+    started = time.perf_counter()
+    totals = {'notifications': 0, 'messages': 0, 'failed': 0, 'batches': 0}
+
+    while max_batches is None or totals['batches'] < max_batches:
+        result = deliver_batch(batch_size)
+
+        if not result['notifications']:
+            break
+
+        totals['batches'] += 1
+
+        for key in ('notifications', 'messages', 'failed'):
+            totals[key] += result[key]
+
+        if result['failed']:
+            break
+
+    elapsed = time.perf_counter() - started
+    totals['seconds'] = elapsed
+    totals['per_second'] = (totals['notifications'] - totals['failed']) / elapsed if elapsed else 0.0
+    return totals
+
+
+def send_digests(mode: str) -> int:
+    """Summarize all held back transaction notifications of the given digest mode into one DM per recipient."""
+
+    held = models.Notification.objects.filter(mode=mode, delivered_on__isnull=True)
+
+    # don't mark notifications as delivered that came in while we were building the digests
+    last_id = held.aggregate(last_id=Max('id'))['last_id']
+
+    if last_id is None:
+        return 0
+
+    held = held.filter(id__lte=last_id)
+    summary = (held.values('target', 'transaction__amount_currency')
+               .annotate(count=Count('id'), total=Sum('transaction__amount'))
+               .order_by('target', 'transaction__amount_currency'))
+
+    per_target = OrderedDict()
+
+    for row in summary:
+        per_target.setdefault(row['target'], []).append(row)
+
+    period = "hour" if mode == models.User.NotificationModes.HOURLY else "day"
+
+    with transaction.atomic():
+        for target, rows in per_target.items():
+            amount = sum(row['count'] for row in rows)
+            embed = util.make_embed(title=f"Your {models.User.NotificationModes(mode).label}",
+                                    description=f"You and the organizations you're part of received {amount} "
+                                                f"transaction{'s' if amount != 1 else ''} in the last {period}.",
+                                    url=f"https://democracivbank.com{reverse('bank:account')}")
+
+            for row in rows:
+                if row['transaction__amount_currency'] is None:
+                    continue
+
+                total = Money(row['total'] or decimal.Decimal(0), row['transaction__amount_currency'])
+                util.add_field(embed, name=row['transaction__amount_currency'],
+                               value=f"{row['count']} transaction{'s' if row['count'] != 1 else ''}, "
+                                     f"{total} in total", inline=True)
+
+            queue_dm({'targets': [target], 'message': '', 'embed': embed})
+
+        held.update(delivered_on=timezone.now())
+
+    return len(per_target)
@@ -0,0 +1,128 @@
+"""
+Paginators for tables that are too large to count on every page view, shared by the django-tables2 views, the
+API and the admin.
+
+On PostgreSQL, querysets the planner expects to have at least ESTIMATED_COUNT_THRESHOLD rows are counted with
+the planner's estimate: the table statistics for whole tables, EXPLAIN for filtered querysets. Those counts are
+approximate and labelled as such. Smaller querysets are counted exactly, and the count is cached for a minute.
+"""
+
+import json
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+def estimated_table_rows(queryset):
+    """PostgreSQL's estimate of the rows in `queryset`'s table, including its partitions. None on other
+    databases, for filtered querysets and for tables that were never analyzed."""
+
+    if connections[queryset.db].vendor != 'postgresql' or queryset.query.where:
+        return None
+
+    with connections[queryset.db].cursor() as cursor:
+        # partitioned tables keep their statistics on the partitions, reltuples is -1 until a table was analyzed
+        cursor.execute("SELECT SUM(reltuples) FILTER (WHERE reltuples >= 0) FROM pg_class "
+                       "WHERE oid = %s::regclass OR oid IN (SELECT inhrelid FROM pg_inherits "
+                       "WHERE inhparent = %s::regclass)", [queryset.model._meta.db_table] * 2)
+        estimate, = cursor.fetchone()
+
+    return int(estimate) if estimate is not None else None
+
+
+def estimated_rows(queryset):
+    """The planner's estimate of the rows in `queryset` on PostgreSQL, None on other databases."""
+
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+
+    estimate = estimated_table_rows(queryset)
+
+    if estimate is not None:
+        return estimate
+
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cached_count(queryset) -> int:
+    query = str(queryset.order_by().query)
+    key = f"row-count:{queryset.db}:{hashlib.md5(query.encode()).hexdigest()}"
+    return cache.get_or_set(key, queryset.count, timeout=settings.COUNT_CACHE_TIMEOUT)
+
+
+def count_rows(object_list):
+    """The number of rows in `object_list`, and whether that number is an estimate."""
+
+    if not hasattr(object_list, 'query'):
+        return len(object_list), False
+
+    estimate = estimated_rows(object_list)
+
+    if estimate is not None and estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+        return estimate, True
+
+    return cached_count(object_list), False
+
+
+class EstimatedCountPage(Page):
+    def has_next(self):
+        # an estimate may be too low, a full page could be followed by more
+        return super().has_next() or \
+            (self.paginator.count_is_approximate and len(self.object_list) == self.paginator.per_page)
+
+
+class EstimatedCountPaginator(Paginator):
+    """A Paginator whose `count` may be an estimate, see `count_is_approximate`. Pages past the counted ones
+    are empty instead of invalid, since an estimated or cached count can be lower than the actual one."""
+
+    @cached_property
+    def counted(self):
+        return count_rows(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_is_approximate(self) -> bool:
+        return self.counted[1]
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedCountPage(*args, **kwargs)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_approximate', self.page.paginator.count_is_approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
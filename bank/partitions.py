@@ -0,0 +1,98 @@
+"""
+On PostgreSQL, bank_transaction is partitioned by month of `created_on` (see migration 0007). Transactions never
+move between months, so queries that filter on `created_on` only scan the partitions they need, and old months
+can be detached from the table once they're archived (see bank/archive.py). Other databases keep one regular table.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+PARENT_TABLE = 'bank_transaction'
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+
+
+def is_partitioned(using='default') -> bool:
+    return connections[using].vendor == 'postgresql'
+
+
+def month_start(value) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+
+def list_partitions(using='default') -> list:
+    """The names of the attached monthly partitions, oldest first."""
+
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT child.relname FROM pg_inherits "
+                       "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                       "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                       "WHERE parent.relname = %s ORDER BY child.relname", [PARENT_TABLE])
+        return [name for name, in cursor.fetchall() if name != DEFAULT_PARTITION]
+
+
+def create_partition(cursor, month: datetime.date):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+                   f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') "
+                   f"TO ('{add_months(month, 1):%Y-%m-%d} 00:00:00+00')")
+
+
+def ensure_partitions(months_ahead: int = None, using='default') -> list:
+    """Create the partitions for this month and the next `months_ahead` months. Returns the created names."""
+
+    if not is_partitioned(using):
+        return []
+
+    months_ahead = settings.TRANSACTION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    existing = set(list_partitions(using))
+    this_month = month_start(timezone.now())
+    created = []
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+
+            if partition_name(month) not in existing:
+                create_partition(cursor, month)
+                created.append(partition_name(month))
+
+    return created
+
+
+def detach_partitions(before: datetime.date, using='default', archive_root=None) -> list:
+    """Detach all monthly partitions older than `before`, which have to be archived already. Archived partitions
+    are empty, they stay around as standalone tables until they're dropped."""
+
+    # the archive builds on this module
+    from .archive import load_manifest
+
+    if not is_partitioned(using):
+        return []
+
+    cutoff = partition_name(month_start(before))
+    detached = [name for name in list_partitions(using) if name < cutoff]
+    archived = load_manifest(archive_root)['cutoff']
+    # history is only read through the transaction table, rows of a detached month would be gone for good
+    unarchived = [name for name in detached
+                  if archived is None or name >= partition_name(datetime.date.fromisoformat(archived))]
+
+    if unarchived:
+        raise ValueError(f"{', '.join(unarchived)} can't be detached before they're archived, "
+                         f"run `archive_transactions` first.")
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for name in detached:
+            cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+
+    return detached
@@ -0,0 +1,145 @@
+"""
+Profiles of single requests, for pages that are only slow for some users and can't be reproduced locally. Staff
+ask for one with the `X-Profile` header or a `?profile` query parameter. ProfilingMiddleware then runs that
+request under cProfile, records its SQL queries and saves both:
+
+    {PROFILE_ROOT}/{id}.prof    the cProfile stats, for `python -m pstats` or snakeviz
+    {PROFILE_ROOT}/{id}.json    the request, its queries and its slowest functions
+
+The response links to the profile at /api/v1/profiles/{id}/ (admins only) in its X-Profile header. Only the newest
+PROFILE_KEEP profiles are kept. Requests that don't ask for a profile just pay for the header and parameter lookup.
+"""
+
+import io
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAMETER = 'profile'
+RESPONSE_HEADER = 'X-Profile'
+# functions listed in the summary, by cumulative time
+TOP_FUNCTIONS = 40
+
+
+def get_root(root=None) -> str:
+    return root or settings.PROFILE_ROOT
+
+
+def requested(request) -> bool:
+    return HEADER in request.META or QUERY_PARAMETER in request.GET
+
+
+def get_user(request):
+    """The user of the request by its session, or by its API token for the bot and other API clients, which
+    Django REST framework only authenticates in the view."""
+
+    if request.user.is_authenticated:
+        return request.user
+
+    try:
+        authenticated = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+
+    return authenticated[0] if authenticated else None
+
+
+def profile(request, get_response):
+    """Run the request under cProfile with its queries recorded, save the profile and link it in the response."""
+
+    profiler, queries = cProfile.Profile(), []
+
+    def record(execute, sql, params, many, context):
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            queries.append({'alias': context['connection'].alias, 'sql': sql,
+                            'ms': (time.perf_counter() - started) * 1000})
+
+    started = time.perf_counter()
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record))
+
+        profiler.enable()
+
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+
+    match = getattr(request, 'resolver_match', None)
+    profile_id = save(profiler, {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'user': request.user.get_username() if request.user.is_authenticated else None,
+        'status': response.status_code,
+        'ms': (time.perf_counter() - started) * 1000,
+        'db_ms': sum(query['ms'] for query in queries),
+        'created_on': timezone.now().isoformat(),
+    }, queries)
+
+    response[RESPONSE_HEADER] = reverse('profile', kwargs={'profile_id': profile_id})
+    return response
+
+
+def save(profiler, meta: dict, queries: list, root=None) -> str:
+    root = get_root(root)
+    profile_id = str(uuid.uuid4())
+    os.makedirs(root, exist_ok=True)
+    profiler.dump_stats(os.path.join(root, f"{profile_id}.prof"))
+
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+    with open(os.path.join(root, f"{profile_id}.json"), 'w') as f:
+        json.dump({'id': profile_id, **meta, 'queries': queries, 'functions': functions.getvalue()}, f, indent=2)
+
+    prune(root)
+    return profile_id
+
+
+def prune(root=None):
+    """Delete all but the newest settings.PROFILE_KEEP profiles."""
+
+    root = get_root(root)
+    summaries = sorted((name for name in os.listdir(root) if name.endswith('.json')),
+                       key=lambda name: os.path.getmtime(os.path.join(root, name)), reverse=True)
+
+    for name in summaries[settings.PROFILE_KEEP:]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(root, name[:-len('.json')] + extension))
+            except FileNotFoundError:
+                pass
+
+
+def stats_path(profile_id, root=None) -> str:
+    return os.path.join(get_root(root), f"{profile_id}.prof")
+
+
+def load(profile_id, root=None):
+    """The summary of a profile, None if there is none or it was pruned."""
+
+    try:
+        with open(os.path.join(get_root(root), f"{profile_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,66 @@
+import random
+import contextvars
+
+from django.conf import settings
+from django.db import connections
+
+# Reads only go to a replica while a request that may use one is being handled, everything else like
+# management commands and the task runner always uses the primary.
+replica_state = contextvars.ContextVar('replica_state', default=None)
+
+# sessions are written on login and read on the very next request, replication lag would log people out
+PRIMARY_ONLY_APPS = frozenset(('sessions',))
+
+
+class ReplicaState:
+    def __init__(self, use_replica: bool):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def start_request(use_replica: bool):
+    return replica_state.set(ReplicaState(use_replica))
+
+
+def finish_request(token) -> bool:
+    """Forget the request's routing state, and return whether it wrote to the primary."""
+
+    state = replica_state.get()
+    replica_state.reset(token)
+    return state.wrote if state else False
+
+
+class ReplicaRouter:
+    """Send reads of read-only requests to a random replica from `settings.DATABASE_REPLICAS`,
+    and everything else to the primary (`default`)."""
+
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+
+        if state is None or not state.use_replica or state.wrote or not settings.DATABASE_REPLICAS:
+            return 'default'
+
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+
+        # reads in a transaction, like select_for_update(), belong to the primary
+        if connections['default'].in_atomic_block:
+            return 'default'
+
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = replica_state.get()
+
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            # read your own writes for the rest of this request, and the client's next few ones
+            state.wrote = True
+
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,189 @@
+"""
+Fuzzy search over users (username, Discord username) and organizations (name, abbreviation).
+
+On PostgreSQL, matches come from pg_trgm GIN indexes on the upper-cased columns (see migration 0010), which serve
+both `icontains` and the trigram similarity operator. Other databases use an in-process trigram index that each
+process builds on its first search and rebuilds once a user or organization was added, renamed or deleted.
+"""
+
+import re
+import math
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Greatest, Upper
+
+from . import models
+from .caching import bump_versions, get_version
+
+# pg_trgm's default for the % operator, the fallback uses the same so results don't depend on the database
+SIMILARITY_THRESHOLD = 0.3
+
+USERS = 'users'
+CORPORATIONS = 'corporations'
+
+FIELDS = {
+    USERS: ('username', 'discord_username'),
+    CORPORATIONS: ('name', 'abbreviation'),
+}
+
+
+def trigrams(text: str) -> set:
+    """The trigrams of `text` the way pg_trgm extracts them: per lower-cased word, padded with two leading and
+    one trailing space."""
+
+    grams = set()
+
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    return grams
+
+
+def similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class TrigramIndex:
+    def __init__(self, documents):
+        """`documents` are (pk, texts) pairs."""
+
+        self.texts = {}
+        self.postings = defaultdict(set)
+
+        for pk, texts in documents:
+            entries = tuple((text.lower(), trigrams(text)) for text in texts if text)
+            self.texts[pk] = entries
+
+            for _, grams in entries:
+                for gram in grams:
+                    self.postings[gram].add(pk)
+
+    def containing(self, query: str) -> set:
+        # a text contains a query of three or more characters only if it has all of the query's inner trigrams,
+        # shorter queries are matched at the start of words
+        if len(query) < 3:
+            return self.postings.get(f"  {query}"[-3:], set()) if query.isalnum() else set()
+
+        inner = sorted((self.postings.get(query[i:i + 3], set()) for i in range(len(query) - 2)), key=len)
+        return set.intersection(*inner)
+
+    def similar(self, grams: set) -> set:
+        """The pks of texts that share enough trigrams with `grams` to be similar."""
+
+        shared = Counter()
+
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        # the similarity can't be higher than shared / len(grams)
+        needed = math.ceil(SIMILARITY_THRESHOLD * len(grams))
+        return {pk for pk, count in shared.items() if count >= needed}
+
+    def search(self, query: str, limit: int = None) -> list:
+        """The `limit` best matching pks: texts that contain `query`, shortest first, then similar texts, most
+        similar first."""
+
+        query = query.strip().lower()
+        grams = trigrams(query)
+        containing = self.containing(query)
+        ranked = []
+
+        for pk in containing:
+            lengths = [len(text) for text, _ in self.texts[pk] if query in text]
+
+            if lengths:
+                ranked.append((0, min(lengths), self.texts[pk][0][0], pk))
+
+        # one or two characters are too short for similarity to mean anything
+        similar = self.similar(grams) - containing if len(query) >= 3 else set()
+
+        for pk in similar:
+            score = max(similarity(grams, text_grams) for _, text_grams in self.texts[pk])
+
+            if score >= SIMILARITY_THRESHOLD:
+                ranked.append((1, -score, self.texts[pk][0][0], pk))
+
+        best = sorted(ranked) if limit is None else heapq.nsmallest(limit, ranked)
+        return [pk for *_, pk in best]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def index_version_key(kind: str) -> str:
+    return f"search-index-version:{kind}"
+
+
+def invalidate_index(kind: str):
+    bump_versions([index_version_key(kind)])
+
+
+def get_index(kind: str) -> TrigramIndex:
+    version = get_version(index_version_key(kind))
+    cached = _indexes.get(kind)
+
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        model = models.User if kind == USERS else models.Corporation
+        rows = model.objects.values_list('pk', *FIELDS[kind]).iterator(chunk_size=5000)
+        index = TrigramIndex((pk, texts) for pk, *texts in rows)
+        _indexes[kind] = (version, index)
+        return index
+
+
+def postgres_search(queryset, kind: str, query: str, limit: int):
+    upper = query.upper()
+    condition = Q()
+
+    for field in FIELDS[kind]:
+        queryset = queryset.annotate(**{f'{field}_upper': Upper(field)})
+        condition |= Q(**{f'{field}__icontains': query}) | Q(**{f'{field}_upper__trigram_similar': upper})
+
+    rank = Greatest(*(TrigramSimilarity(f'{field}_upper', upper) for field in FIELDS[kind]))
+    return list(queryset.filter(condition).annotate(rank=rank).order_by('-rank', FIELDS[kind][0])[:limit])
+
+
+def fallback_search(queryset, kind: str, query: str, limit: int):
+    index = get_index(kind)
+
+    # the index covers all rows, `queryset` may be narrower, then the whole ranking is needed
+    for window in (limit * 4, None):
+        ranked = index.search(query, window)
+        found = queryset.in_bulk(ranked)
+        results = [found[pk] for pk in ranked if pk in found]
+
+        if len(results) >= limit or len(ranked) < (window or 0):
+            break
+
+    return results[:limit]
+
+
+def search(queryset, kind: str, query: str, limit: int = None) -> list:
+    query = query.strip()
+    limit = limit or settings.SEARCH_RESULT_LIMIT
+
+    if not query:
+        return []
+
+    if connections[queryset.db].vendor == 'postgresql':
+        return postgres_search(queryset, kind, query, limit)
+
+    return fallback_search(queryset, kind, query, limit)
+
+
+def search_users(query: str, queryset=None, limit: int = None) -> list:
+    return search(models.User.objects.all() if queryset is None else queryset, USERS, query, limit)
+
+
+def search_corporations(query: str, queryset=None, limit: int = None) -> list:
+    return search(models.Corporation.objects.all() if queryset is None else queryset, CORPORATIONS, query, limit)
@@ -1,14 +1,20 @@
 import decimal
 import uuid
 
+from functools import partial
+from django.db import transaction
 from django.dispatch import receiver
+from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
-from guardian.shortcuts import assign_perm, remove_perm
+from guardian.models import UserObjectPermission
+from guardian.shortcuts import assign_perm, remove_perm, get_users_with_perms
 from django.db.models.signals import post_save, post_delete
 
 from . import models
 from . import util
-from .tasks import discord_dm_notification
+from .caching import invalidate_account_lists, invalidate_marketplace
+from .search import invalidate_index, USERS, CORPORATIONS
+from .notifications import queue_dm
 
 
 @receiver(post_save, sender=models.Account)
@@ -32,12 +38,11 @@ def set_employee_permissions(sender, instance, **kwargs):
 
 @receiver(post_delete, sender=models.Employee)
 def remove_employee_permissions(sender, instance, **kwargs):
-    remove_perm('bank.view_corporation',
-                user_or_group=instance.person, obj=instance.corporation)
-    remove_perm('bank.change_corporation',
-                user_or_group=instance.person, obj=instance.corporation)
-    remove_perm('bank.add_corp_account',
-                user_or_group=instance.person, obj=instance.corporation)
+    # what remove_perm() does for each of them, with one query for all three
+    UserObjectPermission.objects.filter(
+        user=instance.person, content_type=ContentType.objects.get_for_model(instance.corporation),
+        object_pk=str(instance.corporation.pk),
+        permission__codename__in=['view_corporation', 'change_corporation', 'add_corp_account']).delete()
     remove_perm('bank.view_account', user_or_group=instance.person,
                 obj=instance.corporation.account_set.all())
 
@@ -108,11 +113,88 @@ def override_default_account(sender, instance, **kwargs):
         account.save()
 
 
+# Cached account lists (see bank/caching.py) are invalidated once the change that affects them has committed,
+# so that no other request can cache the old state again under the new version.
+
+@receiver(post_save, sender=models.User)
+def rename_individual_accounts(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'username' not in update_fields:
+        return
+
+    models.Account.objects.filter(individual_holder=instance).exclude(holder_name=instance.username).update(
+        holder_name=instance.username, holder_type=models.Account.HolderTypes.INDIVIDUAL)
+
+
+@receiver(post_save, sender=models.Corporation)
+def rename_corporate_accounts(sender, instance, **kwargs):
+    models.Account.objects.filter(corporate_holder=instance).exclude(holder_name=instance.name).update(
+        holder_name=instance.name, holder_type=models.Account.HolderTypes.CORPORATE)
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def invalidate_user_search(sender, instance, update_fields=None, **kwargs):
+    # logins only update last_login
+    if update_fields is None or {'username', 'discord_username'} & set(update_fields):
+        transaction.on_commit(partial(invalidate_index, USERS))
+
+
+@receiver(post_save, sender=models.Corporation)
+@receiver(post_delete, sender=models.Corporation)
+def invalidate_corporation_search(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_index, CORPORATIONS))
+
+
+def invalidate_account_viewers(account):
+    invalidate_account_lists(get_users_with_perms(account, only_with_perms_in=['view_account'],
+                                                  with_group_users=False).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=models.Account)
+@receiver(post_delete, sender=models.Account)
+def invalidate_account_list_on_account_change(sender, instance, **kwargs):
+    # balance changes by transactions are account saves too
+    transaction.on_commit(partial(invalidate_account_viewers, instance))
+
+
+@receiver(post_save, sender=models.Employee)
+@receiver(post_delete, sender=models.Employee)
+def invalidate_account_list_on_employment_change(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_account_lists, [instance.person_id]))
+
+
+@receiver(post_save, sender=models.Corporation)
+@receiver(post_delete, sender=models.Corporation)
+def invalidate_account_list_on_corporation_change(sender, instance, **kwargs):
+    # the organization's name is shown in the list, and its owner could've changed
+    user_ids = [instance.owner_id]
+
+    if kwargs.get('created') is False:
+        user_ids.extend(instance.employee_set.values_list('person_id', flat=True))
+
+    transaction.on_commit(partial(invalidate_account_lists, user_ids))
+
+
+@receiver(post_save, sender=models.Corporation)
+@receiver(post_delete, sender=models.Corporation)
+@receiver(post_save, sender=models.FeaturedCorporation)
+@receiver(post_delete, sender=models.FeaturedCorporation)
+def invalidate_marketplace_on_change(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_marketplace)
+
+
+# Notifications are written to the outbox in the surrounding database transaction, so they commit or roll back
+# with it. Only their delivery waits for the commit, see notifications.queue_dm().
+
 @receiver(post_save, sender=models.Transaction)
 def send_transaction_dm(sender, instance, created, **kwargs):
     if not created:
         return
 
+    queue_transaction_dm(instance)
+
+
+def queue_transaction_dm(instance):
     targets = instance.to_account.get_discord_ids()
 
     if not targets:
@@ -134,7 +216,7 @@ def send_transaction_dm(sender, instance, created, **kwargs):
     util.add_field(embed, name="Purpose", value=instance.purpose, inline=False)
     payload = {'targets': list(set(targets)), 'message': '', 'embed': embed}
 
-    discord_dm_notification(payload)
+    queue_dm(payload, transaction_id=instance.pk)
 
 
 @receiver(post_save, sender=models.EmployeeInvitation)
@@ -142,6 +224,10 @@ def send_invite_sent_dm(sender, instance, created, **kwargs):
     if not created:
         return
 
+    queue_invite_sent_dm(instance)
+
+
+def queue_invite_sent_dm(instance):
     # person was invited
 
     target = instance.potential_employee
@@ -157,11 +243,15 @@ def send_invite_sent_dm(sender, instance, created, **kwargs):
     payload = {'targets': [target.discord_id],
                'message': '', 'embed': embed}
 
-    discord_dm_notification(payload)
+    queue_dm(payload)
 
 
 @receiver(post_delete, sender=models.EmployeeInvitation)
 def send_invite_accept_reject_dm(sender, instance, **kwargs):
+    queue_invite_accept_reject_dm(instance)
+
+
+def queue_invite_accept_reject_dm(instance):
     targets = instance.corporation.get_discord_ids()
 
     if not targets:
@@ -186,4 +276,4 @@ def send_invite_accept_reject_dm(sender, instance, **kwargs):
 
     payload = {'targets': list(set(targets)), 'message': '', 'embed': embed}
 
-    discord_dm_notification(payload)
+    queue_dm(payload)
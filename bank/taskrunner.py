@@ -0,0 +1,312 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import importlib
+import traceback
+
+from datetime import timedelta
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+
+from django import db
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F, Min
+from django.utils import timezone
+
+from . import metrics, models
+
+logger = logging.getLogger(__name__)
+
+Priorities = models.QueuedTask.Priorities
+THREAD = 'thread'
+PROCESS = 'process'
+
+registry = {}
+
+
+class TaskDefinition:
+    def __init__(self, func, *, priority, executor, max_attempts):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.priority = priority
+        self.executor = executor
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def schedule(self, *, args=(), kwargs=None, priority=None, run_at=None, repeat=None, unique=False):
+        """Queue this task. With `unique`, nothing is queued if this task is already waiting to be run
+        with the same arguments."""
+
+        arguments = {'args': list(args), 'kwargs': kwargs or {}}
+        priority = self.priority if priority is None else priority
+
+        if unique:
+            waiting = models.QueuedTask.objects.filter(name=self.name, arguments=arguments, started_on__isnull=True,
+                                                       finished_on__isnull=True)
+
+            # a more urgent request for the same work moves the waiting task into the faster lane
+            if waiting.exists():
+                waiting.filter(priority__gt=priority).update(priority=priority)
+                return None
+
+        return models.QueuedTask.objects.create(name=self.name, arguments=arguments, priority=priority,
+                                                run_at=run_at or timezone.now(), repeat=repeat)
+
+    def delay(self, *args, **kwargs):
+        return self.schedule(args=args, kwargs=kwargs)
+
+
+def task(func=None, *, priority=Priorities.NORMAL, executor=THREAD, max_attempts=3):
+    """Register a function as a task. I/O bound tasks run in the runner's thread pool,
+    CPU heavy ones should use `executor=PROCESS`."""
+
+    if func is None:
+        return lambda f: task(f, priority=priority, executor=executor, max_attempts=max_attempts)
+
+    definition = TaskDefinition(func, priority=priority, executor=executor, max_attempts=max_attempts)
+    registry[definition.name] = definition
+    return definition
+
+
+def get_definition(name: str) -> TaskDefinition:
+    if name not in registry:
+        # importing the module registers its tasks
+        importlib.import_module(name.rsplit('.', 1)[0])
+
+    return registry[name]
+
+
+def schedule_next(queued, now):
+    if queued.repeat:
+        models.QueuedTask.objects.create(name=queued.name, arguments=queued.arguments, priority=queued.priority,
+                                         repeat=queued.repeat, run_at=max(queued.run_at + queued.repeat, now))
+
+
+def execute_task(task_id: int):
+    """Run a claimed task and record its outcome. Runs in a worker thread or a worker process."""
+
+    db.close_old_connections()
+    queued = models.QueuedTask.objects.get(pk=task_id)
+    now = timezone.now()
+
+    try:
+        definition = get_definition(queued.name)
+        definition(*queued.arguments.get('args', []), **queued.arguments.get('kwargs', {}))
+    except Exception:
+        definition = registry.get(queued.name)
+        max_attempts = definition.max_attempts if definition else 1
+        attempts = queued.attempts + 1
+        update = {'attempts': attempts, 'last_error': traceback.format_exc(), 'locked_by': None,
+                  'locked_at': None, 'started_on': None}
+
+        if attempts >= max_attempts:
+            update['finished_on'] = timezone.now()
+        else:
+            update['run_at'] = timezone.now() + timedelta(seconds=min(2 ** attempts, 300))
+
+        models.QueuedTask.objects.filter(pk=task_id).update(**update)
+        logger.exception("Task %s failed (attempt %s)", queued.name, attempts)
+
+        # a repeating task that gave up still runs again next time
+        if 'finished_on' in update:
+            schedule_next(queued, now)
+
+        return False
+    else:
+        finished = timezone.now()
+        models.QueuedTask.objects.filter(pk=task_id).update(finished_on=finished, last_error="")
+        schedule_next(queued, now)
+        return True
+    finally:
+        db.close_old_connections()
+
+
+def initialize_process():
+    django.setup()
+    # don't share the parent's database connections with the worker processes
+    db.connections.close_all()
+
+
+def record_duration(name: str, started: float, future):
+    # measured around the future, so that tasks in worker processes count in the runner's metrics too
+    if not future.cancelled():
+        metrics.observe_task(name, time.perf_counter() - started,
+                             future.exception() is not None or not future.result())
+
+
+def claim(worker_id: str, limit: int, *, names=None, exclude_names=None) -> list:
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.TASK_RUNNER_LOCK_TIMEOUT)
+    ready = models.QueuedTask.objects.filter(finished_on__isnull=True, run_at__lte=now)
+    ready = ready.filter(locked_at__isnull=True) | ready.filter(locked_at__lt=stale)
+
+    if names is not None:
+        ready = ready.filter(name__in=names)
+
+    if exclude_names:
+        ready = ready.exclude(name__in=exclude_names)
+
+    with transaction.atomic():
+        ids = list(ready.select_for_update(skip_locked=True).order_by('priority', 'run_at')
+                   .values_list('id', flat=True)[:limit])
+        # only the rows that no other runner claimed in the meantime are ours, for databases without SKIP LOCKED
+        models.QueuedTask.objects.filter(id__in=ids).filter(locked_at__isnull=True).update(
+            locked_by=worker_id, locked_at=now, started_on=now)
+        models.QueuedTask.objects.filter(id__in=ids, locked_at__lt=stale).update(
+            locked_by=worker_id, locked_at=now, started_on=now)
+
+    return list(models.QueuedTask.objects.filter(id__in=ids, locked_by=worker_id, locked_at=now)
+                .order_by('priority', 'run_at'))
+
+
+class TaskRunner:
+    def __init__(self, *, threads: int = None, processes: int = None, poll_interval: float = None):
+        self.threads = settings.TASK_RUNNER_THREADS if threads is None else threads
+        self.processes = settings.TASK_RUNNER_PROCESSES if processes is None else processes
+        self.poll_interval = settings.TASK_RUNNER_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.thread_pool = ThreadPoolExecutor(max_workers=max(self.threads, 1))
+        self.process_pool = ProcessPoolExecutor(max_workers=self.processes, initializer=initialize_process) \
+            if self.processes else None
+        # running futures and the ids of their tasks
+        self.running = {THREAD: {}, PROCESS: {}}
+        self.last_heartbeat = time.monotonic()
+
+    def free_slots(self, executor: str) -> int:
+        for future, task_id in list(self.running[executor].items()):
+            if future.done():
+                del self.running[executor][future]
+
+                if future.exception() is not None:
+                    self.release(task_id, future.exception())
+
+        return (self.threads if executor == THREAD else self.processes) - len(self.running[executor])
+
+    def process_task_names(self) -> list:
+        return [name for name, definition in registry.items() if definition.executor == PROCESS]
+
+    def submit(self, executor: str, queued):
+        if executor == PROCESS:
+            # the worker process closes its own database connections, don't hand it ours
+            future = self.process_pool.submit(execute_task, queued.id)
+        else:
+            future = self.thread_pool.submit(execute_task, queued.id)
+
+        self.running[executor][future] = queued.id
+        future.add_done_callback(partial(record_duration, queued.name, time.perf_counter()))
+
+    def release(self, task_id: int, error: BaseException):
+        # the worker failed outside of the task itself, e.g. because the database was unavailable, so the task
+        # may not have run. Let it be claimed again right away instead of waiting for the lock to time out.
+        logger.error("Worker failed while running task %s: %r", task_id, error)
+
+        try:
+            models.QueuedTask.objects.filter(pk=task_id, locked_by=self.worker_id, finished_on__isnull=True).update(
+                locked_by=None, locked_at=None, started_on=None)
+        except db.DatabaseError:
+            logger.exception("Couldn't release task %s", task_id)
+
+    def heartbeat(self):
+        """Renew the claims of the running tasks, so that tasks that run longer than TASK_RUNNER_LOCK_TIMEOUT
+        aren't claimed and run a second time by another runner. Claims of a runner that died go stale."""
+
+        self.last_heartbeat = time.monotonic()
+        task_ids = [task_id for running in self.running.values() for task_id in running.values()]
+
+        if not task_ids:
+            return
+
+        try:
+            models.QueuedTask.objects.filter(id__in=task_ids, locked_by=self.worker_id,
+                                             finished_on__isnull=True).update(locked_at=timezone.now())
+        except db.DatabaseError:
+            logger.exception("Couldn't renew the claims of tasks %s", task_ids)
+
+    def run_once(self) -> int:
+        """Claim as many tasks as there are free workers, and hand them to the pools."""
+
+        if time.monotonic() - self.last_heartbeat >= settings.TASK_RUNNER_LOCK_TIMEOUT / 4:
+            self.heartbeat()
+
+        process_names = self.process_task_names()
+        claimed = 0
+
+        if self.process_pool is not None and process_names:
+            slots = self.free_slots(PROCESS)
+
+            if slots > 0:
+                for queued in claim(self.worker_id, slots, names=process_names):
+                    self.submit(PROCESS, queued)
+                    claimed += 1
+
+        slots = self.free_slots(THREAD)
+
+        if slots > 0:
+            # without a process pool, CPU heavy tasks run in the thread pool too
+            exclude = process_names if self.process_pool is not None else None
+
+            for queued in claim(self.worker_id, slots, exclude_names=exclude):
+                self.submit(THREAD, queued)
+                claimed += 1
+
+        return claimed
+
+    def busy(self) -> bool:
+        return self.free_slots(THREAD) < self.threads or \
+            (self.process_pool is not None and self.free_slots(PROCESS) < self.processes)
+
+    def run(self, *, drain=False, on_idle=None):
+        """Run until interrupted. With `drain`, return once there is nothing left to run."""
+
+        try:
+            while True:
+                claimed = self.run_once()
+
+                if not claimed:
+                    if drain and not self.busy():
+                        return
+
+                    if on_idle is not None:
+                        on_idle()
+
+                    time.sleep(self.poll_interval if not self.busy() else min(self.poll_interval, 0.05))
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=True)
+
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
+
+
+def queue_statistics() -> dict:
+    now = timezone.now()
+    waiting = models.QueuedTask.objects.filter(finished_on__isnull=True, started_on__isnull=True, run_at__lte=now)
+    lanes = {priority.label.lower(): {'depth': 0, 'oldest_seconds': 0.0} for priority in Priorities}
+
+    for row in waiting.values('priority').annotate(depth=Count('id'), oldest=Min('run_at')).order_by():
+        lanes[Priorities(row['priority']).label.lower()] = {
+            'depth': row['depth'],
+            'oldest_seconds': (now - row['oldest']).total_seconds()
+        }
+
+    last_hour = models.QueuedTask.objects.filter(started_on__gte=now - timedelta(hours=1))
+    timings = last_hour.filter(finished_on__isnull=False).aggregate(
+        latency=Avg(F('started_on') - F('run_at')), duration=Avg(F('finished_on') - F('started_on')))
+
+    return {
+        'lanes': lanes,
+        'running': models.QueuedTask.objects.filter(started_on__isnull=False, finished_on__isnull=True).count(),
+        'scheduled': models.QueuedTask.objects.filter(finished_on__isnull=True, run_at__gt=now).count(),
+        'failed': models.QueuedTask.objects.filter(finished_on__isnull=False).exclude(last_error="").count(),
+        'mean_latency_seconds': timings['latency'].total_seconds() if timings['latency'] else 0.0,
+        'mean_duration_seconds': timings['duration'].total_seconds() if timings['duration'] else 0.0,
+    }
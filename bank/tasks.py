@@ -1,10 +1,37 @@
-import requests
+from datetime import timedelta
 
 from django.conf import settings
 
-from background_task import background
+from . import models, notifications, partitions
+from .taskrunner import task, Priorities
 
 
-@background(schedule=10)
-def discord_dm_notification(payload):
-    requests.post(settings.DEMOCRACIV_DISCORD_BOT_DM_ENDPOINT, json=payload)
+@task(priority=Priorities.HIGH, max_attempts=settings.NOTIFICATION_MAX_ATTEMPTS)
+def deliver_notifications():
+    totals = notifications.deliver_pending()
+
+    if totals['failed']:
+        # nothing else would pick the failed notifications up again, so let the runner retry with backoff
+        raise notifications.DeliveryError(f"{totals['failed']} notifications couldn't be delivered")
+
+
+@task(priority=Priorities.BULK)
+def send_notification_digests(mode: str):
+    notifications.send_digests(mode)
+
+
+@task(priority=Priorities.BULK)
+def ensure_transaction_partitions():
+    partitions.ensure_partitions()
+
+
+def schedule_periodic_tasks():
+    """Queue the repeating tasks unless they're already waiting to be run."""
+
+    send_notification_digests.schedule(args=(models.User.NotificationModes.HOURLY,),
+                                       repeat=timedelta(hours=1), unique=True)
+    send_notification_digests.schedule(args=(models.User.NotificationModes.DAILY,),
+                                       repeat=timedelta(days=1), unique=True)
+
+    if partitions.is_partitioned():
+        ensure_transaction_partitions.schedule(repeat=timedelta(days=1), unique=True)
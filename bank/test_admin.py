@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from djmoney.money import Money
+
+from . import models
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(username="admin", password="admin")
+        self.user = get_user_model().objects.create(username="test")
+        self.sender = models.Account.objects.create(individual_holder=self.user, name="Sender",
+                                                    balance=Money(100, 'USD'))
+        self.receiver = models.Account.objects.create(individual_holder=self.admin, name="Receiver",
+                                                      balance=Money(0, 'USD'))
+
+        for amount in (10, 20, 30):
+            models.Transaction.objects.create(from_account=self.sender, to_account=self.receiver,
+                                              amount=Money(amount, 'USD'), authorized_by=self.user)
+
+        self.client.force_login(self.admin)
+
+    def test_transaction_changelist_queries_dont_grow_with_rows(self):
+        self.client.get('/admin/bank/transaction/')
+
+        # the row count is cached after the first page view
+        with self.assertNumQueries(3):
+            response = self.client.get('/admin/bank/transaction/')
+
+        self.assertContains(response, "Sender")
+
+        for amount in (40, 50):
+            models.Transaction.objects.create(from_account=self.sender, to_account=self.receiver,
+                                              amount=Money(amount, 'USD'), authorized_by=self.user)
+
+        with self.assertNumQueries(3):
+            self.client.get('/admin/bank/transaction/')
+
+    def test_revoke(self):
+        revoked = models.Transaction.objects.filter(amount__in=[Money(10, 'USD'), Money(20, 'USD')])
+        self.client.post('/admin/bank/transaction/', {'action': 'revoke', '_selected_action': [
+            str(pk) for pk in revoked.values_list('pk', flat=True)]})
+
+        self.sender.refresh_from_db()
+        self.receiver.refresh_from_db()
+        self.assertEqual(self.sender.balance, Money(70, 'USD'))
+        self.assertEqual(self.receiver.balance, Money(30, 'USD'))
+        self.assertEqual(models.Transaction.objects.filter(
+            state=models.Transaction.TransactionState.REVOKED).count(), 2)
+
+        # revoking again doesn't refund twice
+        models.revoke_transactions(models.Transaction.objects.all())
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, Money(100, 'USD'))
+
+    def test_transactions_are_read_only(self):
+        transaction = models.Transaction.objects.first()
+        url = f'/admin/bank/transaction/{transaction.pk}/change/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.post(url, {'from_account': self.sender.pk, 'to_account': self.receiver.pk,
+                               'amount_0': '10', 'amount_1': 'USD', 'purpose': "Edited"})
+        self.assertEqual(self.client.get('/admin/bank/transaction/add/').status_code, 403)
+
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, Money(40, 'USD'))
+        self.assertEqual(models.Transaction.objects.count(), 3)
+
+    def test_freeze(self):
+        self.client.post('/admin/bank/account/', {'action': 'freeze_accounts',
+                                                  '_selected_action': [str(self.sender.pk)]})
+
+        self.sender.refresh_from_db()
+        self.receiver.refresh_from_db()
+        self.assertTrue(self.sender.is_frozen)
+        self.assertFalse(self.receiver.is_frozen)
@@ -0,0 +1,98 @@
+import datetime
+import tempfile
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from djmoney.money import Money
+
+from . import archive, models
+
+
+class TransactionArchiveTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.archive_settings = override_settings(TRANSACTION_ARCHIVE_ROOT=self.root.name)
+        self.archive_settings.enable()
+
+        long_ago = datetime.datetime(2020, 1, 15, tzinfo=datetime.timezone.utc)
+        self.user = get_user_model().objects.create(username="test", password="test")
+        self.account_1 = models.Account.objects.create(individual_holder=self.user, balance=Money(100, 'USD'),
+                                                       created_on=long_ago)
+        self.account_2 = models.Account.objects.create(individual_holder=self.user, created_on=long_ago)
+
+        for day, amount in ((0, 1), (10, 2), (45, 4)):
+            models.Transaction.objects.create(from_account=self.account_1, to_account=self.account_2,
+                                              amount=Money(amount, 'USD'),
+                                              created_on=long_ago + datetime.timedelta(days=day))
+
+        self.recent = models.Transaction.objects.create(from_account=self.account_1, to_account=self.account_2,
+                                                        amount=Money(8, 'USD'))
+
+    def tearDown(self):
+        self.archive_settings.disable()
+        self.root.cleanup()
+
+    def test_archive_and_read_through(self):
+        summaries = archive.archive_before(timezone.now().date())
+
+        self.assertListEqual([(summary['file'], summary['rows'], summary['total'], summary['deleted'])
+                              for summary in summaries],
+                             [("USD/2020-01", 2, "3.00", 2), ("USD/2020-02", 1, "4.00", 1)])
+        self.assertQuerysetEqual(models.Transaction.objects.all(), [self.recent])
+
+        archived = archive.transactions_for_account(self.account_2)
+        self.assertListEqual(sorted(transaction.amount.amount for transaction in archived), [1, 2, 4])
+        self.assertEqual(archived[0].from_account, self.account_1)
+
+        # nothing left to archive, running it again is harmless
+        self.assertListEqual(archive.archive_before(timezone.now().date()), [])
+
+    def test_account_history_reads_through(self):
+        archive.archive_before(timezone.now().date())
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('bank:account-detail', kwargs={'pk': self.account_1.pk}))
+        self.assertEqual(len(response.context['table'].rows), 4)
+        self.assertContains(response, "Archived", count=3)
+
+        response = self.client.get(reverse('bank:account-detail', kwargs={'pk': self.account_1.pk}),
+                                   {'_export': 'csv'})
+        self.assertEqual(response.content.decode().count("USD"), 4)
+
+    def test_only_past_months(self):
+        with self.assertRaises(ValueError):
+            archive.archive_before(timezone.now().date() + datetime.timedelta(days=62))
+
+    def test_history_pages_only_read_the_archive_they_reach(self):
+        archive.archive_before(timezone.now().date())
+        self.client.force_login(self.user)
+        url = reverse('bank:account-detail', kwargs={'pk': self.account_1.pk})
+
+        with mock.patch.object(archive, 'read_rows', wraps=archive.read_rows) as read_rows:
+            response = self.client.get(url, {'per_page': 1})
+
+        read_rows.assert_not_called()
+        self.assertListEqual([row.record for row in response.context['table'].page.object_list], [self.recent])
+        self.assertEqual(response.context['table'].paginator.count, 4)
+
+        with mock.patch.object(archive, 'read_rows', wraps=archive.read_rows) as read_rows:
+            response = self.client.get(url, {'per_page': 1, 'page': 2})
+
+        # the newest archived month only
+        self.assertEqual(read_rows.call_count, 1)
+        self.assertListEqual([row.record.amount.amount for row in response.context['table'].page.object_list], [4])
+
+    def test_history_is_ordered_by_date(self):
+        archive.archive_before(timezone.now().date())
+        history = archive.AccountHistory(models.Transaction.objects.filter(from_account=self.account_1),
+                                         self.account_1)
+
+        self.assertListEqual([transaction.amount.amount for transaction in history], [8, 4, 2, 1])
+        self.assertListEqual([transaction.amount.amount for transaction in history[1:3]], [4, 2])
+
+        history.newest_first = False
+        self.assertListEqual([transaction.amount.amount for transaction in history[:3]], [1, 2, 4])
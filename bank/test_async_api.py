@@ -0,0 +1,104 @@
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from djmoney.money import Money
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+
+from . import models
+from .api.v1 import async_views
+
+
+class AsyncBotApiTestCase(TransactionTestCase):
+    def setUp(self):
+        self.bot = get_user_model().objects.create(username="bot", password="bot", is_staff=True)
+        self.token = Token.objects.create(user=self.bot)
+        self.user = get_user_model().objects.create(username="test", password="test", discord_id=1)
+        self.user_token = Token.objects.create(user=self.user)
+        self.second_user = get_user_model().objects.create(username="second", password="user", discord_id=2)
+        self.account_1 = models.Account.objects.create(individual_holder=self.user, currency='USD',
+                                                      balance=Money(25, 'USD'))
+        self.account_2 = models.Account.objects.create(individual_holder=self.second_user, currency='USD')
+
+    def auth(self, token=None):
+        return {'authorization': f"Token {token or self.token.key}"}
+
+    async def test_requires_admin(self):
+        response = await self.async_client.get('/api/v1/async/discord_user/1/')
+        self.assertEqual(response.status_code, 403)
+
+        response = await self.async_client.get('/api/v1/async/discord_user/1/',
+                                               **self.auth(self.user_token.key))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_discord_user(self):
+        response = await self.async_client.get('/api/v1/async/discord_user/1/', **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], "test")
+
+        response = await self.async_client.get('/api/v1/async/discord_user/3/', **self.auth())
+        self.assertEqual(response.status_code, 404)
+
+    async def test_accounts_per_discord_user(self):
+        response = await self.async_client.get('/api/v1/async/accounts/1/', **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([account['iban'] for account in response.json()], [str(self.account_1.iban)])
+
+    async def test_default_account(self):
+        response = await self.async_client.get('/api/v1/async/default_account/?discord_id=2&currency=USD',
+                                               **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['iban'], str(self.account_2.iban))
+
+        response = await self.async_client.get('/api/v1/async/default_account/?discord_id=2&currency=CIV',
+                                               **self.auth())
+        self.assertEqual(response.status_code, 400)
+
+    async def test_currencies(self):
+        response = await self.async_client.get('/api/v1/async/currencies/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('result', response.json())
+
+    async def test_send(self):
+        data = {'discord_id': 1, 'from_account': str(self.account_1.iban), 'to_account': str(self.account_2.iban),
+                'amount': '10', 'purpose': 'Test'}
+        response = await self.async_client.post('/api/v1/async/send/', data=data, content_type="application/json",
+                                                **self.auth())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['safe_to_account'], "second")
+
+        data['amount'] = '100'
+        response = await self.async_client.post('/api/v1/async/send/', data=data, content_type="application/json",
+                                                **self.auth())
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncAccountsQueriesTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test", password="test", discord_id=1)
+        self.other = get_user_model().objects.create(username="other", password="other")
+        self.other_account = models.Account.objects.create(individual_holder=self.other, currency='USD')
+
+    def add_account(self):
+        account = models.Account.objects.create(individual_holder=self.user, currency='USD',
+                                                balance=Money(10, 'USD'))
+        models.Transaction.objects.create(from_account=account, to_account=self.other_account,
+                                          amount=Money(1, 'USD'))
+
+    def count_queries(self):
+        # the function the view runs in its worker thread
+        serialize = async_views.serialize_accounts_per_discord_user.func.__wrapped__
+
+        with CaptureQueriesContext(connection) as queries:
+            serialize(1)
+
+        return len(queries)
+
+    def test_accounts_are_prefetched(self):
+        self.add_account()
+        one_account = self.count_queries()
+
+        for _ in range(3):
+            self.add_account()
+
+        self.assertEqual(self.count_queries(), one_account)
@@ -0,0 +1,69 @@
+import math
+import random
+import decimal
+
+from django.test import SimpleTestCase
+from djmoney.money import Money
+
+from . import cents
+from .api.v1.views import calculate_ottoman_tax
+
+
+def decimal_ottoman_tax(account_balance, equilibrium_balance):
+    # the formula as it was written with Decimals
+    tax = (account_balance - equilibrium_balance) / 2
+    pre_round_balance = account_balance - tax
+
+    if pre_round_balance > equilibrium_balance:
+        final_balance = 10 * math.floor(pre_round_balance / 10)
+    else:
+        final_balance = 10 * math.ceil(pre_round_balance / 10)
+
+    return account_balance - final_balance
+
+
+def random_amount(rng, digits=9) -> decimal.Decimal:
+    return decimal.Decimal(rng.randint(-10 ** digits, 10 ** digits)).scaleb(-2)
+
+
+class CentsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.rng = random.Random(44)
+
+    def test_conversions(self):
+        self.assertEqual(cents.to_cents(Money("12.34", "USD")), 1234)
+        self.assertEqual(cents.to_cents(decimal.Decimal("-0.01")), -1)
+        self.assertEqual(cents.to_cents(5), 500)
+        self.assertEqual(cents.to_money(1234, "USD"), Money("12.34", "USD"))
+        self.assertEqual(str(cents.to_decimal(-5)), "-0.05")
+
+        for text in ("12.3", "-12.30", ".5", "+7.07", "0", "1e3", "-0.005", "0.015", "2.675"):
+            self.assertEqual(cents.to_decimal(cents.parse_cents(text)),
+                             decimal.Decimal(text).quantize(cents.CENT, rounding=decimal.ROUND_HALF_EVEN), text)
+
+    def test_rounding_matches_decimal(self):
+        for _ in range(2000):
+            value = decimal.Decimal(self.rng.randint(-10 ** 8, 10 ** 8)).scaleb(-self.rng.randint(0, 5))
+            expected = value.quantize(cents.CENT, rounding=decimal.ROUND_HALF_EVEN)
+            self.assertEqual(cents.to_decimal(cents.to_cents(value)), expected, value)
+            self.assertEqual(cents.to_decimal(cents.parse_cents(str(value))), expected, value)
+
+    def test_divide_matches_decimal(self):
+        for _ in range(2000):
+            amount, divisor = self.rng.randint(-10 ** 8, 10 ** 8), self.rng.choice([-7, -2, 1, 2, 3, 4, 10, 365])
+            expected = (decimal.Decimal(amount) / divisor).quantize(decimal.Decimal(1),
+                                                                    rounding=decimal.ROUND_HALF_EVEN)
+            self.assertEqual(cents.divide(amount, divisor), expected, (amount, divisor))
+
+    def test_ottoman_tax_matches_decimal(self):
+        cases = [(decimal.Decimal("1000.00"), decimal.Decimal("500.00")),
+                 (decimal.Decimal("500.00"), decimal.Decimal("1000.00")),
+                 (decimal.Decimal("1000.00"), decimal.Decimal("1000.00")),
+                 (decimal.Decimal("0.00"), decimal.Decimal("19.99"))]
+        cases += [(random_amount(self.rng), random_amount(self.rng, 7)) for _ in range(2000)]
+
+        for balance, equilibrium in cases:
+            expected = decimal_ottoman_tax(balance, equilibrium)
+            self.assertEqual(cents.to_decimal(cents.ottoman_tax(cents.to_cents(balance), cents.to_cents(equilibrium))),
+                             expected, (balance, equilibrium))
+            self.assertEqual(calculate_ottoman_tax(balance, equilibrium), expected)
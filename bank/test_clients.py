@@ -0,0 +1,140 @@
+import time
+import threading
+import requests
+
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import SimpleTestCase
+
+from . import clients
+
+
+class StubBotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        server.requests.append(self.client_address)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        status = server.statuses.pop(0) if server.statuses else 200
+        body = b"ok"
+
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting
+            pass
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBotHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/dm"
+        self.client = clients.HttpClient(timeout=(1, 0.5), retries=2, backoff=0.01, backoff_max=0.02,
+                                         breaker_threshold=3, breaker_reset_timeout=0.2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        for _ in range(5):
+            self.assertEqual(self.client.post(self.url, json={}).status_code, 200)
+
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(set(self.server.requests)), 1)
+
+    def test_retry_on_server_error(self):
+        self.server.statuses = [503, 502]
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_post_is_not_retried_once_sent(self):
+        self.server.statuses = [503]
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 503)
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.server.delay = 1
+
+        with self.assertRaises(requests.ReadTimeout):
+            self.client.post(self.url, json={})
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_client_error_is_not_retried(self):
+        self.server.statuses = [400]
+
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 400)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout(self):
+        self.server.delay = 1
+
+        started = time.monotonic()
+
+        with self.assertRaises(requests.Timeout):
+            self.client.post(self.url, json={}, retries=0)
+
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_circuit_breaker_sheds_load(self):
+        self.server.statuses = [503] * 3
+
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        self.assertEqual(self.client.breaker_for(self.url).state, clients.CircuitBreaker.OPEN)
+
+        with self.assertRaises(clients.CircuitOpenError):
+            self.client.post(self.url, json={})
+
+        self.assertEqual(len(self.server.requests), 3)
+
+        time.sleep(0.25)
+        self.assertEqual(self.client.breaker_for(self.url).state, clients.CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 200)
+        self.assertEqual(self.client.breaker_for(self.url).state, clients.CircuitBreaker.CLOSED)
+
+    def test_failed_trial_request_reopens_circuit(self):
+        breaker = self.client.breaker_for(self.url)
+
+        for _ in range(3):
+            breaker.record_failure()
+
+        time.sleep(0.25)
+
+        with mock.patch.object(self.client.session, 'request', side_effect=requests.exceptions.ChunkedEncodingError):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                self.client.post(self.url, json={})
+
+        self.assertEqual(breaker.state, clients.CircuitBreaker.OPEN)
+        time.sleep(0.25)
+        self.assertEqual(self.client.post(self.url, json={}).status_code, 200)
+        self.assertEqual(breaker.state, clients.CircuitBreaker.CLOSED)
+
+    def test_unreachable_host(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        with self.assertRaises(requests.ConnectionError):
+            self.client.post(self.url, json={})
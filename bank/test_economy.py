@@ -0,0 +1,50 @@
+import collections
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.test import TestCase
+from django.urls import reverse
+
+from . import cents, economy, models
+
+
+class EconomyTestCase(TestCase):
+    def setUp(self):
+        self.created = economy.generate(40, 600, corporations=5, currencies=["USD"], seed=3)
+
+    def test_balances_match_history(self):
+        changes = collections.Counter()
+
+        for sender, recipient, amount in models.Transaction.objects.values_list('from_account', 'to_account',
+                                                                                'amount'):
+            changes[sender] -= cents.to_cents(amount)
+            changes[recipient] += cents.to_cents(amount)
+
+        self.assertEqual(self.created['transactions'], models.Transaction.objects.count())
+
+        for account in models.Account.objects.filter(is_reserve=False):
+            self.assertEqual(cents.to_cents(account.balance), changes[account.pk])
+            self.assertGreaterEqual(account.balance.amount, 0)
+
+    def test_permissions_and_holders(self):
+        employee = models.Employee.objects.select_related('person', 'corporation').first()
+        account = models.Account.objects.filter(corporate_holder=employee.corporation).get()
+
+        self.assertTrue(employee.person.has_perm('bank.view_account', account))
+        self.assertFalse(employee.person.has_perm('bank.change_account', account))
+        self.assertTrue(account.corporate_holder.owner.has_perm('bank.change_account', account))
+        self.assertEqual(account.pretty_holder, employee.corporation.name)
+
+        with self.assertRaises(ValueError):
+            economy.generate(1, 1)
+
+    def test_history_is_visible(self):
+        account = models.Account.objects.filter(is_reserve=False).annotate(
+            sent=Count('transactions_from')).order_by('-sent').first()
+        self.client.force_login(get_user_model().objects.create(username="admin", is_superuser=True))
+        response = self.client.get(reverse('bank:account-detail', kwargs={'pk': account.pk}))
+
+        self.assertEqual(response.context['table'].paginator.count,
+                         models.Transaction.objects.filter(from_account=account).count() +
+                         models.Transaction.objects.filter(to_account=account).count())
+        self.assertGreater(response.context['table'].paginator.count, 1)
@@ -0,0 +1,65 @@
+import gc
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from . import metrics
+
+
+class MetricsTestCase(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_threads_add_up(self):
+        def work():
+            for _ in range(100):
+                metrics.observe_request("bank:index", 0.02, 3, 0.001, False)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        metrics.observe_task("bank.tasks.send", 2.0, True)
+        text = metrics.render()
+
+        self.assertIn('bank_http_requests_total{view="bank:index"} 400', text)
+        self.assertIn('bank_http_db_queries_total{view="bank:index"} 1200', text)
+        self.assertIn('bank_http_request_duration_seconds_bucket{view="bank:index",le="0.01"} 0', text)
+        self.assertIn('bank_http_request_duration_seconds_bucket{view="bank:index",le="0.025"} 400', text)
+        self.assertIn('bank_task_failures_total{task="bank.tasks.send"} 1', text)
+        self.assertIn('bank_task_duration_seconds_bucket{task="bank.tasks.send",le="2.5"} 1', text)
+
+    def test_ended_threads_are_retired(self):
+        metrics.shard()
+        shards = len(metrics._shards)
+
+        for _ in range(10):
+            thread = threading.Thread(target=metrics.observe_request, args=("bank:index", 0.02, 3, 0.001, False))
+            thread.start()
+            thread.join()
+
+        gc.collect()
+        self.assertEqual(len(metrics._shards), shards)
+        self.assertIn('bank_http_requests_total{view="bank:index"} 10', metrics.render())
+
+
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.admin = get_user_model().objects.create_superuser(username="admin", password="admin")
+
+    def test_admins_only(self):
+        self.client.get('/')
+        self.assertIn(self.client.get('/api/v1/metrics/').status_code, (401, 403))
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/v1/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'bank_http_requests_total{view="bank:index"} 1')
+        self.assertContains(response, 'bank_task_queue_depth{lane="high"} 0')
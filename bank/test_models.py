@@ -1,9 +1,15 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
 from djmoney.money import Money
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
 from . import models
+from .api.v1.views import calculate_velocity_of_money
 
 
 class AccountTestCase(TestCase):
@@ -102,6 +108,33 @@ class AccountTestCase(TestCase):
             'bank.delete_account', corp_account))
 
 
+    def test_holder_name(self):
+        pers_account = models.Account.objects.create(individual_holder=self.user)
+        corp_account = models.Account.objects.create(corporate_holder=self.corporation)
+
+        self.user.username = "renamed"
+        self.user.save()
+        self.corporation.name = "B"
+        self.corporation.save()
+
+        pers_account = models.Account.objects.get(pk=pers_account.pk)
+        corp_account = models.Account.objects.get(pk=corp_account.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(pers_account.pretty_holder, "renamed")
+            self.assertEqual(corp_account.pretty_holder, "B")
+
+        self.assertEqual(pers_account.holder_type, models.Account.HolderTypes.INDIVIDUAL)
+        self.assertEqual(corp_account.holder_type, models.Account.HolderTypes.CORPORATE)
+
+        pers_account.individual_holder = None
+        pers_account.corporate_holder = self.corporation
+        pers_account.save()
+        pers_account.refresh_from_db()
+        self.assertEqual(pers_account.holder_name, "B")
+        self.assertEqual(pers_account.holder_type, models.Account.HolderTypes.CORPORATE)
+
+
 class CorporationTestCase(TestCase):
     def setUp(self):
         self.user = get_user_model().objects.create(username="test", password="test")
@@ -295,3 +328,42 @@ class TransactionTestCase(TestCase):
                                              to_account=self.account_1,
                                              amount=Money(2, 'XYZ'))
             transaction.clean()
+
+
+class QueryPlanTestCase(TestCase):
+    def assertUsesIndex(self, queryset, index):
+        if connection.vendor == 'postgresql':
+            # the tables are tiny in tests, don't let the planner settle for a sequential scan
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        self.assertIn(index, queryset.explain())
+
+    def test_currency_statistics_use_index(self):
+        since = timezone.now() - timedelta(days=7)
+        self.assertUsesIndex(models.Transaction.objects.filter(amount_currency="USD"),
+                             'bank_transaction_currency_idx')
+        self.assertUsesIndex(models.Transaction.objects.filter(amount_currency="USD", created_on__gte=since),
+                             'bank_transaction_currency_idx')
+        self.assertUsesIndex(models.Account.objects.filter(currency="USD", is_reserve=False),
+                             'bank_account_currency_idx')
+
+    def test_velocity_of_money(self):
+        user = get_user_model().objects.create(username="test", password="test")
+        sender = models.Account.objects.create(individual_holder=user, currency='USD', balance=Money(100, 'USD'))
+        recipient = models.Account.objects.create(individual_holder=user, currency='USD')
+        models.Transaction.objects.create(from_account=sender, to_account=recipient, amount=Money(20, 'USD'))
+        models.Transaction.objects.create(from_account=sender, to_account=recipient, amount=Money(5, 'USD'),
+                                          created_on=timezone.now() - timedelta(days=30))
+
+        # the money supply, and the money sent in the last week of all currencies at once
+        with self.assertNumQueries(2):
+            velocity = calculate_velocity_of_money(["USD", "CIV"])
+
+        # 20 sent this week out of 100 in circulation
+        self.assertEqual(velocity, {"USD": Decimal("0.2"), "CIV": 0.0})
+
+    def test_default_account_lookup_uses_index(self):
+        user = get_user_model().objects.create(username="test", password="test")
+        self.assertUsesIndex(models.Account.objects.filter(individual_holder=user, currency="USD"),
+                             'bank_account_individual_idx')
@@ -0,0 +1,143 @@
+from unittest import mock
+
+import requests
+from django.db import transaction
+from django.test import TestCase
+from djmoney.money import Money
+from django.contrib.auth import get_user_model
+
+from . import models, notifications, util
+
+
+class NotificationOutboxTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test", password="test", discord_id=1)
+        self.second_user = get_user_model().objects.create(username="second", password="user", discord_id=2)
+        self.account_1 = models.Account.objects.create(individual_holder=self.user, balance=Money(100, 'USD'))
+        self.account_2 = models.Account.objects.create(individual_holder=self.second_user)
+
+    def make_payload(self, targets, title="Test"):
+        embed = util.make_embed(title=title, description="Something happened", url="https://democracivbank.com")
+        return {'targets': targets, 'message': '', 'embed': embed}
+
+    def test_transaction_schedules_delivery_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.Transaction.objects.create(from_account=self.account_1, to_account=self.account_2,
+                                              amount=Money(1, 'USD'))
+
+        # the outbox row is part of the transfer's transaction, only its delivery waits for the commit
+        self.assertQuerysetEqual(models.Notification.objects.values_list('target', flat=True), [2],
+                                 transform=int)
+        self.assertFalse(models.QueuedTask.objects.filter(name='bank.tasks.deliver_notifications').exists())
+
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(models.QueuedTask.objects.filter(name='bank.tasks.deliver_notifications').exists())
+
+    def test_rollback_discards_notification(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                models.Transaction.objects.create(from_account=self.account_1, to_account=self.account_2,
+                                                  amount=Money(1, 'USD'))
+                raise RuntimeError
+
+        self.assertFalse(models.Notification.objects.exists())
+
+    def test_coalesce_per_target(self):
+        notifications.queue_dm(self.make_payload([1, 2], title="First"))
+        notifications.queue_dm(self.make_payload([1], title="Second"))
+
+        payloads = notifications.build_payloads(list(models.Notification.objects.order_by('created_on')))
+
+        self.assertEqual(len(payloads), 2)
+        coalesced = next(payload for payload in payloads if payload['targets'] == [1])
+        self.assertEqual(coalesced['embed']['title'], "2 New Notifications")
+        self.assertListEqual([field['name'] for field in coalesced['embed']['fields']], ["First", "Second"])
+
+    def test_coalesce_splits_into_several_embeds(self):
+        for i in range(notifications.MAX_COALESCED_FIELDS + 2):
+            notifications.queue_dm(self.make_payload([1], title=f"Event {i}"))
+
+        payloads = notifications.build_payloads(list(models.Notification.objects.order_by('created_on', 'id')))
+
+        self.assertListEqual([payload['embed']['title'] for payload in payloads],
+                             [f"{notifications.MAX_COALESCED_FIELDS} New Notifications", "2 New Notifications"])
+        self.assertEqual(sum(len(payload['embed']['fields']) for payload in payloads),
+                         notifications.MAX_COALESCED_FIELDS + 2)
+
+    def test_identical_payloads_are_shared(self):
+        notifications.queue_dm(self.make_payload([1, 2, 3]))
+        payloads = notifications.build_payloads(list(models.Notification.objects.all()))
+
+        self.assertEqual(len(payloads), 1)
+        self.assertListEqual(sorted(payloads[0]['targets']), [1, 2, 3])
+
+    @mock.patch('bank.notifications.post_payloads')
+    def test_deliver_pending(self, post_payloads):
+        notifications.queue_dm(self.make_payload([1, 2]))
+        notifications.queue_dm(self.make_payload([1]))
+
+        totals = notifications.deliver_pending(batch_size=2)
+
+        self.assertEqual(totals['notifications'], 3)
+        self.assertEqual(totals['batches'], 2)
+        self.assertEqual(post_payloads.call_count, 2)
+        self.assertEqual(notifications.outbox_statistics()['pending'], 0)
+        self.assertEqual(notifications.outbox_statistics()['delivered_last_hour'], 3)
+
+    @mock.patch('bank.notifications.post_payloads', side_effect=requests.ConnectionError)
+    def test_failed_delivery_is_retried(self, post_payloads):
+        notifications.queue_dm(self.make_payload([1]))
+
+        totals = notifications.deliver_pending()
+
+        self.assertEqual(totals['failed'], 1)
+        notification = models.Notification.objects.get()
+        self.assertIsNone(notification.claimed_on)
+        self.assertIsNone(notification.delivered_on)
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notifications.outbox_statistics()['pending'], 1)
+
+
+class NotificationDigestTestCase(TestCase):
+    def setUp(self):
+        self.sender = get_user_model().objects.create(username="sender", password="test")
+        self.owner = get_user_model().objects.create(username="owner", password="test", discord_id=1,
+                                                     notification_mode=models.User.NotificationModes.HOURLY)
+        self.employee = get_user_model().objects.create(username="employee", password="test", discord_id=2)
+        self.corporation = models.Corporation.objects.create(owner=self.owner, name="A", abbreviation="ABC")
+        models.Employee.objects.create(corporation=self.corporation, person=self.employee)
+
+        self.from_account = models.Account.objects.create(individual_holder=self.sender,
+                                                          balance=Money(100, 'USD'))
+        self.to_account = models.Account.objects.create(corporate_holder=self.corporation)
+
+    def send(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Transaction.objects.create(from_account=self.from_account, to_account=self.to_account,
+                                              amount=Money(amount, 'USD'))
+
+    def test_digest_recipients_are_held_back(self):
+        self.send(1)
+        self.send(2)
+
+        self.assertEqual(notifications.pending_notifications().filter(target=2).count(), 2)
+        self.assertFalse(notifications.pending_notifications().filter(target=1).exists())
+        self.assertEqual(notifications.outbox_statistics()['held_for_digest'], 2)
+
+    def test_send_digests(self):
+        self.send(1)
+        self.send(2.5)
+
+        self.assertEqual(notifications.send_digests(models.User.NotificationModes.DAILY), 0)
+        self.assertEqual(notifications.send_digests(models.User.NotificationModes.HOURLY), 1)
+
+        digest = notifications.pending_notifications().get(target=1)
+        self.assertEqual(digest.embed['title'], "Your Hourly Digest")
+        self.assertEqual(len(digest.embed['fields']), 1)
+        self.assertEqual(digest.embed['fields'][0]['name'], "USD")
+        self.assertIn("2 transactions", digest.embed['fields'][0]['value'])
+        self.assertIn("3.50", digest.embed['fields'][0]['value'])
+        self.assertEqual(notifications.outbox_statistics()['held_for_digest'], 0)
+        self.assertEqual(notifications.send_digests(models.User.NotificationModes.HOURLY), 0)
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from .pagination import EstimatedCountPaginator, count_rows
+
+
+class EstimatedCountPaginatorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        for i in range(5):
+            get_user_model().objects.create(username=f"user{i}")
+
+    def test_exact_counts_are_cached(self):
+        users = get_user_model().objects.order_by('id')
+        self.assertEqual(count_rows(users), (5, False))
+
+        get_user_model().objects.create(username="user5")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(count_rows(users), (5, False))
+
+        self.assertEqual(count_rows(users.filter(username__startswith="user")), (6, False))
+        self.assertEqual(count_rows(list(users)), (6, False))
+
+    def test_pages_past_the_count_are_empty(self):
+        paginator = EstimatedCountPaginator(get_user_model().objects.order_by('id'), 2)
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertFalse(paginator.page(3).has_next())
+        self.assertEqual(len(paginator.page(4)), 0)
+
+    def test_api_labels_count(self):
+        self.client.force_login(get_user_model().objects.create_superuser(username="admin", password="admin"))
+        response = self.client.get('/api/v1/user/').json()
+
+        self.assertEqual(response['count'], 6)
+        self.assertFalse(response['count_is_approximate'])
+        self.assertIsNone(response['next'])
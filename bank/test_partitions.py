@@ -0,0 +1,65 @@
+import datetime
+import tempfile
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from djmoney.money import Money
+
+from . import archive, models, partitions
+
+
+class PartitionNamingTestCase(SimpleTestCase):
+    def test_add_months(self):
+        self.assertEqual(partitions.add_months(datetime.date(2020, 11, 1), 3), datetime.date(2021, 2, 1))
+        self.assertEqual(partitions.add_months(datetime.date(2021, 1, 1), -1), datetime.date(2020, 12, 1))
+
+    def test_partition_names_sort_by_month(self):
+        names = [partitions.partition_name(datetime.date(2020, month, 1)) for month in (12, 2, 10)]
+        self.assertListEqual(sorted(names), ["bank_transaction_2020_02", "bank_transaction_2020_10",
+                                             "bank_transaction_2020_12"])
+
+
+class PartitionFallbackTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test", password="test")
+        self.account_1 = models.Account.objects.create(individual_holder=self.user, balance=Money(10, 'USD'))
+        self.account_2 = models.Account.objects.create(individual_holder=self.user)
+
+    def test_sqlite_is_not_partitioned(self):
+        self.assertFalse(partitions.is_partitioned())
+        self.assertListEqual(partitions.ensure_partitions(), [])
+        self.assertListEqual(partitions.detach_partitions(datetime.date.today()), [])
+
+    def test_account_history(self):
+        transaction = models.Transaction.objects.create(from_account=self.account_1, to_account=self.account_2,
+                                                        amount=Money(1, 'USD'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('bank:account-detail', kwargs={'pk': self.account_2.pk}))
+        self.assertQuerysetEqual(response.context['transactions'], [transaction])
+
+    def test_deleted_account_history(self):
+        long_ago = datetime.datetime(2020, 1, 15, tzinfo=datetime.timezone.utc)
+        transaction = models.Transaction.objects.create(from_account=self.account_1, to_account=self.account_2,
+                                                        amount=Money(1, 'USD'), created_on=long_ago)
+        self.account_1.delete()
+
+        self.client.force_login(get_user_model().objects.create(username="admin", is_superuser=True))
+        response = self.client.get(reverse('bank:account-detail', kwargs={'pk': models.DELETED_ACCOUNT_IBAN}))
+        self.assertQuerysetEqual(response.context['transactions'], [transaction])
+
+
+class DetachPartitionsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        archive.save_manifest({'cutoff': "2020-02-01", 'files': {}}, self.root.name)
+
+    @mock.patch.object(partitions, 'is_partitioned', return_value=True)
+    @mock.patch.object(partitions, 'list_partitions',
+                       return_value=["bank_transaction_2020_01", "bank_transaction_2020_02"])
+    def test_unarchived_months_are_not_detached(self, list_partitions, is_partitioned):
+        with self.assertRaisesMessage(ValueError, "bank_transaction_2020_02 can't be detached"):
+            partitions.detach_partitions(datetime.date(2020, 3, 1), archive_root=self.root.name)
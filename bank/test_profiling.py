@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from . import profiling
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        settings = override_settings(PROFILE_ROOT=self.root, PROFILE_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user_model = get_user_model()
+        self.admin = user_model.objects.create_user(username="admin", password="admin", is_staff=True)
+        self.user = user_model.objects.create_user(username="user", password="user")
+
+    def test_staff_profile_requests(self):
+        self.client.force_login(self.admin)
+        self.assertNotIn(profiling.RESPONSE_HEADER, self.client.get('/api/v1/currencies/'))
+
+        response = self.client.get('/api/v1/currencies/', {'profile': ''})
+        summary = self.client.get(response[profiling.RESPONSE_HEADER]).json()
+
+        self.assertEqual(summary['view'], 'bank.api.v1.views.CurrenciesView')
+        self.assertEqual(summary['user'], "admin")
+        self.assertTrue(any('bank_account' in query['sql'] for query in summary['queries']))
+        self.assertIn('cumulative', summary['functions'])
+
+        download = self.client.get(response[profiling.RESPONSE_HEADER], {'download': ''})
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(os.path.exists(profiling.stats_path(summary['id'])))
+
+    def test_api_tokens(self):
+        token = Token.objects.create(user=self.admin).key
+        response = self.client.get('/api/v1/currencies/', HTTP_AUTHORIZATION=f"Token {token}", HTTP_X_PROFILE="1")
+
+        self.assertIn(profiling.RESPONSE_HEADER, response)
+
+    def test_only_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/account/', HTTP_X_PROFILE="1")
+
+        self.assertNotIn(profiling.RESPONSE_HEADER, response)
+        self.assertFalse(os.listdir(self.root))
+
+    def test_newest_are_kept(self):
+        self.client.force_login(self.admin)
+
+        for _ in range(3):
+            self.client.get('/', {'profile': ''})
+
+        self.assertEqual(len([name for name in os.listdir(self.root) if name.endswith('.json')]), 2)
@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import URLResolver, resolve
+from djmoney.money import Money
+from rest_framework.authtoken.models import Token
+
+from . import budgets, models
+from . import urls as bank_urls
+from .api.v1 import urls as api_urls
+
+
+def view_names(patterns, namespace=None):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from view_names(pattern.url_patterns, pattern.namespace or namespace)
+        else:
+            name = pattern.name or pattern.lookup_str
+            yield f"{namespace}:{name}" if namespace and pattern.name else name
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class QueryBudgetTestCase(TestCase):
+    """Requests every page and API endpoint with a few rows of everything it lists, so that a query per row
+    shows up as a repeated query."""
+
+    def setUp(self):
+        caches[settings.SHARED_CACHE_ALIAS].clear()
+        user_model = get_user_model()
+        self.admin = user_model.objects.create_superuser(username="admin", password="admin")
+        self.token = Token.objects.create(user=self.admin).key
+        self.owner = user_model.objects.create_user(username="owner", password="owner", discord_id=1)
+        self.people = [user_model.objects.create_user(username=f"person-{i}", discord_id=10 + i) for i in range(4)]
+
+        self.corporation = models.Corporation.objects.create(name="Owned", abbreviation="OWN", owner=self.owner)
+        self.employees = [models.Employee.objects.create(person=person, corporation=self.corporation)
+                          for person in self.people[:3]]
+        models.EmployeeInvitation.objects.create(potential_employee=self.people[3], corporation=self.corporation)
+        self.accounts = [models.Account.objects.create(individual_holder=self.owner, name=f"Personal {i}",
+                                                       balance=Money(100, 'USD'), is_default_for_currency=i == 0)
+                         for i in range(3)]
+        self.accounts += [models.Account.objects.create(corporate_holder=self.corporation, name=f"Shared {i}",
+                                                        balance=Money(100, 'USD')) for i in range(3)]
+
+        for i in range(3):
+            other = models.Corporation.objects.create(name=f"Other {i}", abbreviation=f"OT{i}",
+                                                      owner=self.people[i])
+            models.Employee.objects.create(person=self.owner, corporation=other)
+            models.EmployeeInvitation.objects.create(potential_employee=self.owner,
+                                                     corporation=models.Corporation.objects.create(
+                                                         name=f"Inviting {i}", abbreviation=f"IN{i}",
+                                                         owner=self.people[i]))
+            models.FeaturedCorporation.objects.create(corporation=other, ad_message="Buy")
+
+        for i in range(4):
+            self.transaction = models.Transaction.objects.create(
+                from_account=self.accounts[i % 2], to_account=self.accounts[3 + i % 3], amount=Money(1, 'USD'),
+                authorized_by=self.owner)
+
+        caches[settings.SHARED_CACHE_ALIAS].clear()
+
+    def requests(self):
+        """The method, path, user and data of a request for every view."""
+
+        account, corporation = self.accounts[0].pk, self.corporation.pk
+        owner, admin = self.owner, self.admin
+        invite = models.EmployeeInvitation.objects.get(potential_employee=self.people[3])
+        own_employment = self.owner.employed_at.first()
+        send = {'discord_id': 1, 'from_account': str(account), 'to_account': str(self.accounts[3].pk),
+                'amount': '1.00'}
+
+        return {
+            'bank:index': ('get', '/', None, None),
+            'bank:user': ('get', '/me/', owner, None),
+            'bank:user-employment': ('get', '/me/employment/', owner, None),
+            'bank:user-employee-leave': ('get', f'/me/leave_organization/{own_employment.pk}/', owner, None),
+            'bank:user-discord-connect': ('get', '/me/discord/', owner, None),
+            'bank:user-employee-invite': ('get', f'/me/invite/{invite.pk}/reject/', self.people[3], None),
+            'bank:account': ('get', '/account/', owner, None),
+            'bank:account-create': ('get', '/account/new/', owner, None),
+            'bank:account-create-personal': ('get', '/account/new/personal/', owner, None),
+            'bank:account-create-corporate': ('get', '/account/new/corporate/', owner, None),
+            'bank:account-detail': ('get', f'/account/{account}/', owner, None),
+            'bank:account-update': ('get', f'/account/{account}/edit/', owner, None),
+            'bank:account-delete': ('get', f'/account/{account}/delete/', owner, None),
+            'bank:account-transaction-create': ('get', '/transaction/new/', owner, None),
+            'bank:account-transaction-confirm': ('get', '/transaction/confirm/', owner, None),
+            'bank:account-transaction-detail': ('get', f'/transaction/{self.transaction.pk}/', owner, None),
+            'bank:corporation-list': ('get', '/organization/', owner, None),
+            'bank:corporation-create': ('get', '/organization/new/', owner, None),
+            'bank:corporation-detail': ('get', f'/organization/{corporation}/', owner, None),
+            'bank:corporation-delete': ('get', f'/organization/{corporation}/delete/', owner, None),
+            'bank:corporation-update': ('get', f'/organization/{corporation}/edit/', owner, None),
+            'bank:corporation-employees': ('get', f'/organization/{corporation}/employees/', owner, None),
+            'bank:corporation-employees-fire': (
+                'get', f'/organization/{corporation}/employees/fire/{self.employees[2].pk}/', owner, None),
+            'bank:corporation-employees-transfer-ownership': (
+                'get', f'/organization/{corporation}/employees/transfer/{self.employees[0].pk}/', owner, None),
+            'bank:marketplace': ('get', '/marketplace/', None, None),
+            # the callback calls Discord, without a login it stops at the redirect to the login page
+            'bank:user-discord-callback': ('get', '/discord/', None, None),
+            'bank:bot-resubmit': ('get', '/u/1', None, None),
+
+            'api-root': ('get', '/api/v1/', admin, None),
+            'Account-list': ('get', '/api/v1/account/', owner, None),
+            'Account-detail': ('get', f'/api/v1/account/{account}/', owner, None),
+            'Corporation-list': ('get', '/api/v1/corporation/', owner, None),
+            'Corporation-detail': ('get', f'/api/v1/corporation/{corporation}/', owner, None),
+            'FeaturedCorporation-list': ('get', '/api/v1/featured_corporation/', admin, None),
+            'FeaturedCorporation-detail': (
+                'get', f'/api/v1/featured_corporation/{models.FeaturedCorporation.objects.first().pk}/', admin,
+                None),
+            'Transaction-list': ('get', '/api/v1/transaction/', admin, None),
+            'Transaction-detail': ('get', f'/api/v1/transaction/{self.transaction.pk}/', admin, None),
+            'user-list': ('get', '/api/v1/user/', admin, None),
+            'user-detail': ('get', f'/api/v1/user/{owner.pk}/', admin, None),
+            'bank.api.v1.views.AccountsPerDiscordUser': ('get', '/api/v1/accounts/1/', admin, None),
+            'bank.api.v1.views.UserAccountFromDiscordUser': ('get', '/api/v1/discord_user/1/', admin, None),
+            'bank.api.v1.views.TransactionCreate': ('post', '/api/v1/send/', admin, send),
+            'bank.api.v1.views.BankStatistics': ('get', '/api/v1/statistics/', admin, None),
+            'bank.api.v1.views.MetricsView': ('get', '/api/v1/metrics/', admin, None),
+            'profile': ('get', '/api/v1/profiles/00000000-0000-0000-0000-000000000000/', admin, None),
+            'bank.api.v1.views.DefaultBankAccount': (
+                'get', '/api/v1/default_account/?discord_id=1&currency=USD', admin, None),
+            'bank.api.v1.views.ApplyOttomanFormula': ('get', '/api/v1/ottoman/apply/', admin, None),
+            'bank.api.v1.views.OttomanThresholds': ('get', '/api/v1/ottoman/threshold/', admin, None),
+            'bank.api.v1.views.CurrenciesView': ('get', '/api/v1/currencies/', admin, None),
+            'bank.api.v1.views.SearchView': ('get', '/api/v1/search/?q=person', admin, None),
+            'rest_framework.authtoken.views.ObtainAuthToken': (
+                'post', '/api/v1/token/', None, {'username': 'owner', 'password': 'owner'}),
+            'rest_framework:login': ('get', '/api/v1/auth/login/', None, None),
+            'rest_framework:logout': ('get', '/api/v1/auth/logout/', owner, None),
+        }
+
+    def test_every_view_stays_within_its_budget(self):
+        requests = self.requests()
+        names = set(view_names(bank_urls.urlpatterns, 'bank')) | set(view_names(api_urls.urlpatterns))
+
+        self.assertSetEqual(names - set(requests), set(), "Add a request for these views to requests()")
+
+        # only the budgets matter here, not whatever else a view might fail on
+        self.client.raise_request_exception = False
+
+        for name, (method, path, user, data) in requests.items():
+            with self.subTest(name):
+                self.assertIsNotNone(budgets.get_budget(resolve(path.split('?')[0])), f"{name} has no budget")
+                self.client.logout()
+
+                if user is not None:
+                    self.client.force_login(user)
+
+                if method == 'post':
+                    response = self.client.post(path, data, content_type="application/json")
+                else:
+                    response = self.client.get(path)
+
+                if response.exc_info and issubclass(response.exc_info[0], budgets.QueryBudgetExceeded):
+                    self.fail(response.exc_info[1])
+
+    def test_repeated_queries(self):
+        queries = [f'SELECT * FROM "bank_user" WHERE "id" = {i}' for i in range(3)]
+        queries += ['SELECT * FROM "bank_account" WHERE "iban" IN (%s, %s)', 'SELECT * FROM "bank_account"']
+
+        self.assertListEqual(budgets.repeated_queries(queries, 3),
+                             [('SELECT * FROM "bank_user" WHERE "id" = %s', 3)])
+        self.assertEqual(len(budgets.problems("view", 4, queries, 3)), 2)
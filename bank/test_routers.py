@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from . import models, routers
+from .caching import shared_cache
+from .middleware import ReplicaMiddleware
+
+
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def route(self, use_replica, model=models.Account):
+        token = routers.start_request(use_replica)
+
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routers.finish_request(token)
+
+    def test_reads_outside_of_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(models.Account), 'default')
+
+    def test_read_only_requests_use_replica(self):
+        self.assertEqual(self.route(True), 'replica')
+        self.assertEqual(self.route(False), 'default')
+        self.assertEqual(self.route(True, model=Session), 'default')
+
+    def test_read_your_writes(self):
+        token = routers.start_request(True)
+        self.assertEqual(self.router.db_for_read(models.Account), 'replica')
+        self.assertEqual(self.router.db_for_write(models.Account), 'default')
+        self.assertEqual(self.router.db_for_read(models.Account), 'default')
+        self.assertTrue(routers.finish_request(token))
+
+
+class ReplicaMiddlewareTestCase(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.routes = []
+
+    def make_request(self, method="get", session="session", write=False):
+        def view(request):
+            if write:
+                routers.ReplicaRouter().db_for_write(models.Account)
+
+            self.routes.append(routers.ReplicaRouter().db_for_read(models.Account))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)("/")
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session
+        return ReplicaMiddleware(view)(request)
+
+    def test_pinned_to_primary_after_write(self):
+        shared_cache().clear()
+
+        self.make_request()
+        self.make_request(method="post", write=True)
+        self.make_request()
+        self.make_request(session="someone else")
+
+        self.assertListEqual(self.routes, ['replica', 'default', 'default', 'replica'])
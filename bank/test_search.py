@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from . import forms, models, search
+from .caching import shared_cache
+
+
+class TrigramIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.index = search.TrigramIndex([(1, ["johnny", "John#1234"]), (2, ["jane", None]), (3, ["Bank of Arabia"])])
+
+    def test_trigrams_match_pg_trgm(self):
+        self.assertEqual(search.trigrams("Cat"), {"  c", " ca", "cat", "at "})
+        self.assertEqual(search.trigrams("a-b"), {"  a", " a ", "  b", " b "})
+
+    def test_substrings(self):
+        self.assertEqual(self.index.search("jo"), [1])
+        self.assertEqual(self.index.search("ARAB"), [3])
+        self.assertEqual(self.index.search("hnn"), [1])
+
+    def test_typos(self):
+        self.assertEqual(self.index.search("jonny"), [1])
+        self.assertEqual(self.index.search("xyz"), [])
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        shared_cache().clear()
+        self.user = get_user_model().objects.create(username="johnny", discord_username="Johnny#1234")
+        self.other = get_user_model().objects.create(username="jane")
+        models.Corporation.objects.create(owner=self.user, name="Johnny's Bakery", abbreviation="JB")
+        models.Corporation.objects.create(owner=self.user, name="Secret Society", abbreviation="SS",
+                                          is_public_viewable=False)
+
+    def test_search_users(self):
+        self.assertEqual(search.search_users("JOH"), [self.user])
+        self.assertEqual(search.search_users("jonny"), [self.user])
+        self.assertEqual(search.search_users("j"), [self.other, self.user])
+        self.assertEqual(search.search_users("j", limit=1), [self.other])
+
+    def test_index_follows_renames(self):
+        self.assertEqual(search.search_users("johnny"), [self.user])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = "walter"
+            self.user.discord_username = None
+            self.user.save()
+
+        self.assertEqual(search.search_users("johnny"), [])
+        self.assertEqual(search.search_users("walt"), [self.user])
+
+    def test_api(self):
+        self.client.force_login(self.other)
+        response = self.client.get('/api/v1/search/', {'q': 'so'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['corporations'], [])
+
+        response = self.client.get('/api/v1/search/', {'q': 'bakery'}).json()
+        self.assertEqual([corporation['abbreviation'] for corporation in response['corporations']], ['JB'])
+        self.assertEqual(response['users'], [])
+
+    def test_api_hides_discord_accounts_from_non_staff(self):
+        self.client.force_login(self.other)
+        response = self.client.get('/api/v1/search/', {'q': 'johnny'}).json()
+        self.assertEqual(response['users'], [{'id': self.user.id, 'username': "johnny"}])
+
+        self.client.force_login(get_user_model().objects.create(username="admin", is_staff=True))
+        response = self.client.get('/api/v1/search/', {'q': 'johnny'}).json()
+        self.assertEqual(response['users'][0]['discord_username'], "Johnny#1234")
+
+    def test_invitation_suggests_usernames(self):
+        with self.assertRaisesMessage(forms.forms.ValidationError, "Did you mean johnny?"):
+            forms.user_exists("jonny")
@@ -0,0 +1,193 @@
+import json
+import threading
+import requests
+
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import models, notifications, taskrunner, tasks, util
+from .taskrunner import task, Priorities
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task(max_attempts=2)
+def explode():
+    raise RuntimeError("boom")
+
+
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_by_priority(self):
+        record.schedule(args=("bulk",), priority=Priorities.BULK)
+        record.schedule(args=("normal",))
+        record.schedule(args=("high",), priority=Priorities.HIGH)
+        record.schedule(args=("later",), priority=Priorities.HIGH, run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = taskrunner.claim("worker", 2)
+        self.assertListEqual([queued.arguments['args'] for queued in claimed], [["high"], ["normal"]])
+        self.assertListEqual([queued.arguments['args'] for queued in taskrunner.claim("other", 5)], [["bulk"]])
+        self.assertListEqual(taskrunner.claim("other", 5), [])
+
+    def test_stale_claims_are_reclaimed(self):
+        queued = record.delay("value")
+        taskrunner.claim("crashed", 1)
+        models.QueuedTask.objects.filter(pk=queued.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertListEqual([claimed.locked_by for claimed in taskrunner.claim("worker", 1)], ["worker"])
+
+    def test_execute(self):
+        queued = record.schedule(args=("value",), repeat=timedelta(minutes=5))
+        self.assertTrue(taskrunner.execute_task(queued.pk))
+
+        queued.refresh_from_db()
+        self.assertIsNotNone(queued.finished_on)
+        self.assertListEqual(calls, ["value"])
+        self.assertEqual(models.QueuedTask.objects.filter(finished_on__isnull=True, name=record.name).count(), 1)
+
+    def test_retry_then_fail(self):
+        queued = explode.delay()
+
+        with self.assertLogs('bank.taskrunner', 'ERROR'):
+            self.assertFalse(taskrunner.execute_task(queued.pk))
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIsNone(queued.finished_on)
+        self.assertGreater(queued.run_at, timezone.now())
+
+        with self.assertLogs('bank.taskrunner', 'ERROR'):
+            taskrunner.execute_task(queued.pk)
+
+        queued.refresh_from_db()
+        self.assertIsNotNone(queued.finished_on)
+        self.assertIn("boom", queued.last_error)
+        self.assertEqual(taskrunner.queue_statistics()['failed'], 1)
+
+    def test_repeating_task_survives_failure(self):
+        queued = explode.schedule(repeat=timedelta(hours=1))
+
+        for _ in range(2):
+            with self.assertLogs('bank.taskrunner', 'ERROR'):
+                taskrunner.execute_task(queued.pk)
+
+        self.assertEqual(models.QueuedTask.objects.filter(finished_on__isnull=True, name=explode.name).count(), 1)
+
+    def test_heartbeat_renews_running_claims(self):
+        queued = record.delay("value")
+        runner = taskrunner.TaskRunner(threads=1, processes=0)
+        claimed_at = timezone.now() - timedelta(hours=1)
+        runner.running[taskrunner.THREAD][mock.Mock()] = queued.pk
+        models.QueuedTask.objects.filter(pk=queued.pk).update(locked_by=runner.worker_id, locked_at=claimed_at)
+
+        runner.heartbeat()
+        runner.shutdown()
+
+        self.assertListEqual(taskrunner.claim("other", 1), [])
+        queued.refresh_from_db()
+        self.assertGreater(queued.locked_at, claimed_at)
+
+    @mock.patch('bank.notifications.post_payloads', side_effect=requests.ConnectionError)
+    def test_failed_delivery_is_retried(self, post_payloads):
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.queue_dm({'targets': [1], 'message': 'Test'})
+
+        queued = models.QueuedTask.objects.get()
+
+        with self.assertLogs('bank.taskrunner', 'ERROR'):
+            self.assertFalse(taskrunner.execute_task(queued.pk))
+
+        queued.refresh_from_db()
+        self.assertIsNone(queued.finished_on)
+        self.assertIn("DeliveryError", queued.last_error)
+        self.assertEqual(post_payloads.call_count, 1)
+
+    def test_unique(self):
+        record.schedule(args=("value",), priority=Priorities.BULK, unique=True)
+        record.schedule(args=("value",), priority=Priorities.HIGH, unique=True)
+
+        self.assertQuerysetEqual(models.QueuedTask.objects.values_list('priority', flat=True), [Priorities.HIGH])
+
+    def test_queue_dm_schedules_delivery(self):
+        embed = util.make_embed(title="Test", description="Test", url="https://democracivbank.com")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.queue_dm({'targets': [1], 'message': '', 'embed': embed}, priority=Priorities.HIGH)
+            notifications.queue_dm({'targets': [2], 'message': '', 'embed': embed}, priority=Priorities.BULK)
+
+        queued = models.QueuedTask.objects.get()
+        self.assertEqual(queued.name, "bank.tasks.deliver_notifications")
+        self.assertEqual(queued.priority, Priorities.HIGH)
+        self.assertListEqual([notification.target for notification in notifications.claim_batch(1)], [1])
+
+    def test_migrate_background_tasks(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE background_task (id integer PRIMARY KEY, task_name varchar(190), "
+                           "task_params text, failed_at datetime NULL)")
+            cursor.execute("INSERT INTO background_task VALUES (%s, %s, %s, NULL)",
+                           [1, "bank.tasks.discord_dm_notification",
+                            json.dumps([[{'targets': [1, 2], 'message': "Hi"}], {}])])
+            cursor.execute("INSERT INTO background_task VALUES (2, 'bank.tasks.other', '[[], {}]', NULL)")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('migrate_background_tasks', stdout=mock.Mock())
+
+        self.assertQuerysetEqual(models.Notification.objects.order_by('target').values_list('target', flat=True),
+                                 [1, 2])
+        self.assertTrue(models.QueuedTask.objects.filter(name=tasks.deliver_notifications.name).exists())
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT task_name FROM background_task")
+            self.assertListEqual(cursor.fetchall(), [('bank.tasks.other',)])
+
+    def test_statistics(self):
+        record.schedule(args=("value",), priority=Priorities.HIGH, run_at=timezone.now() - timedelta(seconds=30))
+        stats = taskrunner.queue_statistics()
+
+        self.assertEqual(stats['lanes']['high']['depth'], 1)
+        self.assertGreaterEqual(stats['lanes']['high']['oldest_seconds'], 30)
+        self.assertEqual(stats['lanes']['bulk']['depth'], 0)
+
+
+class TaskRunnerTestCase(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+        if connection.vendor == 'sqlite':
+            # the in-memory test database locks whole tables until the end of a transaction and fails instead of
+            # waiting for another connection's lock, so the runner and its workers take turns with the database
+            lock = threading.Lock()
+
+            for name in ('claim', 'execute_task'):
+                patcher = mock.patch.object(taskrunner, name, new=self.holding(lock, getattr(taskrunner, name)))
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def holding(lock, func):
+        def locked(*args, **kwargs):
+            with lock:
+                return func(*args, **kwargs)
+
+        return locked
+
+    def test_run_drains_queue(self):
+        for i in range(5):
+            record.delay(i)
+
+        taskrunner.TaskRunner(threads=2, processes=0, poll_interval=0.01).run(drain=True)
+
+        self.assertListEqual(sorted(calls), list(range(5)))
+        self.assertFalse(models.QueuedTask.objects.filter(finished_on__isnull=True).exists())
@@ -1,9 +1,18 @@
+import json
+import threading
+
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from djmoney.money import Money
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 from django.conf import settings
+from django.core.cache import caches
 
-from . import models
+from . import models, views
+from .forwarding import WebhookForwarder, twitch_forwarder
 
 
 class IndexTestCase(TestCase):
@@ -17,6 +26,7 @@ class IndexTestCase(TestCase):
 
 class MarketplaceTestCase(TestCase):
     def setUp(self):
+        caches[settings.SHARED_CACHE_ALIAS].clear()
         self.user = get_user_model().objects.create(username="Loredana", password="lorelorelore")
 
     def test_empty_marketplace(self):
@@ -62,3 +72,253 @@ class MarketplaceTestCase(TestCase):
         self.assertQuerysetEqual(response.context['corporations'],
                                  ['<Corporation: Keine Rosen>', '<Corporation: Du bist Mein>'],
                                  ordered=False)
+
+
+    def test_cached_for_anonymous_visitors(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Corporation.objects.create(name="Keine Rosen", abbreviation="LORE", owner=self.user)
+
+        self.assertContains(self.client.get(reverse('bank:marketplace')), "Keine Rosen")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('bank:marketplace'))
+            self.assertContains(response, "Keine Rosen")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Corporation.objects.create(name="Du bist Mein", abbreviation="DANA", owner=self.user)
+
+        self.assertContains(self.client.get(reverse('bank:marketplace')), "Du bist Mein")
+
+    def test_pagination(self):
+        for i in range(settings.MARKETPLACE_PAGE_SIZE + 1):
+            models.Corporation.objects.create(name=f"Corporation {i:02}", abbreviation=f"C{i}", owner=self.user)
+
+        response = self.client.get(reverse('bank:marketplace'))
+        self.assertEqual(len(response.context['corporations']), settings.MARKETPLACE_PAGE_SIZE)
+
+        response = self.client.get(reverse('bank:marketplace'), {'page': 2})
+        self.assertEqual(len(response.context['corporations']), 1)
+
+
+class TransactionDetailTestCase(TestCase):
+    def setUp(self):
+        self.sender = get_user_model().objects.create(username="sender", password="sender")
+        self.recipient = get_user_model().objects.create(username="recipient", password="recipient")
+        self.admin = get_user_model().objects.create(username="admin", password="admin", is_staff=True)
+        self.other = get_user_model().objects.create(username="other", password="other")
+        from_account = models.Account.objects.create(individual_holder=self.sender, balance=Money(10, 'USD'))
+        to_account = models.Account.objects.create(individual_holder=self.recipient)
+        self.transaction = models.Transaction.objects.create(from_account=from_account, to_account=to_account,
+                                                             amount=Money(5, 'USD'))
+        self.url = reverse('bank:account-transaction-detail', kwargs={'pk': self.transaction.pk})
+        self.api_url = f"/api/v1/transaction/{self.transaction.pk}/"
+
+    def test_conditional_get(self):
+        self.client.force_login(self.recipient)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "text-success")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.client.force_login(self.sender)
+        response = self.client.get(self.url)
+        self.assertContains(response, "text-danger")
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_revocation_invalidates(self):
+        self.client.force_login(self.recipient)
+        etag = self.client.get(self.url)['ETag']
+        models.Transaction.objects.filter(pk=self.transaction.pk).update(
+            state=models.Transaction.TransactionState.REVOKED)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_api_conditional_get(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(self.api_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], str(self.transaction.pk))
+
+        response = self.client.get(self.api_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_api_shows_current_balances(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(self.api_url)
+        self.assertEqual(response.json()['from_account']['balance'], "5.00")
+
+        models.Transaction.objects.create(from_account=self.transaction.from_account,
+                                          to_account=self.transaction.to_account, amount=Money(3, 'USD'))
+
+        stale = self.client.get(self.api_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.json()['from_account']['balance'], "2.00")
+
+    def test_renamed_account_invalidates(self):
+        self.client.force_login(self.recipient)
+        etag = self.client.get(self.url)['ETag']
+        models.Account.objects.filter(pk=self.transaction.to_account.pk).update(name="Savings")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Savings")
+
+
+class AccountListCacheTestCase(TestCase):
+    def setUp(self):
+        # user ids are reused between tests
+        caches[settings.SHARED_CACHE_ALIAS].clear()
+        self.owner = get_user_model().objects.create(username="owner", password="owner")
+        self.employee = get_user_model().objects.create(username="employee", password="employee")
+        self.corporation = models.Corporation.objects.create(name="Keine Rosen", abbreviation="LORE",
+                                                             owner=self.owner)
+        self.account = models.Account.objects.create(corporate_holder=self.corporation, name="Corporate")
+
+    def get_account_names(self, user=None):
+        if user is not None:
+            self.client.force_login(user)
+
+        response = self.client.get(reverse('bank:account'))
+        self.assertEqual(response.status_code, 200)
+        return [row.record.name for row in response.context['table'].rows]
+
+    def test_cached_until_account_changes(self):
+        self.assertListEqual(self.get_account_names(self.owner), ["Corporate"])
+
+        with self.assertNumQueries(2):
+            # session and user, the list comes from the cache
+            self.get_account_names()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Account.objects.create(individual_holder=self.owner, name="Personal")
+
+        self.assertListEqual(self.get_account_names(self.owner), ["Corporate", "Personal"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.name = "Renamed"
+            self.account.save()
+
+        self.assertListEqual(self.get_account_names(self.owner), ["Renamed", "Personal"])
+
+    def test_employment_changes(self):
+        self.assertListEqual(self.get_account_names(self.employee), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            employee = models.Employee.objects.create(corporation=self.corporation, person=self.employee)
+
+        self.assertListEqual(self.get_account_names(self.employee), ["Corporate"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.delete()
+
+        self.assertListEqual(self.get_account_names(self.employee), [])
+
+    def test_api_list(self):
+        self.client.force_login(self.owner)
+        response = self.client.get("/api/v1/account/")
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([account['name'] for account in response.json()['results']], ["Corporate"])
+
+
+class TwitchCallbackTestCase(SimpleTestCase):
+    async def test_challenge_is_answered_without_waiting_for_the_bot(self):
+        with mock.patch.object(twitch_forwarder, 'submit', return_value=True) as submit:
+            response = await self.async_client.post('/twitch/callback', data={'challenge': 'abc'},
+                                                    content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"abc")
+        submit.assert_called_once()
+
+    async def test_full_queue(self):
+        with mock.patch.object(twitch_forwarder, 'submit', return_value=False):
+            response = await self.async_client.post('/twitch/callback', data={'event': {}},
+                                                    content_type="application/json")
+
+        self.assertEqual(response.status_code, 503)
+
+    async def test_invalid_body(self):
+        response = await self.async_client.post('/twitch/callback', data="{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class StubTwitchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.server.received.append((dict(self.headers), self.rfile.read(int(self.headers['Content-Length']))))
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TwitchForwardingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubTwitchHandler)
+        self.server.daemon_threads = True
+        self.server.received = []
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.forwarder = WebhookForwarder(f"http://127.0.0.1:{self.server.server_address[1]}/twitch/callback",
+                                          queue_size=10, workers=1)
+        patcher = mock.patch.object(views, 'twitch_forwarder', self.forwarder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_wsgi_forwards_before_answering(self):
+        response = self.client.post('/twitch/callback', data={'event': {'id': 1}}, content_type="application/json",
+                                    HTTP_TWITCH_EVENTSUB_MESSAGE_TYPE="notification")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.received), 1)
+        headers, body = self.server.received[0]
+        self.assertDictEqual(json.loads(body), {'event': {'id': 1}})
+        self.assertEqual(headers['Twitch-Eventsub-Message-Type'], "notification")
+
+    def test_wsgi_failed_forward_is_redelivered(self):
+        self.server.status = 500
+
+        with self.assertLogs('bank.forwarding', 'WARNING'):
+            response = self.client.post('/twitch/callback', data={'event': {}}, content_type="application/json")
+
+        # a non-2xx answer makes Twitch deliver the event again
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.forwarder.failed, 1)
+
+    async def test_asgi_forwards_from_queue(self):
+        response = await self.async_client.post('/twitch/callback', data={'event': {'id': 1}},
+                                                content_type="application/json")
+        await self.forwarder.join()
+        await self.forwarder.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.forwarder.forwarded, 1)
+        self.assertDictEqual(json.loads(self.server.received[0][1]), {'event': {'id': 1}})
+
+
+class WebhookForwarderTestCase(SimpleTestCase):
+    async def test_bounded_queue(self):
+        forwarder = WebhookForwarder("http://127.0.0.1:1/", queue_size=1, workers=1)
+
+        with mock.patch.object(forwarder, 'worker', new=mock.AsyncMock()):
+            self.assertTrue(forwarder.submit({'Host': 'localhost', 'Twitch-Eventsub-Message-Type': 'x'}, b"{}"))
+
+            with self.assertLogs('bank.forwarding', 'WARNING'):
+                self.assertFalse(forwarder.submit({}, b"{}"))
+
+        self.assertEqual(forwarder.dropped, 1)
+        self.assertDictEqual(forwarder.queue.get_nowait()[0], {'Twitch-Eventsub-Message-Type': 'x'})
+        await forwarder.close()
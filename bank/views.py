@@ -1,6 +1,5 @@
 import json
 import time
-import requests
 import django_tables2 as tables
 
 from django import http
@@ -8,25 +7,33 @@ from django.urls import reverse
 from django.db import transaction
 from django.conf import settings
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
 from django.views import View, generic
-from django_tables2 import LazyPaginator
 from django_tables2.export import ExportMixin
 from django.contrib.auth.views import PasswordResetView
-from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
 from djmoney.money import Money
+from asgiref.sync import sync_to_async
 from oauthlib.oauth2 import AccessDeniedError
 from guardian.mixins import PermissionRequiredMixin
 from requests_oauthlib import OAuth2Session
 from guardian.shortcuts import get_objects_for_user, remove_perm
 
-from . import forms, models, util
-from .tasks import discord_dm_notification
+from . import archive, caching, forms, models, util
+from .budgets import query_budget
+from .pagination import EstimatedCountPaginator
+from .notifications import queue_dm
+from .clients import mount_adapter
+from .forwarding import twitch_forwarder
 
 
+@query_budget(4)
 def index(request):
     return render(request, "bank/bank.html", make_context())
 
@@ -40,25 +47,42 @@ def make_context(context=None):
 
 
 def make_oauth_session(token=None, state=None):
-    return OAuth2Session(
+    session = OAuth2Session(
         client_id="741660720244195370",
         token=token,
         state=state,
         scope="identify",
         redirect_uri="https://democracivbank.com/discord/")
+    return mount_adapter(session)
 
 
-@csrf_exempt
-def bot_twitch_callback(request):
-    requests.post(settings.DEMOCRACIV_DISCORD_BOT_API_TWITCH_CALLBACK, headers=dict(request.headers), data=request.body)
-    js = json.loads(request.body)
+async def bot_twitch_callback(request):
+    try:
+        js = json.loads(request.body)
+    except ValueError:
+        return http.HttpResponseBadRequest()
+
+    if isinstance(request, ASGIRequest):
+        accepted = twitch_forwarder.submit(dict(request.headers), request.body)
+    else:
+        # under WSGI, the event loop of this view is closed with the request and nothing would forward a queued event
+        accepted = await sync_to_async(twitch_forwarder.forward)(dict(request.headers), request.body)
 
     if "challenge" in js:
         return http.HttpResponse(js["challenge"])
 
+    if not accepted:
+        # Twitch retries notifications that weren't answered with a 2xx
+        return http.HttpResponse(status=503)
+
     return http.HttpResponse("ok")
 
 
+# csrf_exempt() can't wrap coroutine functions yet, Django would then run the view as a sync view
+bot_twitch_callback.csrf_exempt = True
+
+
+@query_budget(8)
 @login_required()
 def discord_callback(request):
     if request.method != "GET":
@@ -69,13 +93,15 @@ def discord_callback(request):
     try:
         token = discord.fetch_token("https://discord.com/api/oauth2/token",
                                     client_secret="6B9ROswLw4xYDsQv5T4WGHDE67WLXxUx",
-                                    authorization_response=request.build_absolute_uri())
+                                    authorization_response=request.build_absolute_uri(),
+                                    timeout=settings.DEMOCRACIV_DISCORD_BOT_TIMEOUT)
     except AccessDeniedError:
         messages.error(request, "You canceled the process.")
         return redirect("bank:user")
 
     discord = make_oauth_session(token=token)
-    user_object = discord.get("https://discord.com/api/users/@me").json()
+    user_object = discord.get("https://discord.com/api/users/@me",
+                              timeout=settings.DEMOCRACIV_DISCORD_BOT_TIMEOUT).json()
     user_id = int(user_object['id'])
     request.user.discord_id = user_id
     request.user.discord_username = f"{user_object['username']}#{user_object['discriminator']}"
@@ -90,11 +116,12 @@ def discord_callback(request):
                                                  f"user {request.user.username}. If you received this DM, it worked!",
                                      url=f"https://democracivbank.com{reverse('bank:user')}")
         payload = {'targets': [user_id], 'message': '', 'embed': test_embed}
-        discord_dm_notification(payload)
+        queue_dm(payload)
 
     return redirect("bank:user")
 
 
+@query_budget(6)
 @login_required()
 def discord_connect(request):
     if request.method != "GET":
@@ -111,13 +138,15 @@ def discord_connect(request):
                                                "as well as the 'I forgot my password' functionality."}))
 
 
+@query_budget(30)
 class EmployeeInviteView(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         action = kwargs.get("action")
 
         invite = get_object_or_404(
-            models.EmployeeInvitation, pk=kwargs.get("pk"))
+            models.EmployeeInvitation.objects.select_related('potential_employee', 'corporation__owner'),
+            pk=kwargs.get("pk"))
 
         if invite.potential_employee != self.request.user:
             return http.HttpResponseForbidden()
@@ -140,17 +169,36 @@ class EmployeeInviteView(LoginRequiredMixin, View):
         return redirect('bank:user-employment')
 
 
+@query_budget(4)
 class MarketplaceView(View):
     template_name = 'bank/marketplace.html'
 
     def get(self, request: http.HttpRequest, *args, **kwargs):
-        featured = models.FeaturedCorporation.objects.all()
-        corporations = models.Corporation.objects.filter(
-            is_public_viewable=True)
-        return render(request, self.template_name, make_context({'corporations': corporations, 'featured': featured,
+        marketplace = caching.get_marketplace()
+        page = Paginator(marketplace['corporations'], settings.MARKETPLACE_PAGE_SIZE).get_page(request.GET.get('page'))
+
+        # anonymous visitors all get the same page, unless there's a message for them
+        if request.user.is_authenticated or len(messages.get_messages(request)):
+            return self.render(request, marketplace, page)
+
+        key = caching.marketplace_page_key(page.number)
+        content = caching.shared_cache().get(key)
+
+        if content is not None:
+            return http.HttpResponse(content)
+
+        response = self.render(request, marketplace, page)
+        caching.shared_cache().set(key, response.content, timeout=settings.MARKETPLACE_CACHE_TIMEOUT)
+        return response
+
+    def render(self, request, marketplace, page):
+        return render(request, self.template_name, make_context({'corporations': page.object_list,
+                                                                 'featured': marketplace['featured'],
+                                                                 'page_obj': page,
                                                                  'title': 'Marketplace'}))
 
 
+@query_budget(8)
 class UserProfileView(LoginRequiredMixin, View):
     form_class = forms.UserUpdateForm
     template_name = 'bank/user_profile.html'
@@ -170,21 +218,23 @@ class UserProfileView(LoginRequiredMixin, View):
                                                                  'title': 'Me'}))
 
 
+@query_budget(8)
 class UserEmploymentOverviewView(LoginRequiredMixin, View):
     template_name = 'bank/user_employment.html'
 
     def get(self, request: http.HttpRequest, *args, **kwargs):
-        invites = self.request.user.employeeinvitation_set.all()
-        employed_corps = self.request.user.employed_at.all()
+        invites = self.request.user.employeeinvitation_set.select_related('corporation')
+        employed_corps = self.request.user.employed_at.select_related('corporation')
         return render(request, self.template_name,
                       make_context({'invites': invites, 'employed_corps': employed_corps,
                                     'title': 'Employment'}))
 
 
+@query_budget(16)
 class LeaveCorporationView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         employee = get_object_or_404(
-            models.Employee, pk=kwargs.get('employee', 0))
+            models.Employee.objects.select_related('person', 'corporation__owner'), pk=kwargs.get('employee', 0))
 
         if employee.person != self.request.user:
             return http.HttpResponseForbidden()
@@ -196,7 +246,7 @@ class LeaveCorporationView(LoginRequiredMixin, View):
                                     description=f"**{employee.person.username}** just left **{employee.corporation.name}**.",
                                     url=f"https://democracivbank.com{reverse('bank:corporation-employees', kwargs={'pk': employee.corporation.pk})}")
             payload = {'targets': [employee.corporation.owner.discord_id], 'message': '', 'embed': embed}
-            discord_dm_notification(payload)
+            queue_dm(payload)
 
         messages.success(request, f"You left {employee.corporation}.")
         return redirect('bank:user-employment')
@@ -221,6 +271,7 @@ class RegisterView(View):
         return render(request, self.template_name, make_context({'form': form, 'title': 'Sign Up'}))
 
 
+@query_budget(10)
 class AccountListView(LoginRequiredMixin, tables.SingleTableView):
     table_class = models.AccountsTable
     template_name = "bank/account_list.html"
@@ -237,29 +288,43 @@ class AccountListView(LoginRequiredMixin, tables.SingleTableView):
         return context
 
     def get_queryset(self):
-        return get_objects_for_user(self.request.user, 'bank.view_account')
+        return caching.get_accounts_for_user(self.request.user, 'created_on')
 
 
+@query_budget(20)
 class AccountDetailView(LoginRequiredMixin, PermissionRequiredMixin, ExportMixin, tables.SingleTableView):
     table_class = models.TransactionTable
     context_object_name = 'transactions'
     template_name = "bank/account_detail.html"
     permission_required = 'bank.view_account'
     return_404 = True
-    paginator_class = LazyPaginator
+    paginator_class = EstimatedCountPaginator
     export_formats = ("csv", "json", "xlsx")
 
     def get_table_kwargs(self):
-        return {'order_by': '-created_on'}
+        # history that reaches into the archive can only be read by date
+        return {'order_by': '-created_on', 'orderable': not self.history.months}
 
     def get_permission_object(self):
         self.object = get_object_or_404(models.Account, pk=self.kwargs['pk'])
         return self.object
 
     def get_queryset(self):
-        self.transactions = models.Transaction.objects.filter(from_account__iban=self.kwargs['pk']) | \
-                            models.Transaction.objects.filter(
-                                to_account__iban=self.kwargs['pk'])
+        transactions = models.Transaction.objects.all()
+
+        # an account has no transactions from before it was opened, the bound lets PostgreSQL skip older partitions
+        if self.object.history_start:
+            transactions = transactions.filter(created_on__gte=self.object.history_start)
+
+        self.transactions = (transactions.filter(from_account__iban=self.kwargs['pk']) |
+                             transactions.filter(to_account__iban=self.kwargs['pk'])) \
+            .select_related('from_account', 'to_account')
+        self.history = archive.AccountHistory(self.transactions, self.object)
+
+        # history that reaches back before the archive's cutoff is read through from the archive files, page by page
+        if self.history.months:
+            return models.AccountHistoryData(self.history)
+
         return self.transactions
 
     def get_context_data(self, **kwargs):
@@ -275,6 +340,7 @@ class AccountDetailView(LoginRequiredMixin, PermissionRequiredMixin, ExportMixin
         return context
 
 
+@query_budget(12)
 class AccountUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.UpdateView):
     permission_required = 'bank.view_account'
     return_404 = True
@@ -293,6 +359,7 @@ class AccountUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.Upd
         return make_context(context)
 
 
+@query_budget(20)
 class AccountDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic.DeleteView):
     permission_required = 'bank.delete_account'
     return_404 = True
@@ -322,36 +389,57 @@ class AccountDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic.Del
         return self.object
 
 
+@query_budget(12)
 class TransactionDetailView(LoginRequiredMixin, PermissionRequiredMixin, generic.DetailView):
     model = models.Transaction
+    queryset = models.Transaction.objects.select_related('from_account', 'to_account', 'authorized_by')
     return_404 = True
 
+    def get_object(self, queryset=None):
+        # called by both the permission check and get()
+        if not hasattr(self, 'object'):
+            self.object = super().get_object(queryset)
+
+        return self.object
+
     def check_permissions(self, request):
         transaction = self.get_object()
+        self.bucket = caching.transaction_viewer_bucket(request.user, transaction)
 
-        if request.user.has_perm('bank.view_account', transaction.to_account) or request.user.has_perm(
-                'bank.view_account', transaction.from_account):
+        if self.bucket:
             return None
 
         response = render(request, "404.html")
         response.status_code = 404
         return response
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context = make_context(context)
-        context['title'] = "Transaction"
+    def get(self, request, *args, **kwargs):
         transaction = self.get_object()
+        # the page also shows who's logged in, so the ETag is per user while the cached fragment is per bucket
+        etag = caching.transaction_etag(transaction, self.bucket, request.user.pk)
+        last_modified = int(transaction.updated_on.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
 
-        if self.request.user.has_perm('bank.view_account', transaction.to_account):
-            context['to'] = True
+        if response is None:
+            response = super().get(request, *args, **kwargs)
 
-        if self.request.user.has_perm('bank.view_account', transaction.from_account):
-            context['from'] = True
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context = make_context(context)
+        context['title'] = "Transaction"
+        context['to'] = self.bucket in (caching.VIEWER_TO, caching.VIEWER_BOTH)
+        context['from'] = self.bucket in (caching.VIEWER_FROM, caching.VIEWER_BOTH)
+        context['cache_key'] = caching.transaction_cache_key(self.object, self.bucket)
+        context['cache_timeout'] = settings.TRANSACTION_CACHE_TIMEOUT
         return context
 
 
+@query_budget(10)
 class TransactionCreateView(LoginRequiredMixin, View):
 
     def get(self, request: http.HttpRequest, *args, **kwargs):
@@ -369,6 +457,7 @@ class TransactionCreateView(LoginRequiredMixin, View):
         return render(request, 'bank/transaction_form.html', make_context({'form': form, 'title': 'Send Money'}))
 
 
+@query_budget(30)
 class TransactionConfirmView(LoginRequiredMixin, View):
 
     def get(self, request: http.HttpRequest, *args, **kwargs):
@@ -412,10 +501,12 @@ class TransactionConfirmView(LoginRequiredMixin, View):
             return redirect('bank:account-transaction-detail', form.instance.id)
 
 
+@query_budget(4)
 def account_creation_chooser(request):
     return render(request, "bank/account_create.html", make_context({'title': 'Open Bank Account'}))
 
 
+@query_budget(30)
 class PersonalAccountCreateView(LoginRequiredMixin, generic.CreateView):
     model = models.Account
     form_class = forms.PersonalAccountCreationForm
@@ -439,6 +530,7 @@ class PersonalAccountCreateView(LoginRequiredMixin, generic.CreateView):
         return kwargs
 
 
+@query_budget(30)
 class CorporateAccountCreateView(LoginRequiredMixin, generic.CreateView):
     model = models.Account
     form_class = forms.CorporateAccountCreationForm
@@ -461,6 +553,7 @@ class CorporateAccountCreateView(LoginRequiredMixin, generic.CreateView):
         return kwargs
 
 
+@query_budget(40)
 class CorporationCreateView(LoginRequiredMixin, generic.CreateView):
     model = models.Corporation
     form_class = forms.CorporationCreateForm
@@ -477,6 +570,7 @@ class CorporationCreateView(LoginRequiredMixin, generic.CreateView):
         return super().form_valid(form)
 
 
+@query_budget(40)
 class CorporationDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic.DeleteView):
     model = models.Corporation
     permission_required = 'bank.delete_corporation'
@@ -496,6 +590,7 @@ class CorporationDeleteView(LoginRequiredMixin, PermissionRequiredMixin, generic
         return self.object
 
 
+@query_budget(10)
 class CorporationListView(LoginRequiredMixin, tables.SingleTableView):
     model = models.Corporation
     table_class = models.CorporationTable
@@ -510,9 +605,10 @@ class CorporationListView(LoginRequiredMixin, tables.SingleTableView):
         return make_context(context)
 
     def get_queryset(self):
-        return get_objects_for_user(user=self.request.user, perms='bank.view_corporation')
+        return get_objects_for_user(user=self.request.user, perms='bank.view_corporation').select_related('owner')
 
 
+@query_budget(20)
 class ManageEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
     permission_required = 'bank.view_corporation'
     return_403 = True
@@ -522,8 +618,8 @@ class ManageEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         corp = get_object_or_404(models.Corporation, pk=kwargs.get('pk'))
         form = self.form_class(corporation=corp)
-        invites = corp.employeeinvitation_set.all()
-        employees = corp.employee_set.all()
+        invites = corp.employeeinvitation_set.select_related('potential_employee')
+        employees = corp.employee_set.select_related('person')
         can_manage = request.user.has_perm("bank.manage_employees", corp)
 
         return render(request, self.template_name,
@@ -532,8 +628,8 @@ class ManageEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
 
     def post(self, request: http.HttpRequest, *args, **kwargs):
         corp = get_object_or_404(models.Corporation, pk=kwargs.get('pk'))
-        invites = corp.employeeinvitation_set.all()
-        employees = corp.employee_set.all()
+        invites = corp.employeeinvitation_set.select_related('potential_employee')
+        employees = corp.employee_set.select_related('person')
         form = self.form_class(request.POST, corporation=corp)
         can_manage = request.user.has_perm("bank.manage_employees", corp)
 
@@ -551,13 +647,14 @@ class ManageEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
         return get_object_or_404(models.Corporation, pk=self.kwargs['pk'])
 
 
+@query_budget(20)
 class FireEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
     permission_required = 'bank.manage_employees'
     return_403 = True
 
     def get(self, request, *args, **kwargs):
         employee = get_object_or_404(
-            models.Employee, pk=kwargs.get('employee', 0))
+            models.Employee.objects.select_related('person', 'corporation__owner'), pk=kwargs.get('employee', 0))
         employee.delete()
 
         if employee.person.discord_id and employee.person.discord_dms_enabled:
@@ -566,7 +663,7 @@ class FireEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
                                                 f"and you are no longer an employee of **{employee.corporation.name}**.",
                                     url=f"https://democracivbank.com{reverse('bank:user')}")
             payload = {'targets': [employee.person.discord_id], 'message': '', 'embed': embed}
-            discord_dm_notification(payload)
+            queue_dm(payload)
 
         messages.success(request, f"{employee.person.username} was fired.")
         return redirect('bank:corporation-employees', kwargs.get('pk'))
@@ -575,6 +672,7 @@ class FireEmployeeView(LoginRequiredMixin, PermissionRequiredMixin, View):
         return get_object_or_404(models.Corporation, pk=self.kwargs.get('pk', ''))
 
 
+@query_budget(40)
 class TransferOwnershipView(LoginRequiredMixin, PermissionRequiredMixin, View):
     permission_required = 'bank.manage_employees'
     return_403 = True
@@ -611,7 +709,7 @@ class TransferOwnershipView(LoginRequiredMixin, PermissionRequiredMixin, View):
                                             f"**{corp.name}**. The previous owner was {self.request.user.username}.",
                                 url=f"https://democracivbank.com{reverse('bank:corporation-employees', kwargs={'pk': kwargs.get('pk')})}")
         payload = {'targets': corp.get_discord_ids(), 'message': '', 'embed': embed}
-        discord_dm_notification(payload)
+        queue_dm(payload)
 
         messages.success(request, f"{employee.person.username} is the new owner.")
         return redirect('bank:corporation-employees', kwargs.get('pk'))
@@ -620,6 +718,7 @@ class TransferOwnershipView(LoginRequiredMixin, PermissionRequiredMixin, View):
         return get_object_or_404(models.Corporation, pk=self.kwargs.get('pk', ''))
 
 
+@query_budget(16)
 class CorporateUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.UpdateView):
     permission_required = 'bank.change_corporation'
     return_403 = True
@@ -639,6 +738,7 @@ class CorporateUpdateView(LoginRequiredMixin, PermissionRequiredMixin, generic.U
         return make_context(context)
 
 
+@query_budget(12)
 class CorporationDetailView(UserPassesTestMixin, generic.DetailView):
     model = models.Corporation
     context_object_name = 'corporation'
@@ -695,6 +795,7 @@ class CorporationDetailView(UserPassesTestMixin, generic.DetailView):
         return context
 
 
+@query_budget(2)
 def bot_resubmit_view(request, discord_id):
     return render(request, "bank/discord_id_view.html", make_context({"discord_id": discord_id}))
 
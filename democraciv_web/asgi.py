@@ -3,6 +3,9 @@ ASGI config for democraciv_web project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async views (the Twitch callback and the bot endpoints under /api/v1/async/)
+only run natively on an event loop when they are served by this application.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
@@ -15,10 +15,64 @@ DEMOCRACIV_DISCORD_BOT_API_TWITCH_CALLBACK = DEMOCRACIV_DISCORD_BOT_API_ADDRESS
 
 DEMOCRACIV_DISCORD_BOT_ADDRESS = "http://localhost:8080"
 DEMOCRACIV_DISCORD_BOT_DM_ENDPOINT = DEMOCRACIV_DISCORD_BOT_ADDRESS + "/dm"
+DEMOCRACIV_DISCORD_BOT_DM_BATCH_ENDPOINT = DEMOCRACIV_DISCORD_BOT_ADDRESS + "/dm/batch"
+
+# HTTP client for calls to the bot, see bank/clients.py
+DEMOCRACIV_DISCORD_BOT_TIMEOUT = (3.05, 10)  # (connect, read) in seconds
+DEMOCRACIV_DISCORD_BOT_RETRIES = 3
+DEMOCRACIV_DISCORD_BOT_BACKOFF = 0.5
+DEMOCRACIV_DISCORD_BOT_BACKOFF_MAX = 8
+DEMOCRACIV_DISCORD_BOT_POOL_SIZE = 10
+DEMOCRACIV_DISCORD_BOT_BREAKER_THRESHOLD = 5
+DEMOCRACIV_DISCORD_BOT_BREAKER_RESET_TIMEOUT = 30
+
+# Webhooks like the Twitch callback are forwarded to the bot from an in-process queue under ASGI, see bank/forwarding.py
+DEMOCRACIV_DISCORD_BOT_WEBHOOK_QUEUE_SIZE = 1000
+DEMOCRACIV_DISCORD_BOT_WEBHOOK_WORKERS = 4
+
+# Notification outbox, see bank/notifications.py and `manage.py deliver_notifications`
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_CLAIM_TIMEOUT = 300
+
+# Rendered transactions are cached until they or their accounts change, see bank/caching.py
+TRANSACTION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Per-user account lists are invalidated by signals, so every app process has to see the same cache. Point this
+# at a shared cache like memcached in CACHES when running more than one process.
+SHARED_CACHE_ALIAS = 'default'
+ACCOUNT_LIST_CACHE_TIMEOUT = 60 * 60
+MARKETPLACE_CACHE_TIMEOUT = 60 * 60
+MARKETPLACE_PAGE_SIZE = 20
+
+# Querysets with more rows than this are paginated with an estimated count, smaller ones are counted exactly and
+# the count is cached, see bank/pagination.py
+ESTIMATED_COUNT_THRESHOLD = 100000
+COUNT_CACHE_TIMEOUT = 60
+
+# Most results returned by the search API, see bank/search.py
+SEARCH_RESULT_LIMIT = 10
+
+# Monthly partitions of the transaction table on PostgreSQL, see bank/partitions.py
+TRANSACTION_PARTITION_MONTHS_AHEAD = 3
+
+# Background tasks, see bank/taskrunner.py and `manage.py run_tasks`
+TASK_RUNNER_THREADS = 4
+TASK_RUNNER_PROCESSES = 0
+TASK_RUNNER_POLL_INTERVAL = 1.0
+TASK_RUNNER_LOCK_TIMEOUT = 600  # runners renew the claims of their running tasks every quarter of this
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Transactions moved out of the database by `manage.py archive_transactions`, see bank/archive.py
+TRANSACTION_ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archive')
+TRANSACTION_ARCHIVE_BATCH_SIZE = 1000
+
+# Profiles of the requests staff asked to profile with the X-Profile header or ?profile, see bank/profiling.py
+PROFILE_ROOT = os.path.join(BASE_DIR, 'profiles')
+PROFILE_KEEP = 100
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.0/howto/deployment/checklist/
 
@@ -38,6 +92,11 @@ if not DEBUG:
 
 ALLOWED_HOSTS = ['localhost']
 
+# Requests that make more queries than the budget of their view, or repeat a query with different parameters
+# QUERY_REPEAT_THRESHOLD times, are logged ("warn") or fail ("raise"), see bank/budgets.py
+QUERY_BUDGET_MODE = 'warn' if DEBUG else 'off'
+QUERY_REPEAT_THRESHOLD = 3
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -48,11 +107,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'crispy_forms',
     'django_tables2',
     'rest_framework',
     'rest_framework.authtoken',
-    'background_task',
     'guardian',
     'djmoney'
 ]
@@ -64,11 +123,14 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
 
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'bank.pagination.EstimatedCountPagination',
     'PAGE_SIZE': 10
 }
 
 MIDDLEWARE = [
+    'bank.middleware.MetricsMiddleware',
+    'bank.middleware.ReplicaMiddleware',
+    'bank.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +138,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bank.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'democraciv_web.urls'
@@ -115,6 +178,17 @@ if not DEBUG:
             'PASSWORD': 'DB_PASSWORD',
             'HOST': 'localhost',
             'PORT': '',
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': 'DB_NAME',
+            'USER': 'DB_USER',
+            'PASSWORD': 'DB_PASSWORD',
+            'HOST': 'DB_REPLICA_HOST',
+            'PORT': '',
+            'TEST': {
+                'MIRROR': 'default',
+            },
         }
     }
 
@@ -123,9 +197,33 @@ elif DEBUG:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        },
+        # stands in for a replica, it's the same database file
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'TEST': {
+                'MIRROR': 'default',
+            },
         }
     }
 
+# Reads of read-only requests go to one of these, see bank/routers.py and bank/middleware.py. Clients that
+# wrote something read from the primary for the next REPLICA_PIN_SECONDS.
+DATABASE_ROUTERS = ['bank.routers.ReplicaRouter']
+DATABASE_REPLICAS = ['replica']
+REPLICA_PIN_SECONDS = 10
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'democraciv',
+    }
+}
+
 AUTH_USER_MODEL = 'bank.User'
 
 # Password validation
@@ -16,5 +16,6 @@ urlpatterns = [
     path('reset-password/done', auth_views.PasswordResetCompleteView.as_view(template_name="bank/password_reset_done.html", extra_context=bank_views.make_context()), name="password_reset_complete"),
     path('admin/', admin.site.urls),
     path('twitch/callback', bank_views.bot_twitch_callback),
+    path('api/v1/async/', include('bank.api.v1.async_urls')),
     path('api/v1/', include('bank.api.v1.urls')),
 ]